@@ -15,6 +15,7 @@ from rest_framework.permissions import IsAuthenticated, AllowAny
 from drf_spectacular.utils import extend_schema
 from .models import UserProfile, ActivityLog
 from projects.models import Project, Task
+from projects.services import PortfolioStats
 
 
 def log_activity(user, action, model_name='', object_id=None, description='', request=None):
@@ -535,20 +536,13 @@ def ai_assistant_view(request):
     from django.db.models import Avg
     
     # Get portfolio stats
-    total_projects = Project.objects.count()
-    total_risks = Project.objects.aggregate(
-        total=models.Count('risks', filter=models.Q(risks__status__in=['open', 'mitigating']))
-    )['total'] or 0
-    
-    pending_tasks = Task.objects.filter(status__in=['not_started', 'in_progress']).count()
+    portfolio = PortfolioStats()
+    total_projects = portfolio.projects['total']
+    total_risks = portfolio.risks['active']
+    pending_tasks = portfolio.tasks['pending']
     
     # Calculate average health score
-    projects = Project.objects.all()
-    if projects:
-        health_scores = [p.health_score for p in projects]
-        avg_health_score = sum(health_scores) / len(health_scores) if health_scores else 0
-    else:
-        avg_health_score = 0
+    avg_health_score = Project.objects.with_health().aggregate(avg=Avg('health'))['avg'] or 0
     
     context = {
         'total_projects': total_projects,
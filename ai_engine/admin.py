@@ -1,3 +1,25 @@
 from django.contrib import admin
+from .models import AICallLog, AIInsight, RiskAnalysis
 
-# Register your models here.
+
+@admin.register(AICallLog)
+class AICallLogAdmin(admin.ModelAdmin):
+    list_display = ['method', 'user', 'streamed', 'cached', 'wall_ms', 'ttft_ms', 'input_tokens',
+                    'output_tokens', 'cost', 'error_type', 'created_at']
+    list_filter = ['method', 'streamed', 'cached', 'error_type', 'created_at']
+    readonly_fields = [field.name for field in AICallLog._meta.fields]
+
+
+@admin.register(RiskAnalysis)
+class RiskAnalysisAdmin(admin.ModelAdmin):
+    list_display = ['risk', 'model', 'updated_at']
+    search_fields = ['risk__title', 'risk__project__code']
+    readonly_fields = [field.name for field in RiskAnalysis._meta.fields]
+
+
+@admin.register(AIInsight)
+class AIInsightAdmin(admin.ModelAdmin):
+    list_display = ['kind', 'subject', 'model', 'created_by', 'created_at']
+    list_filter = ['kind', 'created_at']
+    search_fields = ['subject']
+    readonly_fields = [field.name for field in AIInsight._meta.fields]
@@ -4,3 +4,9 @@ from django.apps import AppConfig
 class AiEngineConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'ai_engine'
+
+    def ready(self):
+        # Validate the API key and build the shared client once per process
+        from .client import get_client_state
+        get_client_state()
+        from . import signals  # noqa: F401
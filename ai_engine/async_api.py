@@ -0,0 +1,41 @@
+"""
+APIView with coroutine handlers, for the AI endpoints under ASGI.
+
+DRF 3.14 has no async views. AsyncAPIView keeps DRF's request parsing,
+authentication, permissions, throttling, exception handling and rendering:
+the checks that may query the database run in a worker thread, then the
+handler is awaited on the event loop, so a request waiting on the AI API
+does not hold a thread or a worker.
+"""
+from asgiref.sync import sync_to_async
+from rest_framework.views import APIView
+
+
+class AsyncAPIView(APIView):
+    """APIView whose get/post/... handlers are `async def`"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        self.args = args
+        self.kwargs = kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+
+        try:
+            await sync_to_async(self.initial)(request, *args, **kwargs)
+
+            if request.method.lower() in self.http_method_names:
+                handler = getattr(self, request.method.lower(), self.http_method_not_allowed)
+            else:
+                handler = self.http_method_not_allowed
+
+            response = await handler(request, *args, **kwargs)
+
+        except Exception as exc:
+            response = self.handle_exception(exc)
+
+        self.response = self.finalize_response(request, response, *args, **kwargs)
+        return self.response
+
+    async def options(self, request, *args, **kwargs):
+        return await sync_to_async(super().options)(request, *args, **kwargs)
@@ -0,0 +1,99 @@
+"""
+Batch risk analysis.
+
+analyze_risks() runs PMOAIEngine.analyze_risk over a set of risks with a
+bounded thread pool and stores each result as a RiskAnalysis row as soon as
+it completes. The calls go through the governor as BATCH_USER, so the batch
+holds at most AI_BATCH_MAX_CONCURRENT slots, shares the rate limits with
+interactive requests and waits (instead of failing) when they are reached.
+
+A stored analysis stays current while PMOAIEngine.risk_fingerprint() of the
+risk is unchanged. Current analyses are skipped, so a run that was
+interrupted resumes where it stopped, and the risk analysis endpoint serves
+them without calling the API.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Any, Callable, Dict, Iterable, Optional
+from django.conf import settings
+from django.db import connections
+from projects.models import Risk
+from .governor import BATCH_USER
+from .models import RiskAnalysis
+from .service import PMOAIEngine
+from .views import risk_analysis_data
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SEVERITIES = ('high', 'critical')
+DEFAULT_STATUSES = ('open', 'mitigating')
+
+# Attempts of a call the governor turned away because the rate limits were reached
+BUSY_ATTEMPTS = 10
+
+
+def select_risks(severities: Iterable[str] = DEFAULT_SEVERITIES, statuses: Iterable[str] = DEFAULT_STATUSES,
+                 project: Optional[str] = None):
+    """Risks to analyze; project is a project code or id"""
+    risks = Risk.objects.filter(severity__in=list(severities), status__in=list(statuses))
+    if project:
+        risks = risks.filter(project__pk=project) if str(project).isdigit() else risks.filter(project__code=project)
+    return risks.select_related('project').order_by('pk')
+
+
+def _analyze(engine, risk_data, refresh):
+    try:
+        for _ in range(BUSY_ATTEMPTS - 1):
+            result = engine.analyze_risk(risk_data, refresh=refresh)
+            if result.get('error_type') != 'GovernorBusy':
+                return result
+            time.sleep(getattr(settings, 'AI_GOVERNOR_MAX_WAIT', 30))
+        return engine.analyze_risk(risk_data, refresh=refresh)
+    finally:
+        # Threads of the pool open their own connections (response cache, call log)
+        connections.close_all()
+
+
+def analyze_risks(risks, workers: Optional[int] = None, force: bool = False, user=None,
+                  progress: Optional[Callable[[int, int, Risk], None]] = None) -> Dict[str, Any]:
+    """
+    Analyze and store every risk of the queryset whose stored analysis is
+    missing or out of date (all of them with force). progress(done, total, risk)
+    is called in the calling thread after each risk. Returns the run's counts.
+    """
+    engine = PMOAIEngine(user=user, governor_user=BATCH_USER)
+    if engine.demo_mode:
+        raise RuntimeError('AI features are currently unavailable. Please configure the API key.')
+
+    risks = list(risks)
+    stored = dict(RiskAnalysis.objects.filter(risk__in=risks).values_list('risk_id', 'fingerprint'))
+    pending = []
+    for risk in risks:
+        risk_data = risk_analysis_data(risk)
+        fingerprint = engine.risk_fingerprint(risk_data)
+        if force or stored.get(risk.pk) != fingerprint:
+            pending.append((risk, risk_data, fingerprint))
+
+    summary = {'selected': len(risks), 'current': len(risks) - len(pending), 'analyzed': 0, 'failed': 0, 'errors': {}}
+    workers = workers or getattr(settings, 'AI_BATCH_MAX_CONCURRENT', 4)
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        futures = {pool.submit(_analyze, engine, risk_data, force): (risk, fingerprint)
+                   for risk, risk_data, fingerprint in pending}
+        for done, future in enumerate(as_completed(futures), start=1):
+            risk, fingerprint = futures[future]
+            try:
+                result = future.result()
+            except Exception as e:
+                result = {'error': True, 'error_type': type(e).__name__, 'error_message': str(e)}
+            if result.get('success'):
+                RiskAnalysis.store(risk.pk, fingerprint, engine.model, result)
+                summary['analyzed'] += 1
+            else:
+                logger.error(f"Risk {risk.pk} analysis failed: {result.get('error_message')}")
+                summary['failed'] += 1
+                error_type = result.get('error_type') or 'Error'
+                summary['errors'][error_type] = summary['errors'].get(error_type, 0) + 1
+            if progress:
+                progress(done, len(pending), risk)
+    return summary
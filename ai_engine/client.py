@@ -0,0 +1,257 @@
+"""
+Process-wide Anthropic clients.
+
+Building an Anthropic client creates a new HTTP connection pool, so a client
+per request pays the TCP and TLS handshake on every AI call. The client here
+is created once per process (each gunicorn worker keeps its own pool of
+keep-alive connections) and shared by every PMOAIEngine; the underlying
+httpx client is thread-safe.
+
+The API key is validated once, when the app is ready, and the client is
+rebuilt only when the AI settings change or the process forks. The async
+views use AsyncAnthropic clients, whose connections belong to an event loop:
+there is one per running loop, so under uvicorn each worker shares one pool. Requests can
+be routed through AI_HTTP_TRANSPORT instead of the network, e.g. the
+FakeTransport below for tests and offline development.
+"""
+import asyncio
+import json
+import logging
+import os
+import threading
+import weakref
+from typing import Any, NamedTuple, Optional
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+try:
+    # anthropic >= 1.0 is built on httpx2, earlier releases on httpx
+    import httpx2 as httpx
+except ImportError:
+    import httpx
+
+logger = logging.getLogger(__name__)
+
+_lock = threading.Lock()
+# (pid, ClientState) of the process that built the client
+_current = None
+# Event loop -> AsyncAnthropic
+_async_clients = weakref.WeakKeyDictionary()
+
+
+class ClientState(NamedTuple):
+    api_key: Optional[str]
+    demo_mode: bool
+    client: Any
+
+
+def check_api_key(api_key):
+    """(api_key, demo_mode) for the configured key, stripping accidental quotes"""
+    if not api_key:
+        logger.warning("ANTHROPIC_API_KEY not configured")
+        return api_key, True
+
+    if api_key == 'demo-mode':
+        logger.info("AI Engine running in demo mode")
+        return api_key, True
+
+    # Check for quotes around the key (common error)
+    if api_key.startswith("'") or api_key.startswith('"'):
+        logger.error("ANTHROPIC_API_KEY has quotes around it - remove quotes in environment variable")
+        api_key = api_key.strip("'\"")
+
+    if not api_key.startswith('sk-ant-'):
+        logger.error("Invalid ANTHROPIC_API_KEY format (should start with 'sk-ant-')")
+        return api_key, True
+
+    return api_key, False
+
+
+def _http_options():
+    """Connection pool, keep-alive and timeout options for the HTTP client"""
+    options = {
+        'limits': httpx.Limits(
+            max_connections=getattr(settings, 'AI_MAX_CONNECTIONS', 20),
+            max_keepalive_connections=getattr(settings, 'AI_MAX_KEEPALIVE_CONNECTIONS', 10),
+            keepalive_expiry=getattr(settings, 'AI_KEEPALIVE_EXPIRY', 60),
+        ),
+        'timeout': httpx.Timeout(
+            getattr(settings, 'AI_HTTP_TIMEOUT', 90),
+            connect=getattr(settings, 'AI_CONNECT_TIMEOUT', 5),
+        ),
+    }
+    transport = getattr(settings, 'AI_HTTP_TRANSPORT', None)
+    if isinstance(transport, str):
+        transport = import_string(transport)()
+    if transport is not None:
+        options['transport'] = transport
+    return options
+
+
+def _build_client(api_key):
+    from anthropic import Anthropic, DefaultHttpxClient
+
+    options = _http_options()
+    return Anthropic(
+        api_key=api_key,
+        http_client=DefaultHttpxClient(**options),
+        timeout=options['timeout'],
+        max_retries=getattr(settings, 'AI_MAX_RETRIES', 2),
+    )
+
+
+def _build_async_client(api_key):
+    from anthropic import AsyncAnthropic, DefaultAsyncHttpxClient
+
+    options = _http_options()
+    return AsyncAnthropic(
+        api_key=api_key,
+        http_client=DefaultAsyncHttpxClient(**options),
+        timeout=options['timeout'],
+        max_retries=getattr(settings, 'AI_MAX_RETRIES', 2),
+    )
+
+
+def _create_state():
+    api_key, demo_mode = check_api_key(getattr(settings, 'ANTHROPIC_API_KEY', None))
+    client = None
+    if not demo_mode:
+        try:
+            client = _build_client(api_key)
+            logger.info("Anthropic client initialized successfully")
+        except ImportError:
+            logger.error("anthropic package not installed. Run: pip install anthropic")
+            demo_mode = True
+        except Exception as e:
+            logger.error(f"Failed to initialize Anthropic client: {str(e)}")
+            demo_mode = True
+    return ClientState(api_key, demo_mode, client)
+
+
+def get_client_state() -> ClientState:
+    """The validated key and shared client of this process, created on first use"""
+    global _current
+    pid = os.getpid()
+    if _current is None or _current[0] != pid:
+        with _lock:
+            # Also rebuilt after a fork: a worker must not share its parent's sockets
+            if _current is None or _current[0] != pid:
+                _current = (pid, _create_state())
+    return _current[1]
+
+
+def get_async_client():
+    """The AsyncAnthropic client of the running event loop, or None in demo mode"""
+    state = get_client_state()
+    if state.demo_mode:
+        return None
+    loop = asyncio.get_running_loop()
+    client = _async_clients.get(loop)
+    if client is None:
+        client = _async_clients[loop] = _build_async_client(state.api_key)
+    return client
+
+
+def reset_client():
+    """Close the shared client; the next get_client_state() builds a new one"""
+    global _current
+    with _lock:
+        current, _current = _current, None
+        # Async clients can only be closed on their own loop; dropped ones close when collected
+        _async_clients.clear()
+    if current is not None and current[0] == os.getpid() and current[1].client is not None:
+        current[1].client.close()
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    if setting == 'ANTHROPIC_API_KEY' or setting.startswith('AI_'):
+        reset_client()
+
+
+class FakeTransport(httpx.BaseTransport, httpx.AsyncBaseTransport):
+    """
+    Offline stand-in for the Anthropic API. Every Messages request is answered
+    with `text` (or an API error when status_code is not 200), as JSON or as an
+    event stream for stream=True requests, and recorded in `requests`. Prompt
+    caching is imitated: a prefix ending at a cache_control block is written
+    on first use and read afterwards.
+    Enable with AI_HTTP_TRANSPORT = 'ai_engine.client.FakeTransport'.
+    """
+
+    def __init__(self, text='Offline response from the fake AI transport.', status_code=200):
+        self.text = text
+        self.status_code = status_code
+        self.requests = []
+        self.cached_prefixes = set()
+
+    def handle_request(self, request):
+        request.read()
+        return self._respond(request)
+
+    async def handle_async_request(self, request):
+        await request.aread()
+        return self._respond(request)
+
+    def _respond(self, request):
+        self.requests.append(request)
+        body = json.loads(request.content or b'{}')
+        if self.status_code != 200:
+            return httpx.Response(self.status_code, json={
+                'type': 'error',
+                'error': {'type': 'api_error', 'message': 'Fake transport error'},
+            })
+
+        usage = {'output_tokens': len(self.text) // 4, **self._input_usage(body)}
+        message = {
+            'id': f'msg_fake_{len(self.requests)}',
+            'type': 'message',
+            'role': 'assistant',
+            'model': body.get('model', ''),
+            'content': [{'type': 'text', 'text': self.text}],
+            'stop_reason': 'end_turn',
+            'stop_sequence': None,
+            'usage': usage,
+        }
+        if not body.get('stream'):
+            return httpx.Response(200, json=message)
+
+        events = [('message_start', {
+            'message': {**message, 'content': [], 'stop_reason': None, 'usage': {**usage, 'output_tokens': 0}},
+        })]
+        events.append(('content_block_start', {'index': 0, 'content_block': {'type': 'text', 'text': ''}}))
+        for index, word in enumerate(self.text.split(' ')):
+            text = word if index == 0 else f' {word}'
+            events.append(('content_block_delta', {'index': 0, 'delta': {'type': 'text_delta', 'text': text}}))
+        events.append(('content_block_stop', {'index': 0}))
+        events.append(('message_delta', {
+            'delta': {'stop_reason': 'end_turn', 'stop_sequence': None},
+            'usage': {'output_tokens': usage['output_tokens']},
+        }))
+        events.append(('message_stop', {}))
+        content = ''.join(
+            f'event: {name}\ndata: {json.dumps({"type": name, **data})}\n\n' for name, data in events
+        )
+        return httpx.Response(200, headers={'content-type': 'text/event-stream'}, content=content.encode('utf-8'))
+
+    def _input_usage(self, body):
+        """input_tokens plus cache write/read counts, at about 4 characters per token"""
+        blocks = [block for block in body.get('system') or [] if isinstance(block, dict)]
+        for message in body.get('messages', []):
+            content = message.get('content')
+            blocks.extend(content if isinstance(content, list) else [{'text': content or ''}])
+        breakpoint = 0
+        for index, block in enumerate(blocks):
+            if 'cache_control' in block:
+                breakpoint = index + 1
+        prefix = ''.join(block.get('text', '') for block in blocks[:breakpoint])
+        total = sum(len(block.get('text', '')) for block in blocks) // 4
+        usage = {'input_tokens': total, 'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0}
+        if prefix:
+            field = 'cache_read_input_tokens' if prefix in self.cached_prefixes else 'cache_creation_input_tokens'
+            self.cached_prefixes.add(prefix)
+            usage[field] = len(prefix) // 4
+            usage['input_tokens'] = total - usage[field]
+        return usage
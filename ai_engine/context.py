@@ -0,0 +1,182 @@
+"""
+Compact, token-budgeted data context for AI prompts.
+
+Indented JSON spends a large share of input tokens on whitespace, quotes and
+keys repeated for every project or risk. build_context() writes the same data
+as `key: value` lines, and lists of records as one table with a single
+header row:
+
+    PROJECTS DATA:
+    rows: 3 | columns: code|cpi|name|spi|status
+    A-1|0.95|Data Platform|0.91|at_risk
+    ...
+
+Each endpoint has a token budget (DEFAULT_CONTEXT_BUDGETS, overridable with
+the AI_CONTEXT_BUDGETS setting). When the context is over budget, long texts
+are shortened first, then tables keep their first rows and summarize the
+rest (status counts, averages). Rows are kept in the order given, so callers
+pass the most important records first. Token counts are estimated locally
+with estimate_tokens(); no API call is made.
+"""
+import json
+import math
+import re
+from collections import Counter
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from django.conf import settings
+
+DEFAULT_CONTEXT_BUDGETS = {
+    'project_summary': 1500,
+    'portfolio_summary': 1500,
+    'risk_analysis': 1000,
+    'pmo_question': 2000,
+    'compare_projects': 4000,
+    'executive_report': 4000,
+}
+
+# Characters kept from a text value once the context is over budget
+SHORT_TEXT_LENGTH = 160
+# Columns with at most this many distinct, short values are summarized as counts
+SUMMARY_MAX_CATEGORIES = 6
+SUMMARY_MAX_VALUE_LENGTH = 40
+
+_TOKEN_RE = re.compile(r' ?[A-Za-z]+| ?\d{1,3}|\s+|[^\sA-Za-z\d]')
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    Approximate token count of text: words count one token per 4 letters,
+    numbers one per 3 digits, and each whitespace run or symbol one token
+    """
+    tokens = 0
+    for piece in _TOKEN_RE.findall(text):
+        word = piece.strip()
+        tokens += math.ceil(len(word) / 4) if word.isalpha() else 1
+    return tokens
+
+
+def context_budget(endpoint: str) -> int:
+    """Token budget for the data context of an endpoint's prompt"""
+    budgets = {**DEFAULT_CONTEXT_BUDGETS, **getattr(settings, 'AI_CONTEXT_BUDGETS', {})}
+    return budgets[endpoint]
+
+
+def _scalar(value, text_limit: Optional[int] = None) -> str:
+    if value is None:
+        return '-'
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, Decimal):
+        value = float(value)
+    if isinstance(value, float):
+        return f'{value:.2f}'.rstrip('0').rstrip('.')
+    if isinstance(value, (date, datetime)):
+        return value.isoformat()
+    if isinstance(value, (dict, list)):
+        return json.dumps(value, separators=(',', ':'), sort_keys=True, default=str)
+    text = ' '.join(str(value).split())
+    if text_limit and len(text) > text_limit:
+        text = text[:text_limit].rstrip() + '…'
+    return text
+
+
+def _is_table(value) -> bool:
+    return isinstance(value, list) and bool(value) and all(isinstance(item, dict) for item in value)
+
+
+def _summarize(rows: List[Dict[str, Any]], columns: List[str]) -> str:
+    """One line describing omitted rows: counts for categorical columns, averages for numeric ones"""
+    parts = []
+    for column in columns:
+        values = [row.get(column) for row in rows if row.get(column) is not None]
+        if not values:
+            continue
+        if all(isinstance(value, (int, float, Decimal)) and not isinstance(value, bool) for value in values):
+            parts.append(f'avg {column} {_scalar(sum(float(value) for value in values) / len(values))}')
+            continue
+        counts = Counter(_scalar(value) for value in values)
+        if len(counts) <= SUMMARY_MAX_CATEGORIES and all(len(value) <= SUMMARY_MAX_VALUE_LENGTH for value in counts):
+            parts.append(f'{column} ' + ', '.join(f'{value} {count}' for value, count in sorted(counts.items())))
+    summary = f'+{len(rows)} more rows not shown'
+    return f'{summary}; ' + '; '.join(parts) if parts else summary
+
+
+def _table_lines(rows: List[Dict[str, Any]], row_cap: Optional[int], text_limit: Optional[int]) -> List[str]:
+    columns = sorted({key for row in rows for key in row})
+    shown = rows if row_cap is None else rows[:row_cap]
+    lines = [f'rows: {len(rows)} | columns: ' + '|'.join(columns)]
+    for row in shown:
+        lines.append('|'.join(_scalar(row.get(column), text_limit).replace('|', '/') for column in columns))
+    if len(shown) < len(rows):
+        lines.append(_summarize(rows[len(shown):], columns))
+    return lines
+
+
+def _lines(value, row_cap: Optional[int], text_limit: Optional[int]) -> List[str]:
+    if _is_table(value):
+        return _table_lines(value, row_cap, text_limit)
+    if isinstance(value, dict):
+        lines = []
+        for key in sorted(value):
+            item = value[key]
+            if isinstance(item, dict) or _is_table(item):
+                lines.append(f'{key}:')
+                lines.extend(f'  {line}' for line in _lines(item, row_cap, text_limit))
+            elif isinstance(item, list):
+                lines.append(f'{key}: ' + ', '.join(_scalar(element, text_limit) for element in item))
+            else:
+                lines.append(f'{key}: {_scalar(item, text_limit)}')
+        return lines
+    if isinstance(value, list):
+        return [', '.join(_scalar(element, text_limit) for element in value)]
+    return [_scalar(value, text_limit)]
+
+
+def encode_compact(data, row_cap: Optional[int] = None, text_limit: Optional[int] = None) -> str:
+    """Compact text for data; keys are sorted so equal payloads always render the same"""
+    return '\n'.join(_lines(data, row_cap, text_limit))
+
+
+def _longest_table(value) -> int:
+    if _is_table(value):
+        return len(value)
+    if isinstance(value, dict):
+        return max((_longest_table(item) for item in value.values()), default=0)
+    return 0
+
+
+def _render(sections: Iterable[Tuple[str, Any]], row_cap=None, text_limit=None) -> str:
+    return '\n\n'.join(f'{label}:\n{encode_compact(data, row_cap, text_limit)}' for label, data in sections)
+
+
+def build_context(sections: List[Tuple[str, Any]], budget: int) -> str:
+    """
+    Render [(label, data)] sections in the compact encoding, trimmed to about
+    `budget` estimated tokens
+    """
+    text = _render(sections)
+    if estimate_tokens(text) <= budget:
+        return text
+
+    text = _render(sections, text_limit=SHORT_TEXT_LENGTH)
+    if estimate_tokens(text) <= budget:
+        return text
+
+    # Largest per-table row cap that fits; fewer rows never cost more tokens
+    low, high = 1, max((_longest_table(data) for _, data in sections), default=0)
+    while low < high:
+        middle = (low + high + 1) // 2
+        if estimate_tokens(_render(sections, middle, SHORT_TEXT_LENGTH)) <= budget:
+            low = middle
+        else:
+            high = middle - 1
+    text = _render(sections, low, SHORT_TEXT_LENGTH)
+    if estimate_tokens(text) <= budget:
+        return text
+
+    # Still over budget with one row per table: cut the text itself
+    while estimate_tokens(text) > budget and len(text) > 1:
+        text = text[:len(text) * budget // estimate_tokens(text)]
+    return text.rstrip() + '\n[context truncated]'
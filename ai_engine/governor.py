@@ -0,0 +1,333 @@
+"""
+Outbound AI concurrency governor.
+
+Every API call of a process goes through one Governor, which combines:
+
+- a semaphore of AI_MAX_CONCURRENT_REQUESTS slots. Waiting callers are
+  queued per user; a free slot goes to the user with the fewest calls
+  running, then to the one served longest ago, and one user holds at most
+  AI_MAX_CONCURRENT_PER_USER slots, so a single user cannot take all the
+  capacity. Background batches (see ai_engine.batch) queue as one user
+  with their own limit, AI_BATCH_MAX_CONCURRENT;
+- token buckets for AI_REQUESTS_PER_MINUTE and AI_TOKENS_PER_MINUTE
+  (estimated input tokens), so bursts are spread out instead of hitting the
+  API's rate limits;
+- singleflight: identical requests in flight at the same time share one
+  upstream call (see join() and leave()). A caller waits at most
+  flight_timeout for the shared result; past it the leader is presumed lost
+  and the caller makes the call itself.
+
+It serves both worker threads (slot()) and the event loop of the async views
+(aslot()). A caller that would wait longer than AI_GOVERNOR_MAX_WAIT seconds
+gets GovernorBusy instead.
+"""
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager, contextmanager
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+
+# Governor user of background batches
+BATCH_USER = 'batch'
+
+_lock = threading.Lock()
+# (pid, Governor) of the process that built the governor
+_current = None
+
+
+class GovernorBusy(Exception):
+    """The call could not start within AI_GOVERNOR_MAX_WAIT seconds"""
+
+
+class TokenBucket:
+    """Refills `per_minute` units per minute, holding at most a minute's worth"""
+
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = float(per_minute)
+        self.updated = time.monotonic()
+
+    def wait_time(self, amount):
+        """Seconds until `amount` units are available"""
+        now = time.monotonic()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+        # Larger requests than a minute's worth wait for a full bucket
+        missing = min(amount, self.capacity) - self.level
+        return max(0.0, missing / self.rate)
+
+    def take(self, amount):
+        # The level may go negative: later callers then wait for this reservation too
+        self.level -= min(amount, self.capacity)
+
+
+class Flight:
+    """The result of one upstream call, shared by every caller of the same request"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self._waiters = []
+        self._lock = threading.Lock()
+
+    def finish(self, result):
+        with self._lock:
+            self.result = result
+            self.done.set()
+            waiters, self._waiters = self._waiters, []
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future, result)
+
+    def wait(self, timeout=None):
+        """The shared result, or None if it is not published within `timeout` seconds"""
+        if not self.done.wait(timeout):
+            return None
+        return self.result
+
+    async def await_result(self, timeout=None):
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        with self._lock:
+            if self.done.is_set():
+                return self.result
+            self._waiters.append((loop, future))
+        try:
+            return await asyncio.wait_for(future, timeout)
+        except asyncio.TimeoutError:
+            with self._lock:
+                if (loop, future) in self._waiters:
+                    self._waiters.remove((loop, future))
+            return None
+
+
+class _Waiter:
+    def __init__(self, user, loop=None):
+        self.user = user
+        self.granted = False
+        self.loop = loop
+        self.event = None if loop else threading.Event()
+        self.future = loop.create_future() if loop else None
+
+    def grant(self):
+        self.granted = True
+        if self.loop:
+            self.loop.call_soon_threadsafe(_resolve, self.future, True)
+        else:
+            self.event.set()
+
+
+def _resolve(future, result):
+    if not future.done():
+        future.set_result(result)
+
+
+class Governor:
+    def __init__(self, max_concurrent=8, max_per_user=2, requests_per_minute=25,
+                 tokens_per_minute=20000, max_wait=30, user_limits=None, flight_timeout=300):
+        self.max_concurrent = max_concurrent
+        self.max_per_user = max_per_user
+        # user -> slots they may hold instead of max_per_user
+        self.user_limits = user_limits or {}
+        self.max_wait = max_wait
+        # Seconds a caller waits for the leader of its flight
+        self.flight_timeout = flight_timeout
+        self.requests = TokenBucket(requests_per_minute)
+        self.tokens = TokenBucket(tokens_per_minute)
+        self.active = 0
+        self.active_by_user = {}
+        # user -> deque of waiters
+        self.queues = {}
+        # user -> number of the last slot granted to them
+        self.last_served = {}
+        self.grants = 0
+        self.flights = {}
+        self._lock = threading.Lock()
+
+    # Slots
+
+    def _dispatch(self):
+        """Grant free slots to queued callers, one user at a time (called with the lock held)"""
+        while self.active < self.max_concurrent:
+            eligible = [user for user in self.queues if self.active_by_user.get(user, 0) < self.limit(user)]
+            if not eligible:
+                return
+            # Fewest calls running first, then the user served longest ago
+            user = min(eligible, key=lambda user: (self.active_by_user.get(user, 0), self.last_served.get(user, 0)))
+            queue = self.queues[user]
+            waiter = queue.popleft()
+            if not queue:
+                del self.queues[user]
+            self.grants += 1
+            self.last_served[user] = self.grants
+            self.active += 1
+            self.active_by_user[user] = self.active_by_user.get(user, 0) + 1
+            waiter.grant()
+
+    def limit(self, user):
+        return self.user_limits.get(user, self.max_per_user)
+
+    def _enqueue(self, waiter):
+        with self._lock:
+            self.queues.setdefault(waiter.user, deque()).append(waiter)
+            self._dispatch()
+
+    def _abandon(self, waiter):
+        """Drop a caller that stopped waiting; returns True when it was granted a slot meanwhile"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            queue = self.queues.get(waiter.user)
+            if queue is not None:
+                queue.remove(waiter)
+                if not queue:
+                    del self.queues[waiter.user]
+            return False
+
+    def release(self, user):
+        with self._lock:
+            self.active -= 1
+            self.active_by_user[user] -= 1
+            if not self.active_by_user[user]:
+                del self.active_by_user[user]
+                if user not in self.queues:
+                    self.last_served.pop(user, None)
+            self._dispatch()
+
+    def _reserve(self, tokens):
+        """Seconds to wait for rate-limit capacity for a call, reserving it; raises GovernorBusy"""
+        with self._lock:
+            wait = max(self.requests.wait_time(1), self.tokens.wait_time(tokens))
+            if wait > self.max_wait:
+                raise GovernorBusy(f'AI rate limit reached; next capacity in {wait:.0f}s')
+            self.requests.take(1)
+            self.tokens.take(tokens)
+            return wait
+
+    @contextmanager
+    def slot(self, user, tokens=0):
+        """Hold a concurrency slot for one call of `user` sending about `tokens` input tokens"""
+        waiter = _Waiter(user)
+        self._enqueue(waiter)
+        if not waiter.event.wait(self.max_wait) and not self._abandon(waiter):
+            raise GovernorBusy('Too many AI requests in progress')
+        try:
+            time.sleep(self._reserve(tokens))
+            yield
+        finally:
+            self.release(user)
+
+    @asynccontextmanager
+    async def aslot(self, user, tokens=0):
+        """slot() for coroutines: waiting does not block the event loop"""
+        waiter = _Waiter(user, asyncio.get_running_loop())
+        self._enqueue(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter.future), self.max_wait)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                raise GovernorBusy('Too many AI requests in progress')
+        except asyncio.CancelledError:
+            if self._abandon(waiter):
+                self.release(user)
+            raise
+        try:
+            await asyncio.sleep(self._reserve(tokens))
+            yield
+        finally:
+            self.release(user)
+
+    # Singleflight
+
+    def join(self, key):
+        """(flight, leader) for a request; only the leader calls the API and must leave()"""
+        with self._lock:
+            flight = self.flights.get(key)
+            if flight is not None:
+                return flight, False
+            flight = self.flights[key] = Flight()
+            return flight, True
+
+    def wait(self, key, flight):
+        """
+        The result of a flight joined as a follower; None when the leader gave
+        up or did not finish within flight_timeout, and the caller should make
+        the call itself
+        """
+        result = flight.wait(self.flight_timeout)
+        if not flight.done.is_set():
+            self._drop(key, flight)
+        return result
+
+    async def await_flight(self, key, flight):
+        """wait() for coroutines"""
+        result = await flight.await_result(self.flight_timeout)
+        if not flight.done.is_set():
+            self._drop(key, flight)
+        return result
+
+    def _drop(self, key, flight):
+        """Stop new callers joining a flight whose leader is presumed lost"""
+        with self._lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+
+    def leave(self, key, flight, result):
+        """Publish the leader's result (None if it failed) to the callers that joined"""
+        with self._lock:
+            if self.flights.get(key) is flight:
+                del self.flights[key]
+        flight.finish(result)
+
+    def stats(self):
+        with self._lock:
+            return {
+                'active': self.active,
+                'waiting': sum(len(queue) for queue in self.queues.values()),
+                'in_flight': len(self.flights),
+                'max_concurrent': self.max_concurrent,
+                'max_per_user': self.max_per_user,
+            }
+
+
+def _build_governor():
+    return Governor(
+        max_concurrent=getattr(settings, 'AI_MAX_CONCURRENT_REQUESTS', 8),
+        max_per_user=getattr(settings, 'AI_MAX_CONCURRENT_PER_USER', 2),
+        requests_per_minute=getattr(settings, 'AI_REQUESTS_PER_MINUTE', 25),
+        tokens_per_minute=getattr(settings, 'AI_TOKENS_PER_MINUTE', 20000),
+        max_wait=getattr(settings, 'AI_GOVERNOR_MAX_WAIT', 30),
+        user_limits={BATCH_USER: getattr(settings, 'AI_BATCH_MAX_CONCURRENT', 4)},
+        flight_timeout=_flight_timeout(),
+    )
+
+
+def _flight_timeout():
+    """
+    Longest a leader can legitimately take: waiting for a slot, then every
+    attempt of the API client running to its timeout
+    """
+    attempts = getattr(settings, 'AI_MAX_RETRIES', 2) + 1
+    return getattr(settings, 'AI_GOVERNOR_MAX_WAIT', 30) + attempts * getattr(settings, 'AI_HTTP_TIMEOUT', 90)
+
+
+def get_governor() -> Governor:
+    """The governor of this process, created on first use"""
+    global _current
+    pid = os.getpid()
+    if _current is None or _current[0] != pid:
+        with _lock:
+            if _current is None or _current[0] != pid:
+                _current = (pid, _build_governor())
+    return _current[1]
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    global _current
+    if setting.startswith('AI_'):
+        _current = None
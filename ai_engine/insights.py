@@ -0,0 +1,194 @@
+"""
+Stored AI insights, served stale-while-revalidate.
+
+Every successful project or portfolio summary is saved as an AIInsight
+version for its (kind, subject), with the fingerprint of the prompt it
+answered. The summary endpoints then answer from the newest version at
+once:
+
+- when the subject's data still gives the same fingerprint, the version is
+  current;
+- when it has moved, the version is returned flagged `stale: true` and a
+  background task (ai_engine.tasks) generates a new one, at most one per
+  subject at a time. When Celery runs tasks eagerly (no broker, as in DEBUG
+  and tests) the task would run inside the request, so the regeneration is
+  handed to a thread of this process instead.
+
+Streamed requests (?stream=1) get the same: a stored version is replayed as
+one `delta` and a `done` event carrying `stored` and `stale`, and a freshly
+streamed summary is stored when its `done` event arrives.
+
+Old versions are kept for audit and pruned after each new version: the
+newest AI_INSIGHT_KEEP_VERSIONS per subject are kept, and older ones once
+they are AI_INSIGHT_RETENTION_DAYS old (the newest version of a subject is
+never pruned). manage.py prune_ai_insights applies the same policy to every
+subject.
+"""
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from typing import Any, AsyncIterator, Dict, Optional, Tuple
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+from django.db.models import F, Q, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from projects.models import Project
+from .governor import BATCH_USER
+from .models import AIInsight
+from .service import PMOAIEngine
+
+logger = logging.getLogger(__name__)
+
+# kind -> PMOAIEngine method generating it
+INSIGHT_METHODS = {
+    'project_summary': 'generate_project_summary',
+    'portfolio_summary': 'generate_portfolio_summary',
+}
+REGENERATING_PREFIX = 'ai:insight:regenerating'
+
+# Runs regenerations off the request when Celery is eager
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='ai-insights')
+
+
+def insight_fingerprint(engine: PMOAIEngine, kind: str, data: Dict[str, Any]) -> str:
+    """fingerprint() of the prompt an insight of `kind` sends for `data`"""
+    prompt = getattr(engine, f'_{INSIGHT_METHODS[kind]}_prompt')(data)
+    return engine.fingerprint(prompt)
+
+
+def insight_data(kind: str, subject: str) -> Optional[Dict[str, Any]]:
+    """The prompt data of a subject, as the endpoint builds it; None if the subject is gone"""
+    from .views import portfolio_summary_data, project_summary_data
+
+    if kind == 'portfolio_summary':
+        return portfolio_summary_data()
+    project = Project.objects.with_health().with_risk_counts().filter(pk=subject.split(':', 1)[1]).first()
+    return project_summary_data(project) if project else None
+
+
+def store_insight(kind: str, subject: str, fingerprint: str, model: str, result: Dict[str, Any], user=None) -> AIInsight:
+    """Save a successful result as the newest version of the insight, then prune the subject's old versions"""
+    result = {key: value for key, value in result.items() if key not in ('cached', 'coalesced')}
+    insight = AIInsight.objects.create(
+        kind=kind, subject=subject, fingerprint=fingerprint, model=model, result=result,
+        created_by=user if user is not None and user.is_authenticated else None,
+    )
+    prune_insights(kind, subject)
+    return insight
+
+
+def prune_insights(kind: Optional[str] = None, subject: Optional[str] = None) -> int:
+    """Delete versions beyond the retention policy; returns how many were deleted"""
+    keep = getattr(settings, 'AI_INSIGHT_KEEP_VERSIONS', 10)
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'AI_INSIGHT_RETENTION_DAYS', 90))
+
+    insights = AIInsight.objects.all()
+    if kind:
+        insights = insights.filter(kind=kind)
+    if subject:
+        insights = insights.filter(subject=subject)
+    # 1 is the newest version of each subject
+    ranked = insights.annotate(version=Window(
+        RowNumber(), partition_by=[F('kind'), F('subject')], order_by=F('created_at').desc()
+    ))
+    expired = list(ranked.filter(Q(version__gt=keep) | Q(version__gt=1, created_at__lt=cutoff)).values_list('pk', flat=True))
+    if expired:
+        AIInsight.objects.filter(pk__in=expired).delete()
+    return len(expired)
+
+
+def regenerate_insight(kind: str, subject: str) -> Optional[AIInsight]:
+    """Generate and store a new version unless the newest one is still current"""
+    try:
+        data = insight_data(kind, subject)
+        if data is None:
+            return None
+        engine = PMOAIEngine(governor_user=BATCH_USER)
+        if engine.demo_mode:
+            return None
+        fingerprint = insight_fingerprint(engine, kind, data)
+        latest = AIInsight.objects.filter(kind=kind, subject=subject).first()
+        if latest is not None and latest.fingerprint == fingerprint:
+            return latest
+
+        result = getattr(engine, INSIGHT_METHODS[kind])(data)
+        if not result.get('success'):
+            logger.error(f"Regenerating {kind} of {subject} failed: {result.get('error_message')}")
+            return None
+        return store_insight(kind, subject, fingerprint, engine.model, result)
+    finally:
+        cache.delete(f'{REGENERATING_PREFIX}:{kind}:{subject}')
+
+
+def _regenerate_in_thread(kind: str, subject: str):
+    try:
+        regenerate_insight(kind, subject)
+    except Exception:
+        logger.exception(f"Regenerating {kind} of {subject} failed")
+    finally:
+        # The thread's own connections
+        connections.close_all()
+
+
+def schedule_regeneration(kind: str, subject: str) -> bool:
+    """
+    Queue regenerate_insight unless one is already queued or running for the
+    subject; returns at once, without waiting for the regeneration
+    """
+    from .tasks import regenerate_insight_task
+
+    timeout = getattr(settings, 'AI_INSIGHT_REGENERATION_TIMEOUT', 300)
+    if not cache.add(f'{REGENERATING_PREFIX}:{kind}:{subject}', True, timeout):
+        return False
+    if getattr(settings, 'CELERY_TASK_ALWAYS_EAGER', False):
+        _executor.submit(_regenerate_in_thread, kind, subject)
+    else:
+        regenerate_insight_task.delay(kind, subject)
+    return True
+
+
+async def stored_insight(engine: PMOAIEngine, kind: str, subject: str,
+                         data: Dict[str, Any]) -> Tuple[str, Optional[Dict[str, Any]]]:
+    """
+    (fingerprint of `data`, response from the newest stored version or None).
+    A stale version schedules a regeneration.
+    """
+    fingerprint = insight_fingerprint(engine, kind, data)
+    insight = await AIInsight.objects.filter(kind=kind, subject=subject).afirst()
+    if insight is None:
+        return fingerprint, None
+    stale = insight.fingerprint != fingerprint
+    if stale:
+        await sync_to_async(schedule_regeneration)(kind, subject)
+    return fingerprint, insight.response(stale)
+
+
+async def insight_events(response: Dict[str, Any]) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """A stored_insight() response as the events of a streamed answer"""
+    yield 'delta', {'text': response['response']}
+    yield 'done', {
+        'cached': True,
+        'stored': True,
+        'stale': response['stale'],
+        'generated_at': response['generated_at'],
+        'usage': response.get('usage'),
+    }
+
+
+async def stored_stream(events: AsyncIterator[Tuple[str, Dict[str, Any]]], kind: str, subject: str,
+                        fingerprint: str, model: str, user=None) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+    """Pass the events of a streamed insight through, storing it once its done event arrives"""
+    parts = []
+    async for event, data in events:
+        if event == 'delta':
+            parts.append(data['text'])
+        elif event == 'done':
+            result = {'response': ''.join(parts), 'raw_response': True, 'success': True, 'usage': data.get('usage')}
+            try:
+                await sync_to_async(store_insight)(kind, subject, fingerprint, model, result, user=user)
+            except Exception as e:
+                logger.error(f"Storing streamed {kind} of {subject} failed: {str(e)}")
+        yield event, data
@@ -0,0 +1,67 @@
+import json
+from asgiref.sync import async_to_sync
+from django.core.management.base import BaseCommand, CommandError
+from projects.models import Project, Risk
+from ai_engine.context import build_context, context_budget, estimate_tokens
+from ai_engine.views import (
+    comparison_project_data, executive_report_data, pmo_question_context,
+    portfolio_summary_data, project_summary_data, risk_analysis_data,
+)
+
+
+def json_context(sections):
+    """The indented JSON context the prompts embedded before the compact encoding"""
+    return '\n\n'.join(f'{label}:\n{json.dumps(data, indent=2, default=str)}' for label, data in sections)
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare estimated input tokens of the AI prompt data context as indented JSON '
+        'and as the compact, budgeted encoding, per endpoint, using the current database.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--compare-limit', type=int, help='Projects passed to compare_projects (default: all)')
+        parser.add_argument('--question', default='Which projects are at risk and why?',
+                            help='Question whose context pmo_question measures')
+
+    def endpoint_sections(self, compare_limit=None, question=''):
+        """{endpoint: [(label, data)]} built the same way as the AI views"""
+        projects = Project.objects.with_health().with_risk_counts()
+        project = projects.first()
+        risk = Risk.objects.select_related('project').first()
+        portfolio_data, key_projects = executive_report_data()
+        compared = projects[:compare_limit] if compare_limit else projects
+
+        sections = {
+            'project_summary': [('PROJECT DATA', project_summary_data(project))] if project else None,
+            'portfolio_summary': [('PORTFOLIO DATA', portfolio_summary_data())],
+            'risk_analysis': [('RISK DATA', risk_analysis_data(risk))] if risk else None,
+            'pmo_question': [('CONTEXT DATA', async_to_sync(pmo_question_context)(question))],
+            'compare_projects': [('PROJECTS DATA', [comparison_project_data(p) for p in compared])],
+            'executive_report': [('PORTFOLIO DATA', portfolio_data), ('KEY PROJECTS', key_projects)],
+        }
+        return {endpoint: value for endpoint, value in sections.items() if value}
+
+    def handle(self, *args, **options):
+        if not Project.objects.exists():
+            raise CommandError('No projects in the database; load some data first (populate_data.py)')
+
+        self.stdout.write(f'{"endpoint":<20}{"json":>8}{"compact":>9}{"budget":>8}{"saved":>8}')
+        totals = [0, 0]
+        for endpoint, sections in self.endpoint_sections(options['compare_limit'], options['question']).items():
+            before = estimate_tokens(json_context(sections))
+            budget = context_budget(endpoint)
+            context = build_context(sections, budget)
+            after = estimate_tokens(context)
+            totals[0] += before
+            totals[1] += after
+            trimmed = ' (trimmed)' if 'more rows not shown' in context or context.endswith('[context truncated]') else ''
+            self.stdout.write(
+                f'{endpoint:<20}{before:>8}{after:>9}{budget:>8}{1 - after / before:>8.0%}{trimmed}'
+            )
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"total":<20}{totals[0]:>8}{totals[1]:>9}{"":>8}{1 - totals[1] / totals[0]:>8.0%}'
+        ))
+        self.stdout.write('Token counts are local estimates (ai_engine.context.estimate_tokens)')
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand, CommandError
+from projects.models import Risk
+from ai_engine.batch import DEFAULT_SEVERITIES, DEFAULT_STATUSES, analyze_risks, select_risks
+
+
+def choice_list(choices):
+    """argparse type for a comma-separated list of model choices"""
+    valid = [value for value, _ in choices]
+
+    def parse(text):
+        values = [value.strip() for value in text.split(',') if value.strip()]
+        invalid = [value for value in values if value not in valid]
+        if invalid:
+            raise ValueError(f'unknown value(s) {", ".join(invalid)}; use {", ".join(valid)}')
+        return values
+    parse.__name__ = 'list'
+    return parse
+
+
+class Command(BaseCommand):
+    help = (
+        'Run the AI risk analysis over a set of risks (open and mitigating high/critical risks by default) '
+        'with a bounded number of concurrent calls, storing each result. Risks whose stored analysis is '
+        'current are skipped, so an interrupted run can simply be restarted.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--severity', type=choice_list(Risk.SEVERITY_CHOICES), default=list(DEFAULT_SEVERITIES),
+                            help='Comma-separated severities (default: high,critical)')
+        parser.add_argument('--status', type=choice_list(Risk.STATUS_CHOICES), default=list(DEFAULT_STATUSES),
+                            help='Comma-separated risk statuses (default: open,mitigating)')
+        parser.add_argument('--project', help='Only the risks of this project (code or id)')
+        parser.add_argument('--workers', type=int, help='Concurrent calls (default: AI_BATCH_MAX_CONCURRENT)')
+        parser.add_argument('--force', action='store_true', help='Also re-analyze risks whose analysis is current')
+
+    def handle(self, *args, **options):
+        risks = select_risks(options['severity'], options['status'], options['project'])
+
+        def progress(done, total, risk):
+            self.stdout.write(f'[{done}/{total}] {risk}')
+
+        try:
+            summary = analyze_risks(risks, workers=options['workers'], force=options['force'], progress=progress)
+        except RuntimeError as e:
+            raise CommandError(str(e))
+
+        self.stdout.write(
+            f"{summary['selected']} risks selected: {summary['current']} already current, "
+            f"{summary['analyzed']} analyzed, {summary['failed']} failed"
+        )
+        for error_type, count in summary['errors'].items():
+            self.stdout.write(f'  {error_type}: {count}')
+        if summary['failed']:
+            self.stdout.write('Run the command again to retry the failed risks.')
@@ -0,0 +1,79 @@
+import re
+import time
+from django.core.management.base import BaseCommand
+from ai_engine.markdown import MarkdownRenderer, render_markdown
+
+SECTION = """## {n}. Portfolio Health Assessment
+
+**Overall status:** 3 of 12 projects are *at risk*; schedule performance is the main driver.
+
+| Project | SPI | CPI | Status |
+|---------|-----|-----|--------|
+| Data Platform | 0.82 | 0.95 | at_risk |
+| Mobile App | 1.02 | 1.10 | on_track |
+| ERP Upgrade <phase 2> | 0.76 | 0.88 | delayed |
+
+### Root Causes
+- **Vendor delays** on hardware delivery (6 weeks late)
+  - Affects `DP-001` and `ERP-004`
+  - Escalated to procurement & legal
+- Resource contention between the ERP and data teams
+- Scope growth without re-baselining
+
+### Recommendations
+1. Reallocate 2 senior engineers from Mobile App to Data Platform for 3 weeks
+2. Re-baseline ERP Upgrade phase 2 with the steering committee
+3. Weekly vendor check-ins until delivery
+
+---
+"""
+
+
+def legacy_format(text):
+    """The regex passes PMOQuestionView applied to every answer before the markdown renderer"""
+    text = re.sub(r'^```json\s*\n?', '', text, flags=re.IGNORECASE)
+    text = re.sub(r'\n?```\s*$', '', text)
+    text = re.sub(r'^\{\s*"response":\s*"', '', text)
+    text = re.sub(r'"\s*\}\s*$', '', text)
+    return text.replace('\\n', '<br>').replace('\n', '<br>')
+
+
+class Command(BaseCommand):
+    help = (
+        'Time the markdown renderer of AI answers on a long generated report, rendered at once '
+        'and incrementally in stream-sized chunks, next to the former regex/<br> formatting.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sections', type=int, default=200, help='Report sections (about 0.8 KB each)')
+        parser.add_argument('--chunk-size', type=int, default=24, help='Characters per streamed chunk')
+        parser.add_argument('--repeat', type=int, default=5, help='Runs per measurement (the best is shown)')
+
+    def best_of(self, repeat, func):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    def handle(self, *args, **options):
+        report = ''.join(SECTION.format(n=n) for n in range(1, options['sections'] + 1))
+        chunk_size = options['chunk_size']
+        chunks = [report[i:i + chunk_size] for i in range(0, len(report), chunk_size)]
+
+        def incremental():
+            renderer = MarkdownRenderer()
+            return ''.join(renderer.feed(chunk) for chunk in chunks) + renderer.close()
+
+        assert incremental() == render_markdown(report)
+        size_mb = len(report.encode('utf-8')) / 1e6
+        self.stdout.write(f'Report: {len(report):,} characters, {len(chunks):,} chunks of {chunk_size}')
+        self.stdout.write(f'{"method":<26}{"ms":>10}{"MB/s":>10}')
+        for name, func in [
+            ('legacy regex + <br>', lambda: legacy_format(report)),
+            ('markdown (whole text)', lambda: render_markdown(report)),
+            ('markdown (incremental)', incremental),
+        ]:
+            seconds = self.best_of(options['repeat'], func)
+            self.stdout.write(f'{name:<26}{seconds * 1000:>10.1f}{size_mb / seconds:>10.1f}')
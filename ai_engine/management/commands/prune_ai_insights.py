@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ai_engine.insights import prune_insights
+
+
+class Command(BaseCommand):
+    help = (
+        'Delete stored AI insight versions beyond the retention policy: the newest '
+        'AI_INSIGHT_KEEP_VERSIONS per subject are kept, older ones until they are '
+        'AI_INSIGHT_RETENTION_DAYS old. The newest version of a subject is always kept.'
+    )
+
+    def handle(self, *args, **options):
+        deleted = prune_insights()
+        self.stdout.write(
+            f'Deleted {deleted} insight versions (keeping {getattr(settings, "AI_INSIGHT_KEEP_VERSIONS", 10)} '
+            f'per subject, {getattr(settings, "AI_INSIGHT_RETENTION_DAYS", 90)} days)'
+        )
@@ -0,0 +1,33 @@
+import time
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from ai_engine.retrieval import save_index
+
+
+class Command(BaseCommand):
+    help = (
+        'Bring the local retrieval index that picks the records sent with PMO questions up '
+        'to date and save it to AI_RETRIEVAL_INDEX_PATH. Optionally show the best matches for a query.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rebuild', action='store_true', help='Index every record from scratch')
+        parser.add_argument('--query', help='Show the best matching records for this text')
+        parser.add_argument('--top', type=int, default=10, help='Matches shown for --query')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        index = save_index(rebuild=options['rebuild'])
+        elapsed = (time.monotonic() - started) * 1000
+        self.stdout.write(
+            f'Indexed {len(index)} records ({len(index.vocabulary)} terms) in {elapsed:.0f} ms'
+            f" -> {getattr(settings, 'AI_RETRIEVAL_INDEX_PATH', None) or 'memory only'}"
+        )
+
+        if options['query']:
+            started = time.monotonic()
+            matches = index.search(options['query'], options['top'])
+            elapsed = (time.monotonic() - started) * 1000
+            for key, score in matches:
+                self.stdout.write(f'{score:8.3f}  {key}')
+            self.stdout.write(f'{len(matches)} matches in {elapsed:.1f} ms')
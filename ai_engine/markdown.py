@@ -0,0 +1,196 @@
+"""
+Markdown to HTML for AI output.
+
+The AI endpoints answer in markdown: headers, bullet and numbered lists
+(nested by indentation), tables, code fences, **bold**, *italic* and
+`code`. MarkdownRenderer converts it line by line. feed() takes text as it
+arrives, e.g. the deltas of a stream, and returns the HTML of the lines
+completed so far; close() returns the rest. A returned fragment is never
+revised: appending the fragments gives the same HTML as rendering the whole
+text at once, and a client can display them while the stream continues
+(browsers close the elements still open).
+
+All text is HTML-escaped; the only markup in the output is the renderer's.
+"""
+import html
+import re
+from typing import AsyncIterator, Iterable, Iterator, Tuple
+
+_HEADER_RE = re.compile(r'(#{1,6})\s+(.*?)(?:\s+#+)?\s*$')
+_LIST_RE = re.compile(r'( *)([-*+•]|\d{1,9}[.)])\s+(.*)$')
+_RULE_RE = re.compile(r'(?:-{3,}|\*{3,}|_{3,})$')
+_FENCE_RE = re.compile(r'(`{3,}|~{3,})')
+_TABLE_SEPARATOR_RE = re.compile(r'\|?\s*:?-+:?\s*(?:\|\s*:?-+:?\s*)*\|?$')
+_CELL_SPLIT_RE = re.compile(r'(?<!\\)\|')
+_CODE_SPAN_RE = re.compile(r'`([^`]+)`')
+_BOLD_RE = re.compile(r'\*\*(?=\S)(.+?)(?<=\S)\*\*|__(?=\S)(.+?)(?<=\S)__')
+_ITALIC_RE = re.compile(r'(?<![*\w])\*(?=[^\s*])(.+?)(?<=[^\s*])\*(?![*\w])')
+
+
+def render_inline(text: str) -> str:
+    """Escape a line of text and apply `code`, **bold** and *italic*"""
+    parts = []
+    # Odd pieces are the contents of code spans, which are not formatted further
+    for index, piece in enumerate(_CODE_SPAN_RE.split(text)):
+        if index % 2:
+            parts.append(f'<code>{html.escape(piece, quote=False)}</code>')
+            continue
+        piece = html.escape(piece, quote=False)
+        piece = _BOLD_RE.sub(lambda match: f'<strong>{match.group(1) or match.group(2)}</strong>', piece)
+        parts.append(_ITALIC_RE.sub(r'<em>\1</em>', piece))
+    return ''.join(parts)
+
+
+def _table_row(line: str, cell: str) -> str:
+    line = line.strip()
+    line = line[1:] if line.startswith('|') else line
+    line = line[:-1] if line.endswith('|') and not line.endswith('\\|') else line
+    cells = (render_inline(text.strip().replace('\\|', '|')) for text in _CELL_SPLIT_RE.split(line))
+    return '<tr>' + ''.join(f'<{cell}>{text}</{cell}>' for text in cells) + '</tr>'
+
+
+class MarkdownRenderer:
+    """Incremental markdown to HTML: feed() text as it arrives, then close()"""
+
+    def __init__(self):
+        # Text after the last complete line
+        self._pending = ''
+        # Open block: 'p', 'table' or 'code' (lists are tracked in _lists)
+        self._block = None
+        # Open lists as (tag, indent), innermost last; their last <li> is open too
+        self._lists = []
+        # First row of a table, held until the next line tells whether it is a header
+        self._table_head = None
+        self._fence = ''
+
+    def feed(self, text: str) -> str:
+        """HTML of the lines completed by `text`"""
+        self._pending += text
+        if '\n' not in self._pending:
+            return ''
+        *lines, self._pending = self._pending.split('\n')
+        return ''.join(self._line(line.rstrip('\r')) for line in lines)
+
+    def close(self) -> str:
+        """HTML of the rest of the text, closing every open element"""
+        out = self._line(self._pending.rstrip('\r')) if self._pending else ''
+        self._pending = ''
+        return out + self._close_blocks()
+
+    def _close_blocks(self) -> str:
+        out = []
+        if self._table_head is not None:
+            out.append('<table><tbody>' + _table_row(self._table_head, 'td'))
+            self._table_head = None
+            self._block = 'table'
+        if self._block == 'p':
+            out.append('</p>')
+        elif self._block == 'table':
+            out.append('</tbody></table>')
+        elif self._block == 'code':
+            out.append('</code></pre>')
+        self._block = None
+        while self._lists:
+            out.append(f'</li></{self._lists.pop()[0]}>')
+        return ''.join(out)
+
+    def _line(self, line: str) -> str:
+        stripped = line.strip()
+        if self._block == 'code':
+            if stripped.startswith(self._fence) and not stripped.strip(self._fence[0]):
+                self._block = None
+                return '</code></pre>'
+            return html.escape(line, quote=False) + '\n'
+
+        out = []
+        if self._table_head is not None:
+            head, self._table_head = self._table_head, None
+            self._block = 'table'
+            if '|' in stripped and _TABLE_SEPARATOR_RE.match(stripped):
+                return '<table><thead>' + _table_row(head, 'th') + '</thead><tbody>'
+            out.append('<table><tbody>' + _table_row(head, 'td'))
+
+        if not stripped:
+            return ''.join(out) + self._close_blocks()
+
+        if self._block == 'table':
+            if stripped.startswith('|'):
+                return ''.join(out) + _table_row(stripped, 'td')
+            out.append(self._close_blocks())
+
+        fence = _FENCE_RE.match(stripped)
+        header = _HEADER_RE.match(stripped)
+        item = _LIST_RE.match(line)
+        if fence:
+            out.append(self._close_blocks() + '<pre><code>')
+            self._block = 'code'
+            self._fence = fence.group(1)
+        elif header:
+            level = len(header.group(1))
+            out.append(self._close_blocks() + f'<h{level}>{render_inline(header.group(2))}</h{level}>')
+        elif _RULE_RE.match(stripped):
+            out.append(self._close_blocks() + '<hr>')
+        elif item:
+            out.append(self._list_item(len(item.group(1)), item.group(2), item.group(3)))
+        elif stripped.startswith('|'):
+            out.append(self._close_blocks())
+            self._table_head = stripped
+        elif self._lists and line.startswith(' '):
+            # Indented text continues the open list item
+            out.append('<br>' + render_inline(stripped))
+        elif self._block == 'p':
+            out.append('<br>' + render_inline(stripped))
+        else:
+            out.append(self._close_blocks() + '<p>' + render_inline(stripped))
+            self._block = 'p'
+        return ''.join(out)
+
+    def _list_item(self, indent: int, marker: str, text: str) -> str:
+        tag = 'ol' if marker[0].isdigit() else 'ul'
+        out = []
+        if self._block is not None:
+            out.append(self._close_blocks())
+        while self._lists and self._lists[-1][1] > indent:
+            out.append(f'</li></{self._lists.pop()[0]}>')
+        if self._lists and self._lists[-1][1] == indent:
+            if self._lists[-1][0] == tag:
+                out.append('</li>')
+            else:
+                out.append(f'</li></{self._lists.pop()[0]}>')
+        if not self._lists or self._lists[-1][1] < indent:
+            start = int(marker[:-1]) if tag == 'ol' else 1
+            out.append(f'<{tag} start="{start}">' if start != 1 else f'<{tag}>')
+            self._lists.append((tag, indent))
+        out.append('<li>' + render_inline(text))
+        return ''.join(out)
+
+
+def render_markdown(text: str) -> str:
+    """HTML for a complete markdown text"""
+    renderer = MarkdownRenderer()
+    return renderer.feed(text) + renderer.close()
+
+
+def render_events(events: Iterable[Tuple[str, dict]]) -> Iterator[Tuple[str, dict]]:
+    """
+    Add the rendered HTML to the events of an AI stream: each delta gets the
+    `html` of the lines it completed, and the done event the rest
+    """
+    renderer = MarkdownRenderer()
+    for event, data in events:
+        if event == 'delta':
+            data = {**data, 'html': renderer.feed(data['text'])}
+        elif event == 'done':
+            data = {**data, 'html': renderer.close()}
+        yield event, data
+
+
+async def arender_events(events: AsyncIterator[Tuple[str, dict]]) -> AsyncIterator[Tuple[str, dict]]:
+    """render_events() for the async streams of the ASGI views"""
+    renderer = MarkdownRenderer()
+    async for event, data in events:
+        if event == 'delta':
+            data = {**data, 'html': renderer.feed(data['text'])}
+        elif event == 'done':
+            data = {**data, 'html': renderer.close()}
+        yield event, data
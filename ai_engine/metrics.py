@@ -0,0 +1,309 @@
+"""
+Latency, token and cost metrics of the AI engine.
+
+The public PMOAIEngine methods are wrapped with @instrumented(name). Every
+call, including streams, which are measured until their last event, is
+recorded with:
+
+- wall time and, for streams, time to first token;
+- input, output, cache-write and cache-read tokens, and their cost;
+- the model, the user and the error class.
+
+Calls answered from the response cache or coalesced with an identical call
+(see ai_engine.governor) made no API request and cost nothing.
+
+Records feed in-process histograms per method and per user (per worker
+process, since the last restart). With AI_CALL_LOG they are also saved as
+AICallLog rows, which /api/ai/metrics/?source=log summarizes across
+processes.
+"""
+import asyncio
+import functools
+import inspect
+import logging
+import threading
+import time
+from decimal import Decimal
+from typing import Any, Dict, Optional
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# USD per million tokens, by model name prefix (AI_MODEL_PRICES adds or overrides entries)
+MODEL_PRICES = {
+    'claude-opus-4': {'input': 15, 'output': 75, 'cache_write': 18.75, 'cache_read': 1.50},
+    'claude-sonnet-4': {'input': 3, 'output': 15, 'cache_write': 3.75, 'cache_read': 0.30},
+    'claude-3-7-sonnet': {'input': 3, 'output': 15, 'cache_write': 3.75, 'cache_read': 0.30},
+    'claude-3-5-haiku': {'input': 0.80, 'output': 4, 'cache_write': 1, 'cache_read': 0.08},
+}
+
+TOKEN_FIELDS = ('input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+_PRICE_KEYS = {
+    'input_tokens': 'input',
+    'output_tokens': 'output',
+    'cache_creation_input_tokens': 'cache_write',
+    'cache_read_input_tokens': 'cache_read',
+}
+
+# Upper bounds (ms) of the latency histogram buckets
+LATENCY_BUCKETS_MS = (100, 250, 500, 1000, 2000, 4000, 8000, 15000, 30000, 60000, 120000)
+
+
+def call_cost(model: str, usage: Dict[str, int]) -> Optional[Decimal]:
+    """USD cost of a call's token usage, or None for a model without prices"""
+    prices = {**MODEL_PRICES, **getattr(settings, 'AI_MODEL_PRICES', {})}
+    match = max((prefix for prefix in prices if model.startswith(prefix)), key=len, default=None)
+    if match is None:
+        return None
+    price = prices[match]
+    total = sum(Decimal(usage.get(field) or 0) * Decimal(str(price[key])) for field, key in _PRICE_KEYS.items())
+    return (total / 1000000).quantize(Decimal('0.000001'))
+
+
+class Histogram:
+    """Counts per latency bucket; percentiles are interpolated within a bucket"""
+
+    def __init__(self, bounds=LATENCY_BUCKETS_MS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def observe(self, value):
+        index = next((i for i, bound in enumerate(self.bounds) if value <= bound), len(self.bounds))
+        self.counts[index] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, q):
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = self.bounds[index - 1] if index else 0
+                upper = min(self.bounds[index], self.max) if index < len(self.bounds) else self.max
+                return round(lower + (upper - lower) * (rank - seen) / count)
+            seen += count
+        return self.max
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'mean': round(self.total / self.count) if self.count else None,
+            'p50': self.percentile(0.5),
+            'p95': self.percentile(0.95),
+            'max': self.max if self.count else None,
+        }
+
+
+class CallStats:
+    """Totals and latency histograms of a group of calls (one method or one user)"""
+
+    def __init__(self):
+        self.calls = 0
+        self.streamed = 0
+        self.cached = 0
+        self.coalesced = 0
+        self.errors = {}
+        self.tokens = dict.fromkeys(TOKEN_FIELDS, 0)
+        self.cost = Decimal(0)
+        self.wall_ms = Histogram()
+        self.ttft_ms = Histogram()
+
+    def observe(self, record):
+        self.calls += 1
+        self.streamed += record['streamed']
+        self.cached += record['cached']
+        self.coalesced += record['coalesced']
+        if record['error_type']:
+            self.errors[record['error_type']] = self.errors.get(record['error_type'], 0) + 1
+        for field in TOKEN_FIELDS:
+            self.tokens[field] += record[field]
+        self.cost += record['cost'] or 0
+        self.wall_ms.observe(record['wall_ms'])
+        if record['ttft_ms'] is not None:
+            self.ttft_ms.observe(record['ttft_ms'])
+
+    def summary(self):
+        return {
+            'calls': self.calls,
+            'streamed': self.streamed,
+            'cached': self.cached,
+            'coalesced': self.coalesced,
+            'errors': self.errors,
+            'tokens': self.tokens,
+            'cost_usd': float(self.cost),
+            'wall_ms': self.wall_ms.summary(),
+            'time_to_first_token_ms': self.ttft_ms.summary(),
+        }
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self.started_at = timezone.now()
+        self.total = CallStats()
+        self.methods = {}
+        self.users = {}
+        self._lock = threading.Lock()
+
+    def observe(self, record):
+        with self._lock:
+            self.total.observe(record)
+            self.methods.setdefault(record['method'], CallStats()).observe(record)
+            self.users.setdefault(record['user_label'], CallStats()).observe(record)
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                'since': self.started_at,
+                'totals': self.total.summary(),
+                'methods': {name: stats.summary() for name, stats in sorted(self.methods.items())},
+                'users': {name: stats.summary() for name, stats in sorted(self.users.items())},
+            }
+
+
+registry = MetricsRegistry()
+
+
+def reset_metrics():
+    """Start the in-process metrics afresh"""
+    global registry
+    registry = MetricsRegistry()
+
+
+def get_metrics() -> Dict[str, Any]:
+    return registry.snapshot()
+
+
+def summarize_logs(logs) -> Dict[str, Any]:
+    """get_metrics() for a queryset of AICallLog rows"""
+    summary = MetricsRegistry()
+    for log in logs.select_related('user').iterator():
+        summary.observe(log.as_record())
+    snapshot = summary.snapshot()
+    snapshot['since'] = None
+    return snapshot
+
+
+class CallRecorder:
+    """Measures one engine call and records it when the result (or the stream) is complete"""
+
+    def __init__(self, engine, method):
+        self.engine = engine
+        self.method = method
+        self.started = time.monotonic()
+
+    def record(self, outcome: Dict[str, Any], streamed=False, error_type=None):
+        """outcome: the method's result, or the data of a stream's done/error event"""
+        cached = bool(outcome.get('cached'))
+        coalesced = bool(outcome.get('coalesced'))
+        upstream = not (cached or coalesced)
+        usage = (outcome.get('usage') or {}) if upstream else {}
+        if error_type is None and not streamed and not outcome.get('success'):
+            error_type = outcome.get('error_type') or ('DemoMode' if outcome.get('demo_mode') else 'Error')
+        user = self.engine.user
+        record = {
+            'method': self.method,
+            'model': self.engine.model,
+            'user': user,
+            'user_label': user.get_username() if user else 'anonymous',
+            'streamed': streamed,
+            'cached': cached,
+            'coalesced': coalesced,
+            'wall_ms': round((time.monotonic() - self.started) * 1000),
+            'ttft_ms': outcome.get('time_to_first_token_ms') if streamed else None,
+            'error_type': error_type or '',
+            **{field: usage.get(field) or 0 for field in TOKEN_FIELDS},
+        }
+        record['cost'] = call_cost(self.engine.model, usage) if usage else Decimal(0)
+        registry.observe(record)
+        return record
+
+    def stream_outcome(self, event, data):
+        """(outcome, error_type) once a stream event ends the stream, else None"""
+        if event == 'done':
+            return data, None
+        if event == 'error':
+            return data, data.get('error_type') or 'Error'
+        return None
+
+
+def _save(record):
+    from .models import AICallLog
+    try:
+        AICallLog.objects.create(**{key: value for key, value in record.items() if key != 'user_label'})
+    except Exception as e:
+        logger.error(f"Failed to save AI call log: {str(e)}")
+
+
+def save_record(record):
+    if getattr(settings, 'AI_CALL_LOG', False):
+        _save(record)
+
+
+async def asave_record(record):
+    if getattr(settings, 'AI_CALL_LOG', False):
+        await sync_to_async(_save)(record)
+
+
+def _recorded_stream(recorder, events):
+    ended = None
+    try:
+        for event, data in events:
+            ended = ended or recorder.stream_outcome(event, data)
+            yield event, data
+    finally:
+        # Not ended: the consumer stopped reading (e.g. the client disconnected)
+        outcome, error_type = ended or ({}, 'Disconnected')
+        save_record(recorder.record(outcome, streamed=True, error_type=error_type))
+
+
+async def _arecorded_stream(recorder, events):
+    ended = None
+    try:
+        async for event, data in events:
+            ended = ended or recorder.stream_outcome(event, data)
+            yield event, data
+    finally:
+        outcome, error_type = ended or ({}, 'Disconnected')
+        await asave_record(recorder.record(outcome, streamed=True, error_type=error_type))
+
+
+def instrumented(method):
+    """Record every call of an engine method (sync or async, streamed or not) as `method`"""
+    def decorator(func):
+        if asyncio.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(engine, *args, **kwargs):
+                recorder = CallRecorder(engine, method)
+                try:
+                    result = await func(engine, *args, **kwargs)
+                except Exception as e:
+                    await asave_record(recorder.record({}, error_type=type(e).__name__))
+                    raise
+                if inspect.isasyncgen(result):
+                    return _arecorded_stream(recorder, result)
+                await asave_record(recorder.record(result))
+                return result
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(engine, *args, **kwargs):
+            recorder = CallRecorder(engine, method)
+            try:
+                result = func(engine, *args, **kwargs)
+            except Exception as e:
+                save_record(recorder.record({}, error_type=type(e).__name__))
+                raise
+            if inspect.isgenerator(result):
+                return _recorded_stream(recorder, result)
+            save_record(recorder.record(result))
+            return result
+        return wrapper
+    return decorator
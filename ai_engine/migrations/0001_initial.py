@@ -0,0 +1,42 @@
+# Generated by Django 5.0 on 2026-10-15 04:29
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AICallLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('method', models.CharField(max_length=50)),
+                ('model', models.CharField(max_length=100)),
+                ('streamed', models.BooleanField(default=False)),
+                ('cached', models.BooleanField(default=False, help_text='Served from the response cache')),
+                ('coalesced', models.BooleanField(default=False, help_text='Shared an identical call in flight')),
+                ('wall_ms', models.PositiveIntegerField()),
+                ('ttft_ms', models.PositiveIntegerField(blank=True, help_text='Time to first token (streams)', null=True)),
+                ('input_tokens', models.PositiveIntegerField(default=0)),
+                ('output_tokens', models.PositiveIntegerField(default=0)),
+                ('cache_creation_input_tokens', models.PositiveIntegerField(default=0)),
+                ('cache_read_input_tokens', models.PositiveIntegerField(default=0)),
+                ('cost', models.DecimalField(blank=True, decimal_places=6, help_text='USD', max_digits=12, null=True)),
+                ('error_type', models.CharField(blank=True, max_length=100)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ai_calls', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['method', '-created_at'], name='ai_engine_a_method_6c42b6_idx')],
+            },
+        ),
+    ]
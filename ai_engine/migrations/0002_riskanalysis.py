@@ -0,0 +1,30 @@
+# Generated by Django 5.0 on 2026-10-15 04:36
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_engine', '0001_initial'),
+        ('projects', '0005_projectsnapshot_date_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RiskAnalysis',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('fingerprint', models.CharField(db_index=True, help_text='PMOAIEngine.risk_fingerprint() of the data analyzed', max_length=64)),
+                ('model', models.CharField(max_length=100)),
+                ('result', models.JSONField(help_text='analyze_risk() result')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('risk', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='ai_analysis', to='projects.risk')),
+            ],
+            options={
+                'verbose_name_plural': 'risk analyses',
+            },
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.0 on 2026-10-15 04:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('ai_engine', '0002_riskanalysis'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AIInsight',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('project_summary', 'Project summary'), ('portfolio_summary', 'Portfolio summary')], max_length=30)),
+                ('subject', models.CharField(help_text="What the insight is about, e.g. 'project:12' or 'portfolio'", max_length=50)),
+                ('fingerprint', models.CharField(help_text='PMOAIEngine.fingerprint() of the prompt answered', max_length=64)),
+                ('model', models.CharField(max_length=100)),
+                ('result', models.JSONField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('created_by', models.ForeignKey(blank=True, help_text='User whose request generated it; empty for background regenerations', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='ai_insights', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['kind', 'subject', '-created_at'], name='ai_engine_a_kind_4a6e0d_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.db import models
+
+
+class AICallLog(models.Model):
+    """One PMOAIEngine call, saved when AI_CALL_LOG is on (see ai_engine.metrics)"""
+    
+    method = models.CharField(max_length=50)
+    model = models.CharField(max_length=100)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='ai_calls'
+    )
+    
+    streamed = models.BooleanField(default=False)
+    cached = models.BooleanField(default=False, help_text="Served from the response cache")
+    coalesced = models.BooleanField(default=False, help_text="Shared an identical call in flight")
+    
+    wall_ms = models.PositiveIntegerField()
+    ttft_ms = models.PositiveIntegerField(null=True, blank=True, help_text="Time to first token (streams)")
+    
+    input_tokens = models.PositiveIntegerField(default=0)
+    output_tokens = models.PositiveIntegerField(default=0)
+    cache_creation_input_tokens = models.PositiveIntegerField(default=0)
+    cache_read_input_tokens = models.PositiveIntegerField(default=0)
+    cost = models.DecimalField(max_digits=12, decimal_places=6, null=True, blank=True, help_text="USD")
+    
+    error_type = models.CharField(max_length=100, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['method', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.method} ({self.wall_ms} ms)"
+    
+    def as_record(self):
+        """The call as recorded by ai_engine.metrics"""
+        record = {
+            field: getattr(self, field) for field in (
+                'method', 'model', 'user', 'streamed', 'cached', 'coalesced', 'wall_ms', 'ttft_ms',
+                'input_tokens', 'output_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens',
+                'cost', 'error_type',
+            )
+        }
+        record['user_label'] = self.user.get_username() if self.user else 'anonymous'
+        return record
+
+
+class RiskAnalysis(models.Model):
+    """The stored AI analysis of a risk, served until the risk changes (see ai_engine.batch)"""
+    
+    risk = models.OneToOneField('projects.Risk', on_delete=models.CASCADE, related_name='ai_analysis')
+    fingerprint = models.CharField(
+        max_length=64, db_index=True, help_text="PMOAIEngine.risk_fingerprint() of the data analyzed"
+    )
+    model = models.CharField(max_length=100)
+    result = models.JSONField(help_text="analyze_risk() result")
+    
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'risk analyses'
+    
+    def __str__(self):
+        return f"Analysis of {self.risk_id}"
+    
+    @classmethod
+    def store(cls, risk_id, fingerprint, model, result):
+        """Save a successful analyze_risk() result as the risk's analysis"""
+        result = {key: value for key, value in result.items() if key not in ('cached', 'coalesced')}
+        return cls.objects.update_or_create(
+            risk_id=risk_id, defaults={'fingerprint': fingerprint, 'model': model, 'result': result}
+        )[0]
+    
+    def response(self):
+        """The analysis as returned by the risk analysis endpoint"""
+        return {**self.result, 'stored': True, 'analyzed_at': self.updated_at.isoformat()}
+
+
+class AIInsight(models.Model):
+    """
+    One generated version of an AI insight about a subject. The newest version
+    is served, flagged as stale once the subject's data has changed; older
+    versions are kept for audit until pruned (see ai_engine.insights)
+    """
+    
+    KIND_CHOICES = [
+        ('project_summary', 'Project summary'),
+        ('portfolio_summary', 'Portfolio summary'),
+    ]
+    
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    subject = models.CharField(max_length=50, help_text="What the insight is about, e.g. 'project:12' or 'portfolio'")
+    fingerprint = models.CharField(max_length=64, help_text="PMOAIEngine.fingerprint() of the prompt answered")
+    model = models.CharField(max_length=100)
+    result = models.JSONField()
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='ai_insights',
+        help_text="User whose request generated it; empty for background regenerations"
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['kind', 'subject', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} of {self.subject} ({self.created_at:%Y-%m-%d %H:%M})"
+    
+    def response(self, stale=False):
+        """The insight as returned by its endpoint"""
+        return {**self.result, 'stored': True, 'stale': stale, 'generated_at': self.created_at.isoformat()}
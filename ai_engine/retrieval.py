@@ -0,0 +1,340 @@
+"""
+Local retrieval index for the records sent with a PMO question.
+
+Projects, risks, tasks and issues are indexed by their names and
+descriptions as BM25-weighted sparse term vectors, kept as numpy arrays in
+CSR layout (one row per record). search() scores every record against a
+question in a few vectorized operations, without any API call, so
+PMOQuestionView sends the records the question is about rather than the
+newest projects.
+
+Each process keeps one index:
+
+- it is loaded from AI_RETRIEVAL_INDEX_PATH on first use, then brought up to
+  date by re-reading only the records updated since the newest one indexed;
+- saves and deletes in this process update it once their transaction
+  commits (see ai_engine.signals);
+- writes in other processes bump the shared data version (projects.cache),
+  after which the next search re-reads the records updated since, which is
+  usually none;
+- records deleted by other processes are dropped by a sweep of the primary
+  keys every AI_RETRIEVAL_SWEEP_INTERVAL seconds.
+
+Searches never write the file: manage.py retrieval_index brings it up to
+date and saves it (Render runs it at build time), so a new worker starts
+from the saved index instead of re-reading every record.
+"""
+import logging
+import os
+import re
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+import numpy as np
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.db import connection
+from django.dispatch import receiver
+from projects.cache import get_data_version
+from projects.models import Project, Risk, Task, Issue
+
+logger = logging.getLogger(__name__)
+
+# BM25 term frequency saturation and document length normalization
+K1 = 1.2
+B = 0.75
+
+# Bumped when the saved file layout changes; older files are ignored
+INDEX_FORMAT = 1
+
+# Seconds before the newest indexed updated_at that a sync re-reads, for rows
+# committed after a sync with an older updated_at
+SYNC_OVERLAP = 60
+
+# kind -> (model, indexed fields)
+SOURCES = {
+    'project': (Project, ('name', 'code', 'description')),
+    'risk': (Risk, ('title', 'description', 'category', 'mitigation_plan')),
+    'task': (Task, ('name', 'description')),
+    'issue': (Issue, ('title', 'description', 'category')),
+}
+KINDS = {model: kind for kind, (model, _) in SOURCES.items()}
+
+STOP_WORDS = frozenset("""
+a about all an and any are as at be been by can do does for from has have how i if in is it its
+me my no not of on or our should so than that the their them there these they this to up was we
+were what when where which who why will with would you your
+""".split())
+
+_WORD_RE = re.compile(r'\w+')
+
+_lock = threading.Lock()
+# [pid, RetrievalIndex, data version it was synced at, monotonic time of the last sweep]
+# of the process that loaded the index
+_current = None
+
+
+def _stem(word: str) -> str:
+    """Strip common English inflections so 'delayed', 'delays' and 'delay' match"""
+    for suffix in ('ing', 'ed', 's'):
+        if word.endswith(suffix) and len(word) > len(suffix) + 3 and not word.endswith('ss'):
+            return word[:-len(suffix)]
+    return word
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(word) for word in _WORD_RE.findall(text.lower()) if len(word) > 1 and word not in STOP_WORDS]
+
+
+class RetrievalIndex:
+    """BM25 index of text documents keyed by strings such as 'risk:12'"""
+
+    def __init__(self):
+        # term -> column
+        self.vocabulary = {}
+        # key -> (columns, counts, stamp); stamp tells whether the source record changed
+        self.documents = {}
+        # kind -> newest updated_at indexed; sync_index() re-reads the records updated since
+        self.synced_to = {}
+        self._matrix = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.documents)
+
+    def stamp(self, key: str) -> Optional[str]:
+        document = self.documents.get(key)
+        return document[2] if document else None
+
+    def add(self, key: str, text: str, stamp: str = ''):
+        """Index (or re-index) a document"""
+        with self._lock:
+            terms = [self.vocabulary.setdefault(term, len(self.vocabulary)) for term in tokenize(text)]
+            columns, counts = np.unique(np.array(terms, dtype=np.int32), return_counts=True)
+            self.documents[key] = (columns.astype(np.int32), counts.astype(np.float32), stamp)
+            self._matrix = None
+
+    def remove(self, key: str):
+        with self._lock:
+            if self.documents.pop(key, None) is not None:
+                self._matrix = None
+
+    def _compiled(self):
+        """(keys, columns, weights, rows): the BM25 weight of every nonzero term, in CSR order"""
+        if self._matrix is not None:
+            return self._matrix
+        keys = list(self.documents)
+        documents = [self.documents[key] for key in keys]
+        columns = np.concatenate([document[0] for document in documents]) if documents else np.zeros(0, np.int32)
+        counts = np.concatenate([document[1] for document in documents]) if documents else np.zeros(0, np.float32)
+        sizes = np.array([len(document[0]) for document in documents], dtype=np.int64)
+        rows = np.repeat(np.arange(len(keys)), sizes)
+
+        lengths = np.bincount(rows, weights=counts, minlength=len(keys))
+        average = lengths.mean() if len(keys) else 0.0
+        frequency = np.bincount(columns, minlength=len(self.vocabulary))
+        idf = np.log1p((len(keys) - frequency + 0.5) / (frequency + 0.5))
+        norms = K1 * (1 - B + B * lengths / average) if average else np.full(len(keys), K1)
+        weights = idf[columns] * counts * (K1 + 1) / (counts + norms[rows])
+
+        self._matrix = (keys, columns, weights, rows)
+        return self._matrix
+
+    def search(self, query: str, k: int = 10) -> List[Tuple[str, float]]:
+        """The `k` best matching (key, score) pairs, best first"""
+        with self._lock:
+            terms = {self.vocabulary[term] for term in tokenize(query) if term in self.vocabulary}
+            if not terms:
+                return []
+            keys, columns, weights, rows = self._compiled()
+            hits = np.isin(columns, list(terms))
+            scores = np.bincount(rows[hits], weights=weights[hits], minlength=len(keys))
+        best = np.argsort(-scores, kind='stable')[:k]
+        return [(keys[row], float(scores[row])) for row in best if scores[row] > 0]
+
+    def save(self, path: str, database: str = ''):
+        """Write the index to `path` atomically"""
+        with self._lock:
+            keys = list(self.documents)
+            documents = [self.documents[key] for key in keys]
+            terms = sorted(self.vocabulary, key=self.vocabulary.get)
+            indptr = np.zeros(len(keys) + 1, dtype=np.int64)
+            np.cumsum([len(document[0]) for document in documents], out=indptr[1:])
+            arrays = {
+                'format': np.array(INDEX_FORMAT),
+                'database': np.array(database),
+                'keys': np.array(keys, dtype=str),
+                'stamps': np.array([document[2] for document in documents], dtype=str),
+                'terms': np.array(terms, dtype=str),
+                'indptr': indptr,
+                'columns': np.concatenate([document[0] for document in documents]) if documents else np.zeros(0, np.int32),
+                'counts': np.concatenate([document[1] for document in documents]) if documents else np.zeros(0, np.float32),
+            }
+        temporary = f'{path}.{os.getpid()}.tmp'
+        with open(temporary, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path: str, database: str = '') -> Optional['RetrievalIndex']:
+        """The index saved at `path`, or None if it was saved for another database or format"""
+        with np.load(path, allow_pickle=False) as data:
+            if int(data['format']) != INDEX_FORMAT or str(data['database']) != database:
+                return None
+            index = cls()
+            index.vocabulary = {term: column for column, term in enumerate(data['terms'].tolist())}
+            indptr, columns, counts = data['indptr'], data['columns'], data['counts']
+            for row, (key, stamp) in enumerate(zip(data['keys'].tolist(), data['stamps'].tolist())):
+                start, end = indptr[row], indptr[row + 1]
+                index.documents[key] = (columns[start:end], counts[start:end], stamp)
+                if stamp:
+                    kind = key.split(':', 1)[0]
+                    updated_at = datetime.fromisoformat(stamp)
+                    if kind not in index.synced_to or updated_at > index.synced_to[kind]:
+                        index.synced_to[kind] = updated_at
+        return index
+
+
+def document_key(kind: str, pk) -> str:
+    return f'{kind}:{pk}'
+
+
+def _stamp(updated_at) -> str:
+    return updated_at.isoformat() if updated_at else ''
+
+
+def _text(instance, fields) -> str:
+    return '\n'.join(str(getattr(instance, field) or '') for field in fields)
+
+
+def sync_index(index: RetrievalIndex) -> int:
+    """Re-index the records updated since the last sync; returns the number re-indexed"""
+    changes = 0
+    for kind, (model, fields) in SOURCES.items():
+        records = model.objects.only('updated_at', *fields)
+        since = index.synced_to.get(kind)
+        if since is not None:
+            records = records.filter(updated_at__gte=since - timedelta(seconds=SYNC_OVERLAP))
+        for instance in records.iterator(chunk_size=500):
+            key = document_key(kind, instance.pk)
+            stamp = _stamp(instance.updated_at)
+            if index.stamp(key) != stamp:
+                index.add(key, _text(instance, fields), stamp)
+                changes += 1
+            if instance.updated_at and (since is None or instance.updated_at > since):
+                since = instance.updated_at
+        if since is not None:
+            index.synced_to[kind] = since
+    return changes
+
+
+def sweep_index(index: RetrievalIndex) -> int:
+    """Drop the documents of deleted records; returns the number dropped"""
+    live = set()
+    for kind, (model, _) in SOURCES.items():
+        live.update(document_key(kind, pk) for pk in model.objects.values_list('pk', flat=True).iterator())
+    deleted = [key for key in list(index.documents) if key not in live]
+    for key in deleted:
+        index.remove(key)
+    return len(deleted)
+
+
+def _database() -> str:
+    return f"{connection.vendor}:{connection.settings_dict['NAME']}"
+
+
+def _load() -> RetrievalIndex:
+    path = getattr(settings, 'AI_RETRIEVAL_INDEX_PATH', None)
+    if path and os.path.exists(path):
+        try:
+            index = RetrievalIndex.load(path, _database())
+            if index is not None:
+                return index
+        except Exception as e:
+            logger.warning(f"Ignoring unreadable retrieval index {path}: {str(e)}")
+    return RetrievalIndex()
+
+
+def _sweep_due(state) -> bool:
+    return time.monotonic() - state[3] >= getattr(settings, 'AI_RETRIEVAL_SWEEP_INTERVAL', 600)
+
+
+def get_index() -> RetrievalIndex:
+    """
+    The index of this process, loaded on first use, synced whenever the data
+    version changed and swept for deletions every AI_RETRIEVAL_SWEEP_INTERVAL
+    """
+    global _current
+    pid = os.getpid()
+    # Read before syncing: a write during the sync bumps it again
+    version = get_data_version()
+    state = _current
+    if state is not None and state[0] == pid and state[2] == version and not _sweep_due(state):
+        return state[1]
+    with _lock:
+        if _current is None or _current[0] != pid:
+            # Never swept: a saved index may still hold records deleted since it was written
+            _current = [pid, _load(), None, float('-inf')]
+        state = _current
+        if state[2] != version:
+            sync_index(state[1])
+            state[2] = version
+        if _sweep_due(state):
+            sweep_index(state[1])
+            state[3] = time.monotonic()
+        return state[1]
+
+
+def save_index(rebuild: bool = False) -> RetrievalIndex:
+    """
+    Bring the index fully up to date (from scratch with rebuild) and save it to
+    AI_RETRIEVAL_INDEX_PATH; used by manage.py retrieval_index, off the request path
+    """
+    global _current
+    with _lock:
+        version = get_data_version()
+        index = RetrievalIndex() if rebuild else _load()
+        sync_index(index)
+        sweep_index(index)
+        path = getattr(settings, 'AI_RETRIEVAL_INDEX_PATH', None)
+        if path:
+            index.save(path, _database())
+        _current = [os.getpid(), index, version, time.monotonic()]
+    return index
+
+
+def search(query: str, k: int = 10) -> List[Tuple[str, int, float]]:
+    """The `k` records best matching `query` as (kind, pk, score), best first"""
+    results = []
+    for key, score in get_index().search(query, k):
+        kind, pk = key.split(':', 1)
+        results.append((kind, int(pk), score))
+    return results
+
+
+def _loaded_index() -> Optional[RetrievalIndex]:
+    state = _current
+    return state[1] if state is not None and state[0] == os.getpid() else None
+
+
+def index_record(instance):
+    """Re-index a saved record, if this process has loaded the index"""
+    index = _loaded_index()
+    if index is not None:
+        kind = KINDS[type(instance)]
+        fields = SOURCES[kind][1]
+        index.add(document_key(kind, instance.pk), _text(instance, fields), _stamp(instance.updated_at))
+
+
+def unindex_record(key: str):
+    index = _loaded_index()
+    if index is not None:
+        index.remove(key)
+
+
+@receiver(setting_changed)
+def _reset_on_setting_change(setting, **kwargs):
+    global _current
+    if setting.startswith('AI_RETRIEVAL'):
+        _current = None
@@ -1,21 +1,118 @@
+import hashlib
 import json
-from typing import Dict, List, Any, Optional
-from decimal import Decimal
+import time
+from typing import AsyncIterator, Dict, Iterator, List, Any, NamedTuple, Optional, Tuple
 from django.conf import settings
+from django.core.cache import cache
+from django.utils import timezone
+from projects.cache import incr_counter
+from .client import get_async_client, get_client_state
+from .context import build_context, context_budget, estimate_tokens
+from .governor import GovernorBusy, get_governor
+from .metrics import instrumented
 import logging
 
 logger = logging.getLogger(__name__)
 
+RESPONSE_CACHE_PREFIX = 'ai:response'
+RESPONSE_STATS_PREFIX = 'ai:stats:response'
+RESPONSE_OUTCOMES = ('hits', 'misses', 'refreshes')
+PROMPT_CACHE_STATS_PREFIX = 'ai:stats:prompt_cache'
+# Input token counters of the API's usage, see record_usage()
+PROMPT_CACHE_USAGE = ('input_tokens', 'cache_creation_input_tokens', 'cache_read_input_tokens')
+CACHE_CONTROL = {'type': 'ephemeral'}
 
-def convert_decimals(obj):
-    """Convert Decimal objects to float for JSON serialization"""
-    if isinstance(obj, Decimal):
-        return float(obj)
-    elif isinstance(obj, dict):
-        return {key: convert_decimals(value) for key, value in obj.items()}
-    elif isinstance(obj, list):
-        return [convert_decimals(item) for item in obj]
-    return obj
+
+class Prompt(NamedTuple):
+    """
+    A user message: the endpoint's fixed instructions, sent first and marked
+    for prompt caching, then the data of this request
+    """
+    instructions: str
+    data: str
+
+
+def usage_dict(usage) -> Dict[str, int]:
+    """Token counts of an API usage object, including prompt cache reads and writes"""
+    counts = {'input_tokens': usage.input_tokens, 'output_tokens': usage.output_tokens}
+    for field in ('cache_creation_input_tokens', 'cache_read_input_tokens'):
+        counts[field] = getattr(usage, field, None) or 0
+    return counts
+
+
+def record_usage(usage: Dict[str, int]):
+    """Add a response's uncached, cache-write and cache-read input tokens to the shared counters"""
+    for field in PROMPT_CACHE_USAGE:
+        if usage.get(field):
+            incr_counter(f'{PROMPT_CACHE_STATS_PREFIX}:{field}', usage[field])
+
+
+def get_prompt_cache_stats() -> Dict[str, Any]:
+    """Input tokens read from, written to and not covered by the API's prompt cache"""
+    values = cache.get_many([f'{PROMPT_CACHE_STATS_PREFIX}:{field}' for field in PROMPT_CACHE_USAGE])
+    stats = {field: values.get(f'{PROMPT_CACHE_STATS_PREFIX}:{field}', 0) for field in PROMPT_CACHE_USAGE}
+    total = sum(stats.values())
+    stats['cache_read_ratio'] = round(stats['cache_read_input_tokens'] / total, 3) if total else None
+    stats['enabled'] = getattr(settings, 'AI_PROMPT_CACHE', True)
+    return stats
+
+
+def get_response_cache_stats() -> Dict[str, Any]:
+    """Hit/miss/refresh counters of the AI response cache"""
+    values = cache.get_many([f'{RESPONSE_STATS_PREFIX}:{outcome}' for outcome in RESPONSE_OUTCOMES])
+    stats = {outcome: values.get(f'{RESPONSE_STATS_PREFIX}:{outcome}', 0) for outcome in RESPONSE_OUTCOMES}
+    lookups = stats['hits'] + stats['misses']
+    stats['hit_rate'] = round(stats['hits'] / lookups, 3) if lookups else None
+    stats['ttl'] = getattr(settings, 'AI_CACHE_TTL', 3600)
+    return stats
+
+
+class StreamRecorder:
+    """Collects the text, token usage and timings of a Messages API event stream"""
+    
+    def __init__(self, model: str):
+        self.model = model
+        self.started = time.monotonic()
+        self.parts = []
+        self.usage = {}
+        self.stop_reason = None
+        self.first_token_ms = None
+    
+    def _elapsed_ms(self) -> int:
+        return round((time.monotonic() - self.started) * 1000)
+    
+    def feed(self, event) -> Optional[str]:
+        """Record one stream event; returns its text, if it carries any"""
+        if event.type == 'message_start':
+            usage = event.message.usage
+            self.usage['input_tokens'] = usage.input_tokens
+            for field in ('cache_creation_input_tokens', 'cache_read_input_tokens'):
+                self.usage[field] = getattr(usage, field, None) or 0
+        elif event.type == 'content_block_delta' and getattr(event.delta, 'text', None):
+            if self.first_token_ms is None:
+                self.first_token_ms = self._elapsed_ms()
+            self.parts.append(event.delta.text)
+            return event.delta.text
+        elif event.type == 'message_delta':
+            self.usage['output_tokens'] = event.usage.output_tokens
+            self.stop_reason = event.delta.stop_reason
+        return None
+    
+    def response(self) -> Dict[str, Any]:
+        """The streamed text as a _call_claude_api result, for the response cache"""
+        return {'response': ''.join(self.parts), 'raw_response': True, 'success': True, 'usage': self.usage}
+    
+    def summary(self, response: Dict[str, Any]) -> Dict[str, Any]:
+        """Data of the final 'done' event"""
+        return {
+            'cached': False,
+            'generated_at': response.get('generated_at'),
+            'model': self.model,
+            'stop_reason': self.stop_reason,
+            'usage': self.usage,
+            'time_to_first_token_ms': self.first_token_ms,
+            'elapsed_ms': self._elapsed_ms(),
+        }
 
 
 class PMOAIEngine:
@@ -72,54 +169,22 @@ QUALITY STANDARDS:
 • Include realistic timelines and resource needs
 • Address "what could go wrong" proactively"""
 
-    def __init__(self):
-        """Initialize AI Engine with proper configuration validation"""
-        self.api_key = getattr(settings, 'ANTHROPIC_API_KEY', None)
+    def __init__(self, user=None, governor_user=None):
+        """
+        Use the process-wide client; the API key was validated when it was created.
+        governor_user queues the calls under another name than the user's (e.g. BATCH_USER)
+        """
+        state = get_client_state()
+        self.api_key = state.api_key
         self.model = getattr(settings, 'AI_MODEL', 'claude-sonnet-4-20250514')
         self.max_tokens = getattr(settings, 'AI_MAX_TOKENS', 6000)
-        
-        # Validate configuration
-        self.demo_mode = self._check_demo_mode()
-        self.client = None
-        
-        if not self.demo_mode:
-            self._initialize_client()
-    
-    def _check_demo_mode(self) -> bool:
-        """Check if AI is in demo mode"""
-        if not self.api_key:
-            logger.warning("ANTHROPIC_API_KEY not configured")
-            return True
-        
-        if self.api_key == 'demo-mode':
-            logger.info("AI Engine running in demo mode")
-            return True
-        
-        # Check for quotes around the key (common error)
-        if self.api_key.startswith("'") or self.api_key.startswith('"'):
-            logger.error("ANTHROPIC_API_KEY has quotes around it - remove quotes in environment variable")
-            self.api_key = self.api_key.strip("'\"")  # Try to fix it automatically
-        
-        if not self.api_key.startswith('sk-ant-'):
-            logger.error(f"Invalid ANTHROPIC_API_KEY format (should start with 'sk-ant-')")
-            return True
-        
-        return False
-    
-    def _initialize_client(self):
-        """Initialize Anthropic client with error handling"""
-        try:
-            from anthropic import Anthropic
-            self.client = Anthropic(api_key=self.api_key)
-            logger.info("Anthropic client initialized successfully")
-        except ImportError:
-            logger.error("anthropic package not installed. Run: pip install anthropic")
-            self.demo_mode = True
-            self.client = None
-        except Exception as e:
-            logger.error(f"Failed to initialize Anthropic client: {str(e)}")
-            self.demo_mode = True
-            self.client = None
+        self.demo_mode = state.demo_mode
+        self.client = state.client
+        # AsyncAnthropic clients belong to an event loop; None uses the one of the running loop
+        self.async_client = None
+        self.user = user if user is not None and user.is_authenticated else None
+        # The governor queues calls per user; anonymous requests share one queue
+        self.user_key = governor_user or (f'user:{self.user.pk}' if self.user else 'anonymous')
     
     def _validate_response(self, message) -> str:
         """Validate and extract text from Claude API response"""
@@ -131,12 +196,47 @@ QUALITY STANDARDS:
         
         return message.content[0].text
     
-    def _call_claude_api(self, user_message: str, stream: bool = False) -> Dict[str, Any]:
+    def _message_params(self, prompt: Prompt) -> Dict[str, Any]:
         """
-        Call Claude API with optional streaming support and comprehensive error handling
+        Request parameters. The system prompt and the instructions are the same for
+        every call of an endpoint, so with AI_PROMPT_CACHE they are marked as cache
+        breakpoints and only the data after them is processed anew.
+        """
+        system = {"type": "text", "text": self.SYSTEM_PROMPT}
+        instructions = {"type": "text", "text": prompt.instructions}
+        if getattr(settings, 'AI_PROMPT_CACHE', True):
+            system["cache_control"] = CACHE_CONTROL
+            instructions["cache_control"] = CACHE_CONTROL
+        return {
+            "model": self.model,
+            "max_tokens": self.max_tokens,
+            "system": [system],
+            "messages": [{"role": "user", "content": [instructions, {"type": "text", "text": prompt.data}]}],
+        }
+    
+    def _message_result(self, message) -> Dict[str, Any]:
+        """Result of a completed (non-streamed) API call"""
+        result = {
+            "response": self._validate_response(message),
+            "raw_response": True,
+            "success": True
+        }
+        if getattr(message, 'usage', None) is not None:
+            result["usage"] = usage_dict(message.usage)
+            record_usage(result["usage"])
+        return result
+    
+    def _estimated_tokens(self, prompt: Prompt) -> int:
+        """Input tokens of a request, as counted against AI_TOKENS_PER_MINUTE"""
+        return sum(estimate_tokens(text) for text in (self.SYSTEM_PROMPT, prompt.instructions, prompt.data))
+    
+    def _call_claude_api(self, prompt: Prompt, stream: bool = False) -> Dict[str, Any]:
+        """
+        Call Claude API with optional streaming support and comprehensive error handling.
+        Calls wait for a governor slot; identical concurrent calls share one request.
         """
         if self.demo_mode:
-            return self._get_demo_response(user_message)
+            return self._get_demo_response(prompt)
         
         if not self.client:
             logger.error("Anthropic client not initialized")
@@ -145,72 +245,330 @@ QUALITY STANDARDS:
                 "AI client not properly initialized. Please check your ANTHROPIC_API_KEY configuration."
             )
         
-        try:
-            if stream:
-                # Streaming mode for better UX
+        if stream:
+            # Streaming mode for better UX; _stream_response() holds the governor slot while it is read
+            try:
                 return {
                     "stream": True,
-                    "stream_generator": self.client.messages.create(
-                        model=self.model,
-                        max_tokens=self.max_tokens,
-                        system=self.SYSTEM_PROMPT,
-                        messages=[{"role": "user", "content": user_message}],
-                        stream=True
-                    )
+                    "stream_generator": self.client.messages.create(**self._message_params(prompt), stream=True)
                 }
-            else:
-                # Standard mode
-                message = self.client.messages.create(
-                    model=self.model,
-                    max_tokens=self.max_tokens,
-                    system=self.SYSTEM_PROMPT,
-                    messages=[{"role": "user", "content": user_message}]
-                )
-                
-                response_text = self._validate_response(message)
-                
+            except Exception as e:
+                return self._api_error_response(e)
+        
+        governor = get_governor()
+        flight_key = self.fingerprint(prompt)
+        flight, leader = governor.join(flight_key)
+        if not leader:
+            shared = governor.wait(flight_key, flight)
+            # None: the leader gave up or was lost without a result, so make the call after all
+            if shared is not None:
+                return {**shared, "coalesced": True}
+        
+        result = None
+        try:
+            with governor.slot(self.user_key, self._estimated_tokens(prompt)):
+                message = self.client.messages.create(**self._message_params(prompt))
+            result = self._message_result(message)
+        except Exception as e:
+            result = self._api_error_response(e)
+        finally:
+            if leader:
+                governor.leave(flight_key, flight, result)
+        return result
+    
+    async def _acall_claude_api(self, prompt: Prompt, stream: bool = False) -> Dict[str, Any]:
+        """_call_claude_api on the event loop, with the AsyncAnthropic client of the running loop"""
+        if self.demo_mode:
+            return self._get_demo_response(prompt)
+        
+        client = self.async_client or get_async_client()
+        if not client:
+            logger.error("Anthropic client not initialized")
+            return self._get_error_response(
+                "Configuration Error",
+                "AI client not properly initialized. Please check your ANTHROPIC_API_KEY configuration."
+            )
+        
+        if stream:
+            try:
                 return {
-                    "response": response_text,
-                    "raw_response": True,
-                    "success": True
+                    "stream": True,
+                    "stream_generator": await client.messages.create(**self._message_params(prompt), stream=True)
                 }
+            except Exception as e:
+                return self._api_error_response(e)
         
-        except ImportError as e:
+        governor = get_governor()
+        flight_key = self.fingerprint(prompt)
+        flight, leader = governor.join(flight_key)
+        if not leader:
+            shared = await governor.await_flight(flight_key, flight)
+            if shared is not None:
+                return {**shared, "coalesced": True}
+        
+        result = None
+        try:
+            async with governor.aslot(self.user_key, self._estimated_tokens(prompt)):
+                message = await client.messages.create(**self._message_params(prompt))
+            result = self._message_result(message)
+        except Exception as e:
+            result = self._api_error_response(e)
+        finally:
+            if leader:
+                governor.leave(flight_key, flight, result)
+        return result
+    
+    def _api_error_response(self, e: Exception) -> Dict[str, Any]:
+        """Error result with a user-friendly message for an exception raised by an API call"""
+        if isinstance(e, ImportError):
             logger.error(f"Missing dependency: {str(e)}")
             return self._get_error_response(
                 "Configuration Error",
                 "The 'anthropic' package is not installed. Please install it with: pip install anthropic"
             )
         
-        except Exception as e:
-            error_type = type(e).__name__
-            error_msg = str(e)
-            
-            logger.error(f"[AI Error] {error_type}: {error_msg}")
+        error_type = type(e).__name__
+        error_msg = str(e)
+        
+        logger.error(f"[AI Error] {error_type}: {error_msg}")
+        
+        # Provide user-friendly error messages based on error type
+        if isinstance(e, GovernorBusy):
+            user_message = "❌ The AI service is busy right now. Please try again in a moment."
+        elif "authentication" in error_msg.lower() or "api_key" in error_msg.lower():
+            user_message = "❌ Authentication failed. Please verify your ANTHROPIC_API_KEY is correct and active."
+        elif "rate_limit" in error_msg.lower() or "429" in error_msg:
+            user_message = "❌ Rate limit exceeded. Please wait a moment and try again."
+        elif "timeout" in error_msg.lower():
+            user_message = "❌ Request timed out. Please try again."
+        elif "connection" in error_msg.lower() or "network" in error_msg.lower():
+            user_message = "❌ Network error. Please check your connection and try again."
+        elif "invalid" in error_msg.lower() and "key" in error_msg.lower():
+            user_message = "❌ Invalid API key. Please check your ANTHROPIC_API_KEY configuration."
+        else:
+            user_message = f"❌ Sorry, I encountered an error: {error_msg}"
+        
+        return {
+            "error": True,
+            "error_type": error_type,
+            "error_message": error_msg,
+            "response": user_message,
+            "success": False
+        }
+    
+    def fingerprint(self, prompt: Prompt) -> str:
+        """Hash of everything that determines the response: model, max_tokens, system prompt and prompt"""
+        material = json.dumps({
+            'model': self.model,
+            'max_tokens': self.max_tokens,
+            'system': self.SYSTEM_PROMPT,
+            'instructions': prompt.instructions,
+            'data': prompt.data,
+        }, sort_keys=True)
+        return hashlib.sha256(material.encode('utf-8')).hexdigest()
+    
+    def _cache_key(self, prompt: Prompt) -> Optional[str]:
+        """Response cache key, or None when caching is off (demo mode or AI_CACHE_TTL = 0)"""
+        if self.demo_mode or not getattr(settings, 'AI_CACHE_TTL', 3600):
+            return None
+        return f'{RESPONSE_CACHE_PREFIX}:{self.fingerprint(prompt)}'
+    
+    def _cache_lookup(self, key: Optional[str], refresh: bool) -> Optional[Dict[str, Any]]:
+        if key is None:
+            return None
+        if refresh:
+            incr_counter(f'{RESPONSE_STATS_PREFIX}:refreshes')
+            return None
+        entry = cache.get(key)
+        incr_counter(f'{RESPONSE_STATS_PREFIX}:{"hits" if entry is not None else "misses"}')
+        return entry
+    
+    def _cache_store(self, key: Optional[str], result: Dict[str, Any]):
+        result['generated_at'] = timezone.now().isoformat()
+        if key is not None:
+            cache.set(key, result, getattr(settings, 'AI_CACHE_TTL', 3600))
+    
+    def _call_cached(self, prompt: Prompt, refresh: bool = False) -> Dict[str, Any]:
+        """
+        _call_claude_api with a shared response cache keyed by fingerprint().
+        Only successful responses are stored; refresh skips the lookup but stores the new response.
+        """
+        key = self._cache_key(prompt)
+        entry = self._cache_lookup(key, refresh)
+        if entry is not None:
+            return {**entry, 'cached': True}
+        
+        result = self._call_claude_api(prompt)
+        if result.get('success'):
+            self._cache_store(key, result)
+        return {**result, 'cached': False}
+    
+    async def _acall_cached(self, prompt: Prompt, refresh: bool = False) -> Dict[str, Any]:
+        # Cache calls are short and safe on the event loop (Django's a* cache methods only wrap them)
+        key = self._cache_key(prompt)
+        entry = self._cache_lookup(key, refresh)
+        if entry is not None:
+            return {**entry, 'cached': True}
+        
+        result = await self._acall_claude_api(prompt)
+        if result.get('success'):
+            self._cache_store(key, result)
+        return {**result, 'cached': False}
+    
+    def _cached_events(self, entry: Dict[str, Any], coalesced: bool = False) -> List[Tuple[str, Dict[str, Any]]]:
+        """
+        A cached response, or the result of an identical request in flight
+        (coalesced), replayed as one delta and the done event
+        """
+        if not entry.get('success'):
+            return [self._stream_failed(entry)]
+        done = {
+            'cached': not coalesced,
+            'generated_at': entry.get('generated_at'),
+            'model': self.model,
+            'usage': entry.get('usage'),
+        }
+        if coalesced:
+            done['coalesced'] = True
+        return [('delta', {'text': entry['response']}), ('done', done)]
+    
+    def _stream_failed(self, result: Dict[str, Any]) -> Tuple[str, Dict[str, Any]]:
+        return 'error', {
+            'error_type': result.get('error_type'),
+            'message': result.get('response', 'AI service temporarily unavailable'),
+        }
+    
+    def _stream_interrupted(self, e: Exception) -> Tuple[str, Dict[str, Any]]:
+        logger.error(f"[AI Stream Error] {type(e).__name__}: {str(e)}")
+        return 'error', {
+            'error_type': type(e).__name__,
+            'message': '❌ The response was interrupted. Please try again.',
+        }
+    
+    def _stream_response(self, prompt: Prompt, refresh: bool = False,
+                         use_cache: bool = True) -> Iterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Stream a response as ('delta', {'text'}) events and a final ('done', {...})
+        event with usage and timings, or an ('error', {...}) event.
+        Cached responses are replayed as one delta; completed streams are cached.
+        Callers of an identical stream in flight wait for it and get its result replayed.
+        """
+        recorder = StreamRecorder(self.model)
+        key = self._cache_key(prompt) if use_cache else None
+        entry = self._cache_lookup(key, refresh)
+        if entry is not None:
+            yield from self._cached_events(entry)
+            return
+        
+        governor = get_governor()
+        flight_key = self.fingerprint(prompt)
+        flight, leader = governor.join(flight_key)
+        if not leader:
+            shared = governor.wait(flight_key, flight)
+            if shared is not None:
+                yield from self._cached_events(shared, coalesced=True)
+                return
+        
+        # Result shared with the callers that joined the flight
+        outcome = None
+        try:
+            with governor.slot(self.user_key, self._estimated_tokens(prompt)):
+                result = self._call_claude_api(prompt, stream=True)
+                if not result.get('stream'):
+                    outcome = result
+                    yield self._stream_failed(result)
+                    return
+                
+                events = result['stream_generator']
+                try:
+                    for event in events:
+                        text = recorder.feed(event)
+                        if text:
+                            yield 'delta', {'text': text}
+                except Exception as e:
+                    error = self._stream_interrupted(e)
+                    outcome = {'success': False, 'error_type': error[1]['error_type'], 'response': error[1]['message']}
+                    yield error
+                    return
+                finally:
+                    # Also reached when the client disconnects: release the API connection
+                    close = getattr(events, 'close', None)
+                    if close:
+                        close()
             
-            # Provide user-friendly error messages based on error type
-            if "authentication" in error_msg.lower() or "api_key" in error_msg.lower():
-                user_message = "❌ Authentication failed. Please verify your ANTHROPIC_API_KEY is correct and active."
-            elif "rate_limit" in error_msg.lower() or "429" in error_msg:
-                user_message = "❌ Rate limit exceeded. Please wait a moment and try again."
-            elif "timeout" in error_msg.lower():
-                user_message = "❌ Request timed out. Please try again."
-            elif "connection" in error_msg.lower() or "network" in error_msg.lower():
-                user_message = "❌ Network error. Please check your connection and try again."
-            elif "invalid" in error_msg.lower() and "key" in error_msg.lower():
-                user_message = "❌ Invalid API key. Please check your ANTHROPIC_API_KEY configuration."
-            else:
-                user_message = f"❌ Sorry, I encountered an error: {error_msg}"
+            response = recorder.response()
+            record_usage(recorder.usage)
+            self._cache_store(key, response)
+            outcome = response
+        except GovernorBusy as e:
+            outcome = self._api_error_response(e)
+            yield self._stream_failed(outcome)
+            return
+        finally:
+            if leader:
+                governor.leave(flight_key, flight, outcome)
+        yield 'done', recorder.summary(response)
+    
+    async def _astream_response(self, prompt: Prompt, refresh: bool = False,
+                                use_cache: bool = True) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """_stream_response as an async generator, for StreamingHttpResponse under ASGI"""
+        recorder = StreamRecorder(self.model)
+        key = self._cache_key(prompt) if use_cache else None
+        entry = self._cache_lookup(key, refresh)
+        if entry is not None:
+            for event in self._cached_events(entry):
+                yield event
+            return
+        
+        governor = get_governor()
+        flight_key = self.fingerprint(prompt)
+        flight, leader = governor.join(flight_key)
+        if not leader:
+            shared = await governor.await_flight(flight_key, flight)
+            if shared is not None:
+                for event in self._cached_events(shared, coalesced=True):
+                    yield event
+                return
+        
+        outcome = None
+        try:
+            async with governor.aslot(self.user_key, self._estimated_tokens(prompt)):
+                result = await self._acall_claude_api(prompt, stream=True)
+                if not result.get('stream'):
+                    outcome = result
+                    yield self._stream_failed(result)
+                    return
+                
+                events = result['stream_generator']
+                try:
+                    async for event in events:
+                        text = recorder.feed(event)
+                        if text:
+                            yield 'delta', {'text': text}
+                except Exception as e:
+                    error = self._stream_interrupted(e)
+                    outcome = {'success': False, 'error_type': error[1]['error_type'], 'response': error[1]['message']}
+                    yield error
+                    return
+                finally:
+                    close = getattr(events, 'close', None) or getattr(events, 'aclose', None)
+                    if close:
+                        await close()
             
-            return {
-                "error": True,
-                "error_type": error_type,
-                "error_message": error_msg,
-                "response": user_message,
-                "success": False
-            }
+            response = recorder.response()
+            record_usage(recorder.usage)
+            self._cache_store(key, response)
+            outcome = response
+        except GovernorBusy as e:
+            outcome = self._api_error_response(e)
+            yield self._stream_failed(outcome)
+            return
+        finally:
+            if leader:
+                governor.leave(flight_key, flight, outcome)
+        yield 'done', recorder.summary(response)
     
-    def _get_demo_response(self, user_message: str) -> Dict[str, Any]:
+    def _get_demo_response(self, prompt: Prompt) -> Dict[str, Any]:
         """Generate demo response when API is not configured"""
         return {
             "response": """## 🔴 Demo Mode Response
@@ -271,15 +629,10 @@ QUALITY STANDARDS:
             "api_key_prefix": self.api_key[:10] if self.api_key and self.api_key != 'demo-mode' else None
         }
     
-    def generate_project_summary(self, project_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Generate AI summary for a single project - OPTIMIZED"""
-        project_data = convert_decimals(project_data)
-        
+    def _generate_project_summary_prompt(self, project_data: Dict[str, Any]) -> Prompt:
         # BALANCED PROMPT - meaningful depth without verbosity
-        prompt = f"""Analyze this project and provide focused, actionable insights.
-
-PROJECT DATA:
-{json.dumps(project_data, indent=2)}
+        return Prompt(
+            instructions="""Analyze the project below and provide focused, actionable insights.
 
 Provide analysis covering:
 
@@ -314,18 +667,29 @@ Brief analysis with mitigation approach for each.
 ## Immediate Actions (This Week)
 Top 3-5 specific tasks with owners.
 
-Target: Thorough but focused analysis (800-1200 words). Be specific and actionable."""
-        
-        return self._call_claude_api(prompt)
+Target: Thorough but focused analysis (800-1200 words). Be specific and actionable.""",
+            data=build_context([('PROJECT DATA', project_data)], context_budget('project_summary')),
+        )
     
-    def generate_portfolio_summary(self, portfolio_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Generate portfolio-level executive summary - OPTIMIZED"""
-        portfolio_data = convert_decimals(portfolio_data)
-        
-        prompt = f"""Provide executive portfolio analysis with strategic focus.
-
-PORTFOLIO DATA:
-{json.dumps(portfolio_data, indent=2)}
+    @instrumented('generate_project_summary')
+    def generate_project_summary(self, project_data: Dict[str, Any], refresh: bool = False, stream: bool = False) -> Dict[str, Any]:
+        """Generate AI summary for a single project - OPTIMIZED"""
+        prompt = self._generate_project_summary_prompt(project_data)
+        if stream:
+            return self._stream_response(prompt, refresh=refresh)
+        return self._call_cached(prompt, refresh=refresh)
+    
+    @instrumented('generate_project_summary')
+    async def agenerate_project_summary(self, project_data: Dict[str, Any], refresh: bool = False, stream: bool = False) -> Dict[str, Any]:
+        """Async generate_project_summary, for the ASGI views"""
+        prompt = self._generate_project_summary_prompt(project_data)
+        if stream:
+            return self._astream_response(prompt, refresh=refresh)
+        return await self._acall_cached(prompt, refresh=refresh)
+    
+    def _generate_portfolio_summary_prompt(self, portfolio_data: Dict[str, Any]) -> Prompt:
+        return Prompt(
+            instructions="""Provide executive portfolio analysis with strategic focus.
 
 Provide:
 
@@ -363,18 +727,29 @@ Each with:
 ## Immediate Actions (Next 2 Weeks)
 Critical decisions, interventions, and resource moves needed.
 
-Target: Strategic yet detailed analysis (1000-1500 words)."""
-        
-        return self._call_claude_api(prompt)
+Target: Strategic yet detailed analysis (1000-1500 words).""",
+            data=build_context([('PORTFOLIO DATA', portfolio_data)], context_budget('portfolio_summary')),
+        )
     
-    def analyze_risk(self, risk_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Deep risk analysis - OPTIMIZED"""
-        risk_data = convert_decimals(risk_data)
-        
-        prompt = f"""Provide thorough risk analysis for decision-making.
-
-RISK DATA:
-{json.dumps(risk_data, indent=2)}
+    @instrumented('generate_portfolio_summary')
+    def generate_portfolio_summary(self, portfolio_data: Dict[str, Any], refresh: bool = False, stream: bool = False) -> Dict[str, Any]:
+        """Generate portfolio-level executive summary - OPTIMIZED"""
+        prompt = self._generate_portfolio_summary_prompt(portfolio_data)
+        if stream:
+            return self._stream_response(prompt, refresh=refresh)
+        return self._call_cached(prompt, refresh=refresh)
+    
+    @instrumented('generate_portfolio_summary')
+    async def agenerate_portfolio_summary(self, portfolio_data: Dict[str, Any], refresh: bool = False, stream: bool = False) -> Dict[str, Any]:
+        """Async generate_portfolio_summary, for the ASGI views"""
+        prompt = self._generate_portfolio_summary_prompt(portfolio_data)
+        if stream:
+            return self._astream_response(prompt, refresh=refresh)
+        return await self._acall_cached(prompt, refresh=refresh)
+    
+    def _analyze_risk_prompt(self, risk_data: Dict[str, Any]) -> Prompt:
+        return Prompt(
+            instructions="""Provide thorough risk analysis for decision-making.
 
 Provide:
 
@@ -421,20 +796,33 @@ If risk materializes:
 ## Immediate Actions (48-72 Hours)
 Top 3-5 urgent steps with owners and expected outcomes.
 
-Target: Decision-ready analysis (700-1100 words)."""
-        
-        return self._call_claude_api(prompt)
+Target: Decision-ready analysis (700-1100 words).""",
+            data=build_context([('RISK DATA', risk_data)], context_budget('risk_analysis')),
+        )
     
-    def answer_pmo_question(self, question: str, context_data: Dict[str, Any]) -> Dict[str, Any]:
-        """Answer PMO questions - OPTIMIZED"""
-        context_data = convert_decimals(context_data)
-        
-        prompt = f"""Answer this PMO question with thorough, actionable analysis.
-
-QUESTION: "{question}"
-
-CONTEXT DATA:
-{json.dumps(context_data, indent=2)}
+    def risk_fingerprint(self, risk_data: Dict[str, Any]) -> str:
+        """fingerprint() of the analyze_risk prompt; changes whenever the risk's data does"""
+        return self.fingerprint(self._analyze_risk_prompt(risk_data))
+    
+    @instrumented('analyze_risk')
+    def analyze_risk(self, risk_data: Dict[str, Any], refresh: bool = False, stream: bool = False) -> Dict[str, Any]:
+        """Deep risk analysis - OPTIMIZED"""
+        prompt = self._analyze_risk_prompt(risk_data)
+        if stream:
+            return self._stream_response(prompt, refresh=refresh)
+        return self._call_cached(prompt, refresh=refresh)
+    
+    @instrumented('analyze_risk')
+    async def aanalyze_risk(self, risk_data: Dict[str, Any], refresh: bool = False, stream: bool = False) -> Dict[str, Any]:
+        """Async analyze_risk, for the ASGI views"""
+        prompt = self._analyze_risk_prompt(risk_data)
+        if stream:
+            return self._astream_response(prompt, refresh=refresh)
+        return await self._acall_cached(prompt, refresh=refresh)
+    
+    def _answer_pmo_question_prompt(self, question: str, context_data: Dict[str, Any]) -> Prompt:
+        return Prompt(
+            instructions="""Answer the PMO question below with thorough, actionable analysis.
 
 Provide:
 
@@ -478,18 +866,29 @@ For each: specific steps, owner, resources, timeline, expected outcome
 ## Alternative Approaches
 Brief analysis of 1-2 alternative solutions with pros/cons.
 
-Target: Comprehensive yet focused (900-1400 words)."""
-        
+Target: Comprehensive yet focused (900-1400 words).""",
+            data=f'QUESTION: "{question}"\n\n' + build_context([('CONTEXT DATA', context_data)], context_budget('pmo_question')),
+        )
+    
+    @instrumented('answer_pmo_question')
+    def answer_pmo_question(self, question: str, context_data: Dict[str, Any], stream: bool = False) -> Dict[str, Any]:
+        """Answer PMO questions - OPTIMIZED"""
+        prompt = self._answer_pmo_question_prompt(question, context_data)
+        if stream:
+            return self._stream_response(prompt, use_cache=False)
         return self._call_claude_api(prompt)
     
-    def compare_projects(self, projects_data: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Comparative project analysis - OPTIMIZED"""
-        projects_data = convert_decimals(projects_data)
-        
-        prompt = f"""Compare these projects and provide strategic portfolio insights.
-
-PROJECTS DATA:
-{json.dumps(projects_data, indent=2)}
+    @instrumented('answer_pmo_question')
+    async def aanswer_pmo_question(self, question: str, context_data: Dict[str, Any], stream: bool = False) -> Dict[str, Any]:
+        """Async answer_pmo_question, for the ASGI views"""
+        prompt = self._answer_pmo_question_prompt(question, context_data)
+        if stream:
+            return self._astream_response(prompt, use_cache=False)
+        return await self._acall_claude_api(prompt)
+    
+    def _compare_projects_prompt(self, projects_data: List[Dict[str, Any]]) -> Prompt:
+        return Prompt(
+            instructions="""Compare the projects below and provide strategic portfolio insights.
 
 Provide:
 
@@ -548,23 +947,30 @@ For each at-risk project:
 ## Immediate Actions (Next 2 Weeks)
 Critical interventions, resource moves, decisions required.
 
-Target: Strategic comparative analysis (1200-1800 words)."""
-        
+Target: Strategic comparative analysis (1200-1800 words).""",
+            data=build_context([('PROJECTS DATA', projects_data)], context_budget('compare_projects')),
+        )
+    
+    @instrumented('compare_projects')
+    def compare_projects(self, projects_data: List[Dict[str, Any]], stream: bool = False) -> Dict[str, Any]:
+        """Comparative project analysis - OPTIMIZED"""
+        prompt = self._compare_projects_prompt(projects_data)
+        if stream:
+            return self._stream_response(prompt, use_cache=False)
         return self._call_claude_api(prompt)
     
-    def generate_executive_report(self, portfolio_data: Dict[str, Any], 
-                                 projects_data: List[Dict[str, Any]]) -> Dict[str, Any]:
-        """Generate C-level executive report - OPTIMIZED"""
-        portfolio_data = convert_decimals(portfolio_data)
-        projects_data = convert_decimals(projects_data)
-        
-        prompt = f"""Generate executive PMO report for C-level/board presentation.
-
-PORTFOLIO DATA:
-{json.dumps(portfolio_data, indent=2)}
-
-KEY PROJECTS:
-{json.dumps(projects_data, indent=2)}
+    @instrumented('compare_projects')
+    async def acompare_projects(self, projects_data: List[Dict[str, Any]], stream: bool = False) -> Dict[str, Any]:
+        """Async compare_projects, for the ASGI views"""
+        prompt = self._compare_projects_prompt(projects_data)
+        if stream:
+            return self._astream_response(prompt, use_cache=False)
+        return await self._acall_claude_api(prompt)
+    
+    def _generate_executive_report_prompt(self, portfolio_data: Dict[str, Any],
+                                          projects_data: List[Dict[str, Any]]) -> Prompt:
+        return Prompt(
+            instructions="""Generate executive PMO report for C-level/board presentation.
 
 Provide:
 
@@ -640,6 +1046,24 @@ For each decision:
 • Anticipated challenges and opportunities
 • Investment needs and organizational readiness
 
-Target: Presentation-ready executive report (1800-2500 words)."""
-        
-        return self._call_claude_api(prompt)
\ No newline at end of file
+Target: Presentation-ready executive report (1800-2500 words).""",
+            data=build_context([('PORTFOLIO DATA', portfolio_data), ('KEY PROJECTS', projects_data)], context_budget('executive_report')),
+        )
+    
+    @instrumented('generate_executive_report')
+    def generate_executive_report(self, portfolio_data: Dict[str, Any], 
+                                 projects_data: List[Dict[str, Any]], refresh: bool = False, stream: bool = False) -> Dict[str, Any]:
+        """Generate C-level executive report - OPTIMIZED"""
+        prompt = self._generate_executive_report_prompt(portfolio_data, projects_data)
+        if stream:
+            return self._stream_response(prompt, refresh=refresh)
+        return self._call_cached(prompt, refresh=refresh)
+    
+    @instrumented('generate_executive_report')
+    async def agenerate_executive_report(self, portfolio_data: Dict[str, Any],
+                                         projects_data: List[Dict[str, Any]], refresh: bool = False, stream: bool = False) -> Dict[str, Any]:
+        """Async generate_executive_report, for the ASGI views"""
+        prompt = self._generate_executive_report_prompt(portfolio_data, projects_data)
+        if stream:
+            return self._astream_response(prompt, refresh=refresh)
+        return await self._acall_cached(prompt, refresh=refresh)
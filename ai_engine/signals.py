@@ -0,0 +1,23 @@
+from django.db import transaction
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from projects.models import Project, Risk, Task, Issue
+from .retrieval import KINDS, document_key, index_record, unindex_record
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Risk)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Issue)
+def update_retrieval_index(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: index_record(instance))
+
+
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Risk)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Issue)
+def remove_from_retrieval_index(sender, instance, **kwargs):
+    key = document_key(KINDS[sender], instance.pk)
+    transaction.on_commit(lambda: unindex_record(key))
@@ -0,0 +1,62 @@
+"""
+Server-Sent Events for streamed AI responses.
+
+Views pass the (event, data) pairs from PMOAIEngine's stream=True methods to
+sse_response(). The body is one `delta` event per text fragment, then a
+`done` event with usage and timings (or an `error` event):
+
+    event: delta
+    data: {"text": "## Executive Summary"}
+
+A comment line is sent first so proxies and browsers see the response start
+before the model produces its first token. With render_markdown the events
+also carry the answer rendered as HTML fragments (see ai_engine.markdown):
+
+    event: delta
+    data: {"text": "Summary\n", "html": "<h2>Executive Summary</h2>"}
+"""
+import json
+import logging
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+from .markdown import arender_events, render_events
+
+logger = logging.getLogger(__name__)
+
+
+def encode_event(event, data):
+    return f'event: {event}\ndata: {json.dumps(data, cls=DjangoJSONEncoder)}\n\n'.encode('utf-8')
+
+
+def _event_stream(events):
+    yield b': stream open\n\n'
+    try:
+        for event, data in events:
+            yield encode_event(event, data)
+    except Exception as e:
+        # Headers are already sent, so failures can only be reported in-band
+        logger.exception(f"Exception while streaming AI response: {str(e)}")
+        yield encode_event('error', {'message': 'An error occurred while streaming the response'})
+
+
+async def _aevent_stream(events):
+    yield b': stream open\n\n'
+    try:
+        async for event, data in events:
+            yield encode_event(event, data)
+    except Exception as e:
+        logger.exception(f"Exception while streaming AI response: {str(e)}")
+        yield encode_event('error', {'message': 'An error occurred while streaming the response'})
+
+
+def sse_response(events, render_markdown=False):
+    """StreamingHttpResponse for an iterable or (from async views) async iterable of events"""
+    if hasattr(events, '__aiter__'):
+        stream = _aevent_stream(arender_events(events) if render_markdown else events)
+    else:
+        stream = _event_stream(render_events(events) if render_markdown else events)
+    response = StreamingHttpResponse(stream, content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
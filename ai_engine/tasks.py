@@ -0,0 +1,8 @@
+from celery import shared_task
+from .insights import regenerate_insight
+
+
+@shared_task(ignore_result=True)
+def regenerate_insight_task(kind, subject):
+    """Celery entry point of stale-while-revalidate insight refreshes"""
+    regenerate_insight(kind, subject)
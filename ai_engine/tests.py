@@ -1,3 +1,813 @@
-from django.test import TestCase
+import asyncio
+import json
+import os
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from types import SimpleNamespace
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from projects.models import Project
+from projects.tests import make_project, make_risk, make_task
+from .batch import analyze_risks, select_risks
+from .client import FakeTransport, get_client_state
+from .context import build_context, encode_compact, estimate_tokens
+from .governor import Governor, GovernorBusy
+from .metrics import Histogram, get_metrics, reset_metrics
+from .markdown import MarkdownRenderer, render_markdown
+from .insights import REGENERATING_PREFIX, _executor as insight_executor, prune_insights, schedule_regeneration
+from .models import AICallLog, AIInsight, RiskAnalysis
+from .retrieval import RetrievalIndex, get_index, sweep_index, sync_index, tokenize
+from .service import PMOAIEngine, get_prompt_cache_stats, get_response_cache_stats
+from .views import answer_markdown, pmo_question_context
 
-# Create your tests here.
+
+class StubMessages:
+    """Stands in for client.messages; records each request and returns a canned reply"""
+
+    def __init__(self, fail=False):
+        self.calls = []
+        self.fail = fail
+
+    def create(self, **kwargs):
+        self.calls.append(kwargs)
+        if self.fail:
+            raise RuntimeError('overloaded')
+        # The first call writes the cacheable prefix, later calls read it
+        cached = 1500 if len(self.calls) > 1 else 0
+        usage = SimpleNamespace(input_tokens=200, output_tokens=900,
+                                cache_creation_input_tokens=1500 - cached, cache_read_input_tokens=cached)
+        return SimpleNamespace(content=[SimpleNamespace(text=f'analysis #{len(self.calls)}')], usage=usage)
+
+
+def stub_engine(fail=False):
+    engine = PMOAIEngine()
+    engine.demo_mode = False
+    engine.client = SimpleNamespace(messages=StubMessages(fail=fail))
+    return engine
+
+
+@override_settings(ANTHROPIC_API_KEY='demo-mode', AI_CACHE_TTL=60)
+class ResponseCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.risk = {'title': 'Vendor delay', 'severity': 'high', 'probability': 60, 'impact': 7}
+
+    def test_identical_input_is_served_from_cache(self):
+        engine = stub_engine()
+        first = engine.analyze_risk(self.risk)
+        # Same payload, different key order: same fingerprint
+        second = engine.analyze_risk(dict(reversed(list(self.risk.items()))))
+
+        self.assertEqual(len(engine.client.messages.calls), 1)
+        self.assertFalse(first['cached'])
+        self.assertTrue(second['cached'])
+        self.assertEqual(second['response'], first['response'])
+        self.assertIn('generated_at', second)
+
+        stats = get_response_cache_stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_refresh_bypasses_and_replaces_entry(self):
+        engine = stub_engine()
+        engine.analyze_risk(self.risk)
+        refreshed = engine.analyze_risk(self.risk, refresh=True)
+        again = engine.analyze_risk(self.risk)
+
+        self.assertEqual(len(engine.client.messages.calls), 2)
+        self.assertEqual(refreshed['response'], 'analysis #2')
+        self.assertEqual(again['response'], 'analysis #2')
+        self.assertEqual(get_response_cache_stats()['refreshes'], 1)
+
+    def test_fingerprint_covers_model_settings_and_payload(self):
+        engine = stub_engine()
+        engine.analyze_risk(self.risk)
+        engine.analyze_risk({**self.risk, 'impact': 8})
+        engine.max_tokens += 1
+        engine.analyze_risk(self.risk)
+
+        self.assertEqual(len(engine.client.messages.calls), 3)
+
+    def test_errors_are_not_cached(self):
+        engine = stub_engine(fail=True)
+        self.assertFalse(engine.analyze_risk(self.risk)['success'])
+        engine.analyze_risk(self.risk)
+
+        self.assertEqual(len(engine.client.messages.calls), 2)
+
+    @override_settings(AI_CACHE_TTL=0)
+    def test_zero_ttl_disables_cache(self):
+        engine = stub_engine()
+        engine.analyze_risk(self.risk)
+        engine.analyze_risk(self.risk)
+
+        self.assertEqual(len(engine.client.messages.calls), 2)
+
+    def test_stats_endpoint_is_admin_only(self):
+        self.assertEqual(self.client.get('/api/ai/cache/stats/').status_code, 403)
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        response = self.client.get('/api/ai/cache/stats/')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('hit_rate', response.json())
+
+
+class SharedClientTests(TestCase):
+    def test_engines_share_one_client(self):
+        transport = FakeTransport(text='All projects on track.')
+        with override_settings(ANTHROPIC_API_KEY='sk-ant-test', AI_HTTP_TRANSPORT=transport, AI_CACHE_TTL=0):
+            first, second = PMOAIEngine(), PMOAIEngine()
+            self.assertFalse(first.demo_mode)
+            self.assertIs(first.client, second.client)
+
+            result = first.analyze_risk({'title': 'Vendor delay'})
+            second.analyze_risk({'title': 'Vendor delay'})
+
+        self.assertTrue(result['success'])
+        self.assertEqual(result['response'], 'All projects on track.')
+        self.assertEqual(len(transport.requests), 2)
+        self.assertEqual(transport.requests[0].url.path, '/v1/messages')
+        self.assertEqual(transport.requests[0].headers['x-api-key'], 'sk-ant-test')
+
+    def test_client_rebuilt_when_settings_change(self):
+        with override_settings(ANTHROPIC_API_KEY='sk-ant-test', AI_HTTP_TRANSPORT=FakeTransport()):
+            client = get_client_state().client
+            with override_settings(AI_MAX_RETRIES=0):
+                self.assertIsNot(get_client_state().client, client)
+        with override_settings(ANTHROPIC_API_KEY='demo-mode'):
+            self.assertTrue(get_client_state().demo_mode)
+            self.assertIsNone(PMOAIEngine().client)
+
+    def test_api_errors_are_reported(self):
+        transport = FakeTransport(status_code=500)
+        with override_settings(ANTHROPIC_API_KEY='sk-ant-test', AI_HTTP_TRANSPORT=transport,
+                               AI_MAX_RETRIES=0, AI_CACHE_TTL=0):
+            result = PMOAIEngine().analyze_risk({'title': 'Vendor delay'})
+
+        self.assertFalse(result['success'])
+        self.assertEqual(result['error_type'], 'InternalServerError')
+        self.assertEqual(len(transport.requests), 1)
+
+
+@override_settings(ANTHROPIC_API_KEY='demo-mode', AI_CACHE_TTL=0)
+class PromptCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_static_prefix_is_marked_cacheable_and_data_sent_last(self):
+        engine = stub_engine()
+        engine.analyze_risk({'title': 'Vendor delay'})
+        engine.analyze_risk({'title': 'Budget cut'})
+        first, second = engine.client.messages.calls
+
+        self.assertEqual(first['system'], [
+            {'type': 'text', 'text': PMOAIEngine.SYSTEM_PROMPT, 'cache_control': {'type': 'ephemeral'}},
+        ])
+        [message] = first['messages']
+        instructions, data = message['content']
+        self.assertEqual(instructions['cache_control'], {'type': 'ephemeral'})
+        self.assertNotIn('Vendor delay', instructions['text'])
+        self.assertNotIn('cache_control', data)
+        self.assertIn('title: Vendor delay', data['text'])
+        # Only the data differs between calls, so the cached prefix is reused
+        self.assertEqual(second['messages'][0]['content'][0], instructions)
+        self.assertIn('title: Budget cut', second['messages'][0]['content'][1]['text'])
+
+    def test_cache_token_usage_is_recorded(self):
+        engine = stub_engine()
+        first = engine.analyze_risk({'title': 'Vendor delay'})
+        second = engine.analyze_risk({'title': 'Budget cut'})
+
+        self.assertEqual(first['usage']['cache_creation_input_tokens'], 1500)
+        self.assertEqual(second['usage']['cache_read_input_tokens'], 1500)
+        stats = get_prompt_cache_stats()
+        self.assertEqual(stats['input_tokens'], 400)
+        self.assertEqual(stats['cache_creation_input_tokens'], 1500)
+        self.assertEqual(stats['cache_read_input_tokens'], 1500)
+        self.assertEqual(stats['cache_read_ratio'], 0.441)
+
+    @override_settings(AI_PROMPT_CACHE=False)
+    def test_prompt_cache_can_be_disabled(self):
+        engine = stub_engine()
+        engine.analyze_risk({'title': 'Vendor delay'})
+        [call] = engine.client.messages.calls
+
+        self.assertNotIn('cache_control', call['system'][0])
+        self.assertFalse(any('cache_control' in block for block in call['messages'][0]['content']))
+
+    def test_streamed_usage_includes_cache_reads(self):
+        transport = FakeTransport(text='Mitigate now.')
+        with override_settings(ANTHROPIC_API_KEY='sk-ant-test', AI_HTTP_TRANSPORT=transport, AI_MAX_RETRIES=0):
+            engine = PMOAIEngine()
+            list(engine.analyze_risk({'title': 'Vendor delay'}, stream=True))
+            *_, (event, done) = engine.analyze_risk({'title': 'Budget cut'}, stream=True)
+
+        self.assertEqual(event, 'done')
+        self.assertGreater(done['usage']['cache_read_input_tokens'], 0)
+        self.assertGreater(get_prompt_cache_stats()['cache_creation_input_tokens'], 0)
+
+
+class ContextTests(TestCase):
+    def setUp(self):
+        self.projects = [
+            {'name': f'Project {i}', 'code': f'P-{i}', 'status': 'delayed' if i % 3 == 0 else 'on_track',
+             'spi': 0.8 + i / 100, 'cpi': 1.0, 'description': 'Migrates billing to the new platform. ' * 10}
+            for i in range(60)
+        ]
+
+    def test_compact_encoding_is_smaller_and_stable(self):
+        compact = encode_compact({'portfolio': {'total': 60}, 'projects': self.projects})
+        as_json = json.dumps({'portfolio': {'total': 60}, 'projects': self.projects}, indent=2)
+
+        self.assertIn('rows: 60 | columns: code|cpi|description|name|spi|status', compact)
+        self.assertIn('P-1|1|Migrates billing', compact)
+        self.assertLess(estimate_tokens(compact), estimate_tokens(as_json) * 0.7)
+        reordered = [dict(reversed(list(project.items()))) for project in self.projects]
+        self.assertEqual(encode_compact({'projects': reordered, 'portfolio': {'total': 60}}), compact)
+
+    def test_over_budget_tables_keep_first_rows_and_summarize(self):
+        context = build_context([('PROJECTS DATA', self.projects)], budget=600)
+
+        self.assertLessEqual(estimate_tokens(context), 600)
+        self.assertTrue(context.startswith('PROJECTS DATA:\nrows: 60'))
+        self.assertIn('P-0|', context)
+        self.assertNotIn('P-59|', context)
+        self.assertRegex(context, r'\+\d+ more rows not shown; avg cpi 1; avg spi \d\.\d+;.*status delayed \d+, on_track \d+')
+
+    def test_within_budget_is_unchanged(self):
+        sections = [('RISK DATA', {'title': 'Vendor delay', 'impact': 7})]
+        self.assertEqual(build_context(sections, budget=1000), 'RISK DATA:\nimpact: 7\ntitle: Vendor delay')
+
+    def test_budgets_are_configurable_per_endpoint(self):
+        engine = stub_engine()
+        default = engine._compare_projects_prompt(self.projects).data
+        with override_settings(AI_CONTEXT_BUDGETS={'compare_projects': 300}):
+            smaller = engine._compare_projects_prompt(self.projects).data
+
+        self.assertLess(estimate_tokens(smaller), estimate_tokens(default))
+        self.assertIn('more rows not shown', smaller)
+
+
+class RetrievalTests(TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'index.npz')
+        settings_override = override_settings(AI_RETRIEVAL_INDEX_PATH=self.path)
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+
+    def test_bm25_ranks_matching_documents(self):
+        index = RetrievalIndex()
+        index.add('risk:1', 'Vendor delays the data center migration')
+        index.add('risk:2', 'Budget overrun on licences')
+        index.add('task:3', 'Migrate the data warehouse; migration runbook and data checks')
+        index.add('project:4', 'Mobile banking app')
+
+        self.assertEqual(tokenize('The vendors delayed it'), ['vendor', 'delay'])
+        self.assertEqual([key for key, _ in index.search('data migration delays')], ['risk:1', 'task:3'])
+        self.assertEqual(index.search('weather'), [])
+
+        index.remove('risk:1')
+        self.assertEqual([key for key, _ in index.search('delay')], [])
+
+    def test_save_and_load(self):
+        index = RetrievalIndex()
+        index.add('risk:1', 'Vendor delay', '2026-01-01')
+        index.add('task:2', 'Vendor onboarding')
+        index.save(self.path, 'sqlite:test')
+
+        loaded = RetrievalIndex.load(self.path, 'sqlite:test')
+        self.assertEqual(loaded.stamp('risk:1'), '2026-01-01')
+        self.assertEqual(loaded.search('vendor delay'), index.search('vendor delay'))
+        self.assertIsNone(RetrievalIndex.load(self.path, 'postgresql:other'))
+
+    def test_index_follows_saves_and_persists(self):
+        project = make_project(1, name='Data Platform', description='Warehouse for analytics')
+        make_risk(project, title='Vendor delay', description='Hardware supplier is late')
+        self.assertEqual(len(get_index()), 2)
+        # Searches never write the file
+        self.assertFalse(os.path.exists(self.path))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task = make_task(project, name='Firewall rules', description='Open ports for the supplier')
+        self.assertIn('task', [key.split(':')[0] for key, _ in get_index().search('firewall')])
+        with self.captureOnCommitCallbacks(execute=True):
+            task.delete()
+        self.assertEqual(get_index().search('firewall'), [])
+
+        call_command('retrieval_index', stdout=StringIO())
+        self.assertTrue(os.path.exists(self.path))
+        # A new worker starts from the saved file
+        with override_settings(AI_RETRIEVAL_INDEX_PATH=self.path):
+            self.assertEqual(len(get_index()), 2)
+            self.assertEqual(get_index().stamp(f'project:{project.pk}'), project.updated_at.isoformat())
+
+    def test_sync_reads_only_updated_records(self):
+        project = make_project(1, name='Data Platform')
+        index = RetrievalIndex()
+        self.assertEqual(sync_index(index), 1)
+        with self.assertNumQueries(4):
+            self.assertEqual(sync_index(index), 0)
+
+        Project.objects.filter(pk=project.pk).update(name='Data Lake', updated_at=timezone.now() + timedelta(hours=1))
+        self.assertEqual(sync_index(index), 1)
+        self.assertEqual([key for key, _ in index.search('lake')], [f'project:{project.pk}'])
+
+        # Deletions by other processes are only seen by the sweep
+        Project.objects.all().delete()
+        self.assertEqual(sync_index(index), 0)
+        self.assertEqual(sweep_index(index), 1)
+        self.assertEqual(len(index), 0)
+
+    def test_question_context_sends_relevant_records(self):
+        target = make_project(1, name='Data Platform')
+        make_risk(target, title='Vendor delay', description='Hardware supplier is late for the data center')
+        for i in range(2, 12):
+            make_project(i, name=f'Mobile app {i}')
+
+        context = async_to_sync(pmo_question_context)('What is the risk from the hardware supplier?')
+        self.assertEqual([row['title'] for row in context['relevant_risks']], ['Vendor delay'])
+        self.assertNotIn('recent_projects', context)
+        self.assertEqual(context['portfolio']['total_projects'], 11)
+
+        fallback = async_to_sync(pmo_question_context)('Anything new?')
+        self.assertEqual(len(fallback['recent_projects']), 5)
+
+    def test_question_context_fits_budget(self):
+        project = make_project(1, name='Data Platform')
+        for i in range(30):
+            make_risk(project, title=f'Vendor delay {i}', description='Supplier is late with hardware. ' * 20)
+
+        with override_settings(AI_CONTEXT_BUDGETS={'pmo_question': 800}):
+            context = async_to_sync(pmo_question_context)('vendor delay')
+        self.assertLess(len(context['relevant_risks']), 20)
+        self.assertLessEqual(estimate_tokens(encode_compact(context)), 800)
+
+
+async def read_events(response):
+    """[(event, data)] from a Server-Sent Events response of an async view"""
+    body = b''.join([chunk async for chunk in response.streaming_content])
+    events = []
+    for block in body.decode().split('\n\n'):
+        lines = dict(line.split(': ', 1) for line in block.splitlines() if not line.startswith(':'))
+        if lines:
+            events.append((lines['event'], json.loads(lines['data'])))
+    return events
+
+
+@override_settings(ANTHROPIC_API_KEY='sk-ant-test', AI_MAX_RETRIES=0, AI_CACHE_TTL=60, AI_RETRIEVAL_INDEX_PATH='')
+class StreamingTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    async def test_stream_sends_deltas_then_usage(self):
+        transport = FakeTransport(text='Portfolio is mostly on track.')
+        with override_settings(AI_HTTP_TRANSPORT=transport):
+            response = await self.async_client.get('/api/ai/portfolio-summary/?stream=1')
+            self.assertEqual(response['Content-Type'], 'text/event-stream')
+            events = await read_events(response)
+
+            replay = await read_events(await self.async_client.get('/api/ai/portfolio-summary/?stream=1'))
+
+        deltas = [data['text'] for event, data in events if event == 'delta']
+        self.assertGreater(len(deltas), 1)
+        self.assertEqual(''.join(deltas), 'Portfolio is mostly on track.')
+        event, done = events[-1]
+        self.assertEqual(event, 'done')
+        self.assertFalse(done['cached'])
+        self.assertEqual(done['stop_reason'], 'end_turn')
+        self.assertGreater(done['usage']['input_tokens'], 0)
+        self.assertIsNotNone(done['time_to_first_token_ms'])
+
+        # The completed stream was stored and is replayed without another API call
+        self.assertEqual(replay[0], ('delta', {'text': 'Portfolio is mostly on track.'}))
+        self.assertTrue(replay[-1][1]['cached'])
+        self.assertTrue(replay[-1][1]['stored'])
+        self.assertEqual(len(transport.requests), 1)
+
+    async def test_api_error_is_sent_as_event(self):
+        user = await sync_to_async(User.objects.create_user)('pm', 'pm@example.com', 'pw')
+        await self.async_client.aforce_login(user)
+        with override_settings(AI_HTTP_TRANSPORT=FakeTransport(status_code=500)):
+            response = await self.async_client.post('/api/ai/ask/?stream=1', {'question': 'Which projects slip?'},
+                                                    content_type='application/json')
+            events = await read_events(response)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([event for event, _ in events], ['error'])
+
+    async def test_question_stream_carries_rendered_html(self):
+        user = await sync_to_async(User.objects.create_user)('pm', 'pm@example.com', 'pw')
+        await self.async_client.aforce_login(user)
+        answer = '## Direct Answer\nTwo projects slip:\n- **Data Platform**\n- ERP <phase 2>'
+        with override_settings(AI_HTTP_TRANSPORT=FakeTransport(text=answer)):
+            response = await self.async_client.post('/api/ai/ask/?stream=1', {'question': 'Which projects slip?'},
+                                                    content_type='application/json')
+            events = await read_events(response)
+
+        self.assertEqual(events[-1][0], 'done')
+        self.assertEqual(''.join(data['html'] for _, data in events), render_markdown(answer))
+        self.assertIn('&lt;phase 2&gt;', events[-1][1]['html'])
+
+    def test_interrupted_stream_is_not_cached(self):
+        def events(fail):
+            yield SimpleNamespace(type='message_start', message=SimpleNamespace(usage=SimpleNamespace(input_tokens=10)))
+            yield SimpleNamespace(type='content_block_delta', delta=SimpleNamespace(text='Partial'))
+            if fail:
+                raise ConnectionError('connection reset')
+            yield SimpleNamespace(
+                type='message_delta', delta=SimpleNamespace(stop_reason='end_turn'), usage=SimpleNamespace(output_tokens=2)
+            )
+
+        engine = stub_engine()
+        engine.client.messages.create = lambda **kwargs: events(fail=True)
+        interrupted = list(engine.analyze_risk({'title': 'Vendor delay'}, stream=True))
+        engine.client.messages.create = lambda **kwargs: events(fail=False)
+        retried = list(engine.analyze_risk({'title': 'Vendor delay'}, stream=True))
+
+        self.assertEqual(interrupted[0], ('delta', {'text': 'Partial'}))
+        self.assertEqual(interrupted[-1][0], 'error')
+        self.assertEqual(retried[-1][0], 'done')
+        self.assertFalse(retried[-1][1]['cached'])
+        self.assertEqual(retried[-1][1]['usage'], {
+            'input_tokens': 10, 'output_tokens': 2, 'cache_creation_input_tokens': 0, 'cache_read_input_tokens': 0,
+        })
+
+
+class SlowTransport(FakeTransport):
+    """FakeTransport that takes `delay` seconds per request, like a model generating a reply"""
+
+    def __init__(self, delay, **kwargs):
+        super().__init__(**kwargs)
+        self.delay = delay
+
+    def handle_request(self, request):
+        time.sleep(self.delay)
+        return super().handle_request(request)
+
+    async def handle_async_request(self, request):
+        await asyncio.sleep(self.delay)
+        return await super().handle_async_request(request)
+
+
+@override_settings(ANTHROPIC_API_KEY='sk-ant-test', AI_MAX_RETRIES=0, AI_CACHE_TTL=0, AI_RETRIEVAL_INDEX_PATH='')
+class AsyncViewTests(TestCase):
+    async def test_risk_analysis_uses_async_orm(self):
+        project = await sync_to_async(make_project)(1, name='Data Platform')
+        risk = await sync_to_async(make_risk)(project, title='Vendor delay')
+        transport = FakeTransport(text='Mitigate now.')
+        with override_settings(AI_HTTP_TRANSPORT=transport):
+            response = await self.async_client.get(f'/api/ai/risk-analysis/{risk.pk}/')
+            missing = await self.async_client.get('/api/ai/risk-analysis/999999/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['response'], 'Mitigate now.')
+        self.assertIn(b'Data Platform', transport.requests[0].content)
+        self.assertEqual(missing.status_code, 404)
+
+    async def test_drf_permissions_still_apply(self):
+        response = await self.async_client.post('/api/ai/ask/', {'question': 'Status?'}, content_type='application/json')
+        self.assertEqual(response.status_code, 403)
+
+    async def test_calls_run_concurrently_on_one_loop(self):
+        with override_settings(AI_HTTP_TRANSPORT=SlowTransport(delay=0.2),
+                               AI_MAX_CONCURRENT_REQUESTS=20, AI_MAX_CONCURRENT_PER_USER=20,
+                               AI_TOKENS_PER_MINUTE=10 ** 6):
+            engine = PMOAIEngine()
+            started = time.monotonic()
+            results = await asyncio.gather(*(engine.aanalyze_risk({'title': f'Risk {i}'}) for i in range(20)))
+            elapsed = time.monotonic() - started
+
+        self.assertTrue(all(result['success'] for result in results))
+        # 20 sequential calls would take 4s
+        self.assertLess(elapsed, 2)
+
+
+@override_settings(ANTHROPIC_API_KEY='sk-ant-test', AI_MAX_RETRIES=0, AI_CACHE_TTL=0)
+class GovernorTests(TestCase):
+    async def test_identical_concurrent_calls_share_one_request(self):
+        transport = SlowTransport(delay=0.2, text='Portfolio is on track.')
+        portfolio = {'total_projects': 8, 'delayed': 2}
+        with override_settings(AI_HTTP_TRANSPORT=transport):
+            engine = PMOAIEngine()
+            results = await asyncio.gather(*(engine.agenerate_portfolio_summary(portfolio) for _ in range(20)))
+            streamed = [event async for event in await engine.agenerate_portfolio_summary(portfolio, stream=True)]
+
+        self.assertEqual(len(transport.requests), 2)
+        self.assertTrue(all(result['response'] == 'Portfolio is on track.' for result in results))
+        self.assertEqual(sum(bool(result.get('coalesced')) for result in results), 19)
+        self.assertEqual(streamed[-1][0], 'done')
+
+    async def test_followers_stop_waiting_for_a_lost_leader(self):
+        governor = Governor(flight_timeout=0.05)
+        flight, leader = governor.join('key')
+        # The leader never calls leave(), as when its worker is killed mid-request
+        follower, follower_leads = governor.join('key')
+        self.assertEqual((leader, follower_leads), (True, False))
+
+        self.assertIsNone(await governor.await_flight('key', follower))
+        self.assertIsNone(await asyncio.to_thread(governor.wait, 'key', follower))
+        # New callers start a fresh flight instead of joining the lost one
+        self.assertTrue(governor.join('key')[1])
+
+    async def test_free_slots_go_to_the_user_served_longest_ago(self):
+        governor = Governor(max_concurrent=1, max_per_user=1)
+        order = []
+
+        async def call(user, name):
+            async with governor.aslot(user):
+                order.append(name)
+                await asyncio.sleep(0.01)
+
+        await asyncio.gather(call('a', 'a1'), call('a', 'a2'), call('a', 'a3'), call('b', 'b1'))
+
+        self.assertEqual(order, ['a1', 'b1', 'a2', 'a3'])
+        self.assertEqual(governor.stats()['active'], 0)
+
+    async def test_one_user_cannot_take_every_slot(self):
+        governor = Governor(max_concurrent=3, max_per_user=2)
+        started = []
+
+        async def call(user, name):
+            async with governor.aslot(user):
+                started.append(name)
+                await asyncio.sleep(0.05)
+
+        await asyncio.gather(*(call('a', f'a{i}') for i in range(4)), call('b', 'b1'))
+
+        self.assertEqual(started[:3], ['a0', 'a1', 'b1'])
+
+    def test_rate_limit_spreads_calls_and_fails_fast(self):
+        governor = Governor(requests_per_minute=600, max_wait=0.5)
+        started = time.monotonic()
+        for _ in range(601):
+            with governor.slot('a'):
+                pass
+        # The 601st call waited for a tenth of a second of refill
+        self.assertGreater(time.monotonic() - started, 0.08)
+
+        governor = Governor(tokens_per_minute=1000, max_wait=0.5)
+        with governor.slot('a', tokens=800):
+            pass
+        with self.assertRaises(GovernorBusy):
+            with governor.slot('a', tokens=800):
+                pass
+
+        with override_settings(AI_HTTP_TRANSPORT=FakeTransport(), AI_TOKENS_PER_MINUTE=1000, AI_GOVERNOR_MAX_WAIT=0):
+            engine = PMOAIEngine()
+            self.assertTrue(engine.analyze_risk({'title': 'Vendor delay'})['success'])
+            result = engine.analyze_risk({'title': 'Budget cut'})
+        self.assertEqual(result['error_type'], 'GovernorBusy')
+        self.assertIn('busy', result['response'])
+
+
+@override_settings(ANTHROPIC_API_KEY='demo-mode', AI_CACHE_TTL=60, AI_MODEL='claude-sonnet-4-20250514')
+class MetricsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_metrics()
+
+    def test_calls_are_recorded_per_method_and_user(self):
+        user = User.objects.create_user('pm', 'pm@example.com', 'pw')
+        engine = stub_engine()
+        engine.user = user
+        engine.analyze_risk({'title': 'Vendor delay'})
+        engine.analyze_risk({'title': 'Vendor delay'})
+        failing = stub_engine(fail=True)
+        failing.generate_portfolio_summary({'total_projects': 8})
+
+        metrics = get_metrics()
+        risk = metrics['methods']['analyze_risk']
+        self.assertEqual((risk['calls'], risk['cached']), (2, 1))
+        # Only the upstream call used tokens: 200 input, 900 output, 1500 cache-write at Sonnet prices
+        self.assertEqual(risk['tokens']['output_tokens'], 900)
+        self.assertEqual(risk['cost_usd'], 0.019725)
+        self.assertEqual(risk['wall_ms']['count'], 2)
+        self.assertEqual(metrics['methods']['generate_portfolio_summary']['errors'], {'RuntimeError': 1})
+        self.assertEqual(metrics['users']['pm']['calls'], 2)
+        self.assertEqual(metrics['users']['anonymous']['calls'], 1)
+        self.assertEqual(metrics['totals']['calls'], 3)
+
+    @override_settings(AI_CALL_LOG=True)
+    def test_streams_are_logged_with_time_to_first_token(self):
+        with override_settings(ANTHROPIC_API_KEY='sk-ant-test', AI_HTTP_TRANSPORT=FakeTransport(), AI_MAX_RETRIES=0):
+            list(PMOAIEngine().generate_portfolio_summary({'total_projects': 8}, stream=True))
+
+        log = AICallLog.objects.get()
+        self.assertEqual(log.method, 'generate_portfolio_summary')
+        self.assertTrue(log.streamed)
+        self.assertIsNotNone(log.ttft_ms)
+        self.assertGreater(log.input_tokens + log.cache_creation_input_tokens, 0)
+        self.assertGreater(log.cost, 0)
+
+        admin = User.objects.create_superuser('admin', 'admin@example.com', 'pw')
+        self.client.force_login(admin)
+        response = self.client.get('/api/ai/metrics/?source=log&hours=1')
+        self.assertEqual(response.status_code, 200)
+        method = response.json()['methods']['generate_portfolio_summary']
+        self.assertEqual((method['calls'], method['streamed']), (1, 1))
+        self.assertIsNotNone(method['time_to_first_token_ms']['p50'])
+        self.assertIn('governor', response.json())
+
+    def test_metrics_endpoint_is_admin_only(self):
+        self.assertEqual(self.client.get('/api/ai/metrics/').status_code, 403)
+
+    def test_histogram_percentiles(self):
+        histogram = Histogram()
+        for value in [120] * 90 + [5000] * 10:
+            histogram.observe(value)
+        summary = histogram.summary()
+
+        self.assertTrue(100 <= summary['p50'] <= 250)
+        self.assertTrue(4000 <= summary['p95'] <= 5000)
+        self.assertEqual(summary['max'], 5000)
+
+
+@override_settings(ANTHROPIC_API_KEY='sk-ant-test', AI_MAX_RETRIES=0, AI_CACHE_TTL=0)
+class RiskAnalysisBatchTests(TestCase):
+    def setUp(self):
+        self.project = make_project(1, name='Data Platform')
+        self.risks = [make_risk(self.project, title=f'Vendor delay {i}', severity='high') for i in range(3)]
+        make_risk(self.project, title='Minor', severity='low')
+        make_risk(self.project, title='Closed', severity='critical', status='closed')
+
+    def test_batch_stores_results_and_resumes(self):
+        transport = FakeTransport(text='Mitigate now.')
+        with override_settings(AI_HTTP_TRANSPORT=transport):
+            first = analyze_risks(select_risks(), workers=3)
+            second = analyze_risks(select_risks(), workers=3)
+            self.risks[0].description = 'Supplier went bankrupt'
+            self.risks[0].save()
+            third = analyze_risks(select_risks(), workers=3)
+
+        self.assertEqual((first['selected'], first['analyzed'], first['failed']), (3, 3, 0))
+        self.assertEqual((second['current'], second['analyzed']), (3, 0))
+        self.assertEqual((third['current'], third['analyzed']), (2, 1))
+        self.assertEqual(len(transport.requests), 4)
+        self.assertEqual(RiskAnalysis.objects.get(risk=self.risks[0]).result['response'], 'Mitigate now.')
+
+    def test_failures_are_not_stored(self):
+        with override_settings(AI_HTTP_TRANSPORT=FakeTransport(status_code=500)):
+            summary = analyze_risks(select_risks(severities=['high']), workers=2)
+
+        self.assertEqual((summary['analyzed'], summary['failed']), (0, 3))
+        self.assertEqual(summary['errors'], {'InternalServerError': 3})
+        self.assertFalse(RiskAnalysis.objects.exists())
+
+    def test_endpoint_serves_stored_analysis_until_the_risk_changes(self):
+        risk = self.risks[0]
+        with override_settings(AI_HTTP_TRANSPORT=FakeTransport(text='Stored analysis.')):
+            analyze_risks(select_risks(project=self.project.code))
+
+        transport = FakeTransport(text='Fresh analysis.')
+        with override_settings(AI_HTTP_TRANSPORT=transport):
+            stored = self.client.get(f'/api/ai/risk-analysis/{risk.pk}/').json()
+            risk.impact = 9
+            risk.save()
+            fresh = self.client.get(f'/api/ai/risk-analysis/{risk.pk}/').json()
+            again = self.client.get(f'/api/ai/risk-analysis/{risk.pk}/').json()
+
+        self.assertEqual((stored['response'], stored['stored']), ('Stored analysis.', True))
+        self.assertEqual(fresh['response'], 'Fresh analysis.')
+        self.assertNotIn('stored', fresh)
+        self.assertEqual((again['response'], again['stored']), ('Fresh analysis.', True))
+        self.assertEqual(len(transport.requests), 1)
+
+    def test_command(self):
+        out = StringIO()
+        with override_settings(AI_HTTP_TRANSPORT=FakeTransport()):
+            call_command('analyze_risks', '--severity', 'high,critical', '--workers', '2', stdout=out)
+            call_command('analyze_risks', stdout=out)
+
+        self.assertIn('3 risks selected: 0 already current, 3 analyzed, 0 failed', out.getvalue())
+        self.assertIn('3 risks selected: 3 already current, 0 analyzed, 0 failed', out.getvalue())
+
+
+@override_settings(ANTHROPIC_API_KEY='sk-ant-test', AI_MAX_RETRIES=0, AI_CACHE_TTL=0)
+class InsightRegenerationTests(TransactionTestCase):
+    """The regeneration thread reads the data through its own connection, so it must be committed"""
+
+    def setUp(self):
+        cache.clear()
+        self.project = make_project(1, name='Data Platform')
+        self.url = f'/api/ai/project-summary/{self.project.pk}/'
+
+    def test_stale_while_revalidate(self):
+        transport = SlowTransport(delay=0.3, text='Summary v1')
+        with override_settings(AI_HTTP_TRANSPORT=transport):
+            generated = self.client.get(self.url).json()
+            current = self.client.get(self.url).json()
+            self.assertEqual(len(transport.requests), 1)
+
+            self.project.name = 'Data Platform 2'
+            self.project.save()
+            transport.text = 'Summary v2'
+            # The old version answers at once; with the eager Celery of the tests the
+            # refresh runs in a background thread, still waiting for the reply here
+            stale = self.client.get(self.url).json()
+            self.assertEqual(AIInsight.objects.count(), 1)
+            insight_executor.submit(int).result()
+            refreshed = self.client.get(self.url).json()
+
+        self.assertNotIn('stored', generated)
+        self.assertEqual((current['response'], current['stored'], current['stale']), ('Summary v1', True, False))
+        self.assertEqual((stale['response'], stale['stale']), ('Summary v1', True))
+        self.assertEqual((refreshed['response'], refreshed['stale']), ('Summary v2', False))
+        self.assertEqual(len(transport.requests), 2)
+        self.assertEqual(AIInsight.objects.filter(subject=f'project:{self.project.pk}').count(), 2)
+
+
+    async def test_streamed_summaries_are_stored_and_served(self):
+        url = f'{self.url}?stream=1'
+        transport = FakeTransport(text='Streamed summary')
+        with override_settings(AI_HTTP_TRANSPORT=transport):
+            streamed = await read_events(await self.async_client.get(url))
+            replayed = await read_events(await self.async_client.get(url))
+
+            self.project.name = 'Data Platform 2'
+            await self.project.asave()
+            stale = await read_events(await self.async_client.get(url))
+            await asyncio.to_thread(lambda: insight_executor.submit(int).result())
+
+        self.assertEqual(''.join(data['text'] for event, data in streamed if event == 'delta'), 'Streamed summary')
+        self.assertEqual(streamed[-1][0], 'done')
+        self.assertEqual(replayed[0], ('delta', {'text': 'Streamed summary'}))
+        self.assertEqual((replayed[1][0], replayed[1][1]['stored'], replayed[1][1]['stale']), ('done', True, False))
+        self.assertTrue(stale[1][1]['stale'])
+        # The first stream, then the background regeneration of the stale version
+        self.assertEqual(len(transport.requests), 2)
+        self.assertEqual(await AIInsight.objects.filter(subject=f'project:{self.project.pk}').acount(), 2)
+
+class InsightTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.project = make_project(1, name='Data Platform')
+
+    def test_refresh_creates_a_version(self):
+        with override_settings(AI_HTTP_TRANSPORT=FakeTransport()):
+            self.client.get('/api/ai/portfolio-summary/')
+            self.client.get('/api/ai/portfolio-summary/?refresh=1')
+        self.assertEqual(AIInsight.objects.filter(kind='portfolio_summary', subject='portfolio').count(), 2)
+
+    def test_one_regeneration_at_a_time(self):
+        cache.add(f'{REGENERATING_PREFIX}:project_summary:project:{self.project.pk}', True)
+        self.assertFalse(schedule_regeneration('project_summary', f'project:{self.project.pk}'))
+
+    @override_settings(AI_INSIGHT_KEEP_VERSIONS=3, AI_INSIGHT_RETENTION_DAYS=30)
+    def test_pruning_policy(self):
+        def version(subject, days_old):
+            insight = AIInsight.objects.create(kind='project_summary', subject=subject, fingerprint='f', model='m', result={})
+            AIInsight.objects.filter(pk=insight.pk).update(created_at=timezone.now() - timedelta(days=days_old))
+
+        for days_old in (1, 2, 3, 4, 5):
+            version('project:1', days_old)
+        for days_old in (40, 50):
+            version('project:2', days_old)
+
+        self.assertEqual(prune_insights(), 3)
+        self.assertEqual(AIInsight.objects.filter(subject='project:1').count(), 3)
+        # The newest version of a subject is kept however old it is
+        self.assertEqual(AIInsight.objects.filter(subject='project:2').count(), 1)
+
+
+class MarkdownTests(TestCase):
+    report = (
+        '## Executive Summary\n'
+        'Two projects are **at risk** <script>alert(1)</script>\n\n'
+        '| Project | SPI |\n|---|---|\n| Data Platform | 0.82 |\n\n'
+        '- Vendor delay\n  - Affects `DP-001` & `ERP-004`\n- Scope growth\n'
+        '1. Reallocate engineers\n2. Re-baseline'
+    )
+
+    def test_blocks_and_escaping(self):
+        rendered = render_markdown(self.report)
+
+        self.assertTrue(rendered.startswith('<h2>Executive Summary</h2><p>Two projects are <strong>at risk</strong>'))
+        self.assertIn('&lt;script&gt;', rendered)
+        self.assertNotIn('<script>', rendered)
+        self.assertIn('<thead><tr><th>Project</th><th>SPI</th></tr></thead><tbody><tr><td>Data Platform</td>', rendered)
+        self.assertIn('<li>Vendor delay<ul><li>Affects <code>DP-001</code> &amp; <code>ERP-004</code></li></ul></li>', rendered)
+        self.assertTrue(rendered.endswith('<ol><li>Reallocate engineers</li><li>Re-baseline</li></ol>'))
+
+    def test_incremental_fragments_match_whole_render(self):
+        for size in (1, 7, 50):
+            renderer = MarkdownRenderer()
+            fragments = [renderer.feed(self.report[i:i + size]) for i in range(0, len(self.report), size)]
+            fragments.append(renderer.close())
+            self.assertEqual(''.join(fragments), render_markdown(self.report))
+
+        renderer = MarkdownRenderer()
+        self.assertEqual(renderer.feed('## Partial head'), '')
+        self.assertEqual(renderer.feed('er\nNext'), '<h2>Partial header</h2>')
+
+    def test_answers_wrapped_in_json_are_unwrapped(self):
+        self.assertEqual(answer_markdown('```json\n{"response": "## Hi\\n- a"}\n```'), '## Hi\n- a')
+        self.assertEqual(answer_markdown('{not json'), '{not json')
+        self.assertEqual(answer_markdown('Plain'), 'Plain')
@@ -6,6 +6,8 @@ from .views import (
     PMOQuestionView,
     ProjectComparisonView,
     ExecutiveReportView,
+    AICacheStatsView,
+    AIMetricsView,
 )
 
 urlpatterns = [
@@ -15,4 +17,6 @@ urlpatterns = [
     path('ask/', PMOQuestionView.as_view(), name='pmo-question'),
     path('compare-projects/', ProjectComparisonView.as_view(), name='compare-projects'),
     path('executive-report/', ExecutiveReportView.as_view(), name='executive-report'),
+    path('cache/stats/', AICacheStatsView.as_view(), name='ai-cache-stats'),
+    path('metrics/', AIMetricsView.as_view(), name='ai-metrics'),
 ]
@@ -1,22 +1,67 @@
+import json
+import re
+from datetime import timedelta
+from asgiref.sync import sync_to_async
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
+from rest_framework.permissions import IsAdminUser
+from django.conf import settings
 from django.db.models import Count, Avg, F
-from projects.models import Project, Risk
+from django.utils import timezone
+from projects.models import Project, Risk, Task, Issue
 from projects.serializers import ProjectListSerializer
-from .service import PMOAIEngine
+from projects.services import PortfolioStats
+from jobs.runner import enqueue_job
+from jobs.serializers import JobSerializer
+from .async_api import AsyncAPIView
+from .context import context_budget, encode_compact, estimate_tokens
+from .governor import get_governor
+from .insights import insight_events, store_insight, stored_insight, stored_stream
+from .markdown import render_markdown
+from .metrics import get_metrics, summarize_logs
+from .models import AICallLog, RiskAnalysis
+from .retrieval import search as retrieval_search
+from .service import PMOAIEngine, get_prompt_cache_stats, get_response_cache_stats
+from .streaming import sse_response
 import logging
 
 logger = logging.getLogger(__name__)
 
 
-class ProjectSummaryView(APIView):
+def wants_refresh(request):
+    """?refresh=1 bypasses the AI response cache"""
+    return request.query_params.get('refresh') in ('1', 'true')
+
+
+def answer_markdown(text):
+    """The markdown of an answer, unwrapping one the model returned as {"response": ...} JSON"""
+    text = text.strip()
+    fenced = re.fullmatch(r'```json\s*(.*?)\s*```', text, flags=re.IGNORECASE | re.DOTALL)
+    if fenced:
+        text = fenced.group(1)
+    if text.startswith('{'):
+        try:
+            parsed = json.loads(text)
+        except ValueError:
+            return text
+        if isinstance(parsed, dict) and isinstance(parsed.get('response'), str):
+            return parsed['response']
+    return text
+
+
+def wants_stream(request):
+    """?stream=1 returns the response as Server-Sent Events (see ai_engine.streaming)"""
+    return request.query_params.get('stream') in ('1', 'true')
+
+
+class ProjectSummaryView(AsyncAPIView):
     """
     Generate AI summary for a specific project
     """
-    def get(self, request, project_id):
+    async def get(self, request, project_id):
         try:
-            project = Project.objects.get(id=project_id)
+            project = await Project.objects.with_health().with_risk_counts().aget(id=project_id)
         except Project.DoesNotExist:
             return Response(
                 {'error': 'Project not found'},
@@ -24,24 +69,17 @@ class ProjectSummaryView(APIView):
             )
         
         # Prepare project data
-        project_data = {
-            'name': project.name,
-            'code': project.code,
-            'status': project.status,
-            'completion_percentage': project.completion_percentage,
-            'spi': float(project.spi),
-            'cpi': float(project.cpi),
-            'total_risks': project.risks.count(),
-            'high_risks': project.risks.filter(severity__in=['high', 'critical']).count(),
-            'budget': float(project.budget),
-            'spent': float(project.spent),
-            'days_remaining': project.days_remaining,
-            'health_score': project.health_score,
-        }
+        project_data = project_summary_data(project)
         
         # Generate AI summary
         try:
-            ai_engine = PMOAIEngine()
+            ai_engine = PMOAIEngine(user=request.user)
+            subject = f'project:{project.pk}'
+            
+            # The newest stored summary answers at once; a stale one is regenerated in the background
+            fingerprint, stored = await stored_insight(ai_engine, 'project_summary', subject, project_data)
+            if stored is not None and not wants_refresh(request):
+                return sse_response(insight_events(stored)) if wants_stream(request) else Response(stored)
             
             # Check if engine is in demo mode
             if ai_engine.demo_mode:
@@ -50,7 +88,15 @@ class ProjectSummaryView(APIView):
                     'message': 'AI features are currently unavailable. Please configure the API key.'
                 }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             
-            summary = ai_engine.generate_project_summary(project_data)
+            if wants_stream(request):
+                events = await ai_engine.agenerate_project_summary(
+                    project_data, refresh=wants_refresh(request), stream=True
+                )
+                return sse_response(stored_stream(
+                    events, 'project_summary', subject, fingerprint, ai_engine.model, user=request.user
+                ))
+            
+            summary = await ai_engine.agenerate_project_summary(project_data, refresh=wants_refresh(request))
             
             # Check if AI returned an error
             if summary.get('error', False):
@@ -60,6 +106,9 @@ class ProjectSummaryView(APIView):
                     'message': summary.get('response', 'AI service temporarily unavailable')
                 }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             
+            await sync_to_async(store_insight)(
+                'project_summary', subject, fingerprint, ai_engine.model, summary, user=request.user
+            )
             return Response(summary)
             
         except Exception as e:
@@ -70,32 +119,21 @@ class ProjectSummaryView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class PortfolioSummaryView(APIView):
+class PortfolioSummaryView(AsyncAPIView):
     """
     Generate AI summary for the entire portfolio
     """
-    def get(self, request):
-        # Get portfolio statistics
-        total_projects = Project.objects.count()
-        
-        portfolio_data = {
-            'total_projects': total_projects,
-            'on_track': Project.objects.filter(status='on_track').count(),
-            'at_risk': Project.objects.filter(status='at_risk').count(),
-            'delayed': Project.objects.filter(status='delayed').count(),
-            'completed': Project.objects.filter(status='completed').count(),
-            'projects_behind_schedule': Project.objects.filter(spi__lt=0.9).count(),
-            'avg_completion': round(Project.objects.aggregate(
-                avg=Avg('completion_percentage')
-            )['avg'] or 0, 2),
-            'avg_spi': round(Project.objects.aggregate(avg=Avg('spi'))['avg'] or 0, 2),
-            'total_risks': Risk.objects.count(),
-            'high_risks': Risk.objects.filter(severity__in=['high', 'critical']).count(),
-        }
+    async def get(self, request):
+        # Portfolio statistics come from the shared cache, which is read synchronously
+        portfolio_data = await sync_to_async(portfolio_summary_data)()
         
         # Generate AI summary
         try:
-            ai_engine = PMOAIEngine()
+            ai_engine = PMOAIEngine(user=request.user)
+            
+            fingerprint, stored = await stored_insight(ai_engine, 'portfolio_summary', 'portfolio', portfolio_data)
+            if stored is not None and not wants_refresh(request):
+                return sse_response(insight_events(stored)) if wants_stream(request) else Response(stored)
             
             if ai_engine.demo_mode:
                 return Response({
@@ -103,7 +141,15 @@ class PortfolioSummaryView(APIView):
                     'message': 'AI features are currently unavailable. Please configure the API key.'
                 }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             
-            summary = ai_engine.generate_portfolio_summary(portfolio_data)
+            if wants_stream(request):
+                events = await ai_engine.agenerate_portfolio_summary(
+                    portfolio_data, refresh=wants_refresh(request), stream=True
+                )
+                return sse_response(stored_stream(
+                    events, 'portfolio_summary', 'portfolio', fingerprint, ai_engine.model, user=request.user
+                ))
+            
+            summary = await ai_engine.agenerate_portfolio_summary(portfolio_data, refresh=wants_refresh(request))
             
             if summary.get('error', False):
                 logger.error(f"AI error in portfolio summary: {summary.get('error_message')}")
@@ -112,6 +158,9 @@ class PortfolioSummaryView(APIView):
                     'message': summary.get('response', 'AI service temporarily unavailable')
                 }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             
+            await sync_to_async(store_insight)(
+                'portfolio_summary', 'portfolio', fingerprint, ai_engine.model, summary, user=request.user
+            )
             return Response(summary)
             
         except Exception as e:
@@ -122,13 +171,13 @@ class PortfolioSummaryView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class RiskAnalysisView(APIView):
+class RiskAnalysisView(AsyncAPIView):
     """
     Analyze a specific risk using AI
     """
-    def get(self, request, risk_id):
+    async def get(self, request, risk_id):
         try:
-            risk = Risk.objects.get(id=risk_id)
+            risk = await Risk.objects.select_related('project').aget(id=risk_id)
         except Risk.DoesNotExist:
             return Response(
                 {'error': 'Risk not found'},
@@ -136,21 +185,18 @@ class RiskAnalysisView(APIView):
             )
         
         # Prepare risk data
-        risk_data = {
-            'title': risk.title,
-            'category': risk.category,
-            'severity': risk.severity,
-            'probability': risk.probability,
-            'impact': risk.impact,
-            'description': risk.description,
-            'mitigation_plan': risk.mitigation_plan,
-            'project_name': risk.project.name,
-            'risk_score': risk.risk_score,
-        }
+        risk_data = risk_analysis_data(risk)
         
         # Generate AI analysis
         try:
-            ai_engine = PMOAIEngine()
+            ai_engine = PMOAIEngine(user=request.user)
+            fingerprint = ai_engine.risk_fingerprint(risk_data)
+            
+            # Analysis stored by analyze_risks (or an earlier request) while the risk is unchanged
+            if not wants_stream(request) and not wants_refresh(request):
+                stored = await RiskAnalysis.objects.filter(risk=risk, fingerprint=fingerprint).afirst()
+                if stored is not None:
+                    return Response(stored.response())
             
             if ai_engine.demo_mode:
                 return Response({
@@ -158,7 +204,10 @@ class RiskAnalysisView(APIView):
                     'message': 'AI features are currently unavailable. Please configure the API key.'
                 }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             
-            analysis = ai_engine.analyze_risk(risk_data)
+            if wants_stream(request):
+                return sse_response(await ai_engine.aanalyze_risk(risk_data, refresh=wants_refresh(request), stream=True))
+            
+            analysis = await ai_engine.aanalyze_risk(risk_data, refresh=wants_refresh(request))
             
             if analysis.get('error', False):
                 logger.error(f"AI error in risk analysis: {analysis.get('error_message')}")
@@ -167,6 +216,7 @@ class RiskAnalysisView(APIView):
                     'message': analysis.get('response', 'AI service temporarily unavailable')
                 }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             
+            await sync_to_async(RiskAnalysis.store)(risk.pk, fingerprint, ai_engine.model, analysis)
             return Response(analysis)
             
         except Exception as e:
@@ -177,11 +227,11 @@ class RiskAnalysisView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class PMOQuestionView(APIView):
+class PMOQuestionView(AsyncAPIView):
     """
     Answer a PMO question using AI
     """
-    def post(self, request):
+    async def post(self, request):
         question = request.data.get('question')
         
         if not question:
@@ -192,31 +242,10 @@ class PMOQuestionView(APIView):
         
         # Gather context data
         try:
-            projects = Project.objects.all()[:5]
-            recent_projects = []
-            for p in projects:
-                recent_projects.append({
-                    'name': p.name,
-                    'code': p.code,
-                    'status': p.status,
-                    'spi': float(p.spi),
-                    'cpi': float(p.cpi),
-                    'completion_percentage': p.completion_percentage,
-                    'health_score': p.health_score,
-                })
-            
-            context_data = {
-                'portfolio': {
-                    'total_projects': Project.objects.count(),
-                    'on_track': Project.objects.filter(status='on_track').count(),
-                    'at_risk': Project.objects.filter(status='at_risk').count(),
-                    'delayed': Project.objects.filter(status='delayed').count(),
-                },
-                'recent_projects': recent_projects
-            }
+            context_data = await pmo_question_context(question)
             
             # Get AI answer
-            ai_engine = PMOAIEngine()
+            ai_engine = PMOAIEngine(user=request.user)
             
             # Check if engine is in demo mode
             if ai_engine.demo_mode:
@@ -226,7 +255,12 @@ class PMOQuestionView(APIView):
                     'answer': '❌ AI service is not configured. Please contact your administrator.'
                 }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             
-            ai_response = ai_engine.answer_pmo_question(question, context_data)
+            if wants_stream(request):
+                return sse_response(
+                    await ai_engine.aanswer_pmo_question(question, context_data, stream=True), render_markdown=True
+                )
+            
+            ai_response = await ai_engine.aanswer_pmo_question(question, context_data)
             
             # CRITICAL FIX: Check if AI returned an error
             if ai_response.get('error', False):
@@ -239,44 +273,8 @@ class PMOQuestionView(APIView):
                     'answer': f'❌ Sorry, I encountered an error: {ai_response.get("response", error_message)}'
                 }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             
-            # Format response for frontend
-            # AI might return structured JSON or a simple response
-            if isinstance(ai_response, dict):
-                if 'response' in ai_response:
-                    # Simple response format - convert newlines to HTML
-                    raw_text = ai_response['response']
-                    
-                    # Check if raw_text itself is a JSON string
-                    import json
-                    try:
-                        parsed = json.loads(raw_text)
-                        if isinstance(parsed, dict) and 'response' in parsed:
-                            raw_text = parsed['response']
-                    except (json.JSONDecodeError, TypeError):
-                        pass
-                    
-                    # Strip JSON wrapper if present
-                    import re
-                    raw_text = re.sub(r'^```json\s*\n?', '', raw_text, flags=re.IGNORECASE)
-                    raw_text = re.sub(r'\n?```\s*$', '', raw_text)
-                    raw_text = re.sub(r'^\{\s*"response":\s*"', '', raw_text)
-                    raw_text = re.sub(r'"\s*\}\s*$', '', raw_text)
-                    
-                    # Now convert newlines to <br>
-                    answer_text = raw_text.replace('\\n', '<br>').replace('\n', '<br>')
-                elif 'answer' in ai_response:
-                    # Already has answer key - convert newlines to HTML
-                    answer_text = ai_response['answer'].replace('\\n', '<br>').replace('\n', '<br>')
-                else:
-                    # Convert structured response to HTML
-                    answer_text = self._format_ai_response(ai_response)
-            else:
-                raw_text = str(ai_response)
-                # Strip JSON wrapper if present
-                import re
-                raw_text = re.sub(r'^```json\s*\n?', '', raw_text, flags=re.IGNORECASE)
-                raw_text = re.sub(r'\n?```\s*$', '', raw_text)
-                answer_text = raw_text.replace('\\n', '<br>').replace('\n', '<br>')
+            # The answer is markdown; the frontend shows it as HTML
+            answer_text = render_markdown(answer_markdown(ai_response.get('response', '')))
             
             return Response({
                 'answer': answer_text,
@@ -291,157 +289,13 @@ class PMOQuestionView(APIView):
                 'message': 'An error occurred while processing your question',
                 'answer': '❌ An unexpected error occurred. Please try again.'
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-    
-    def _format_ai_response(self, ai_response):
-        """Format structured AI response into HTML with proper line breaks"""
-        import json
-        parts = []
-        
-        # Handle new JSON structure with summary, critical_risks, etc.
-        if 'summary' in ai_response:
-            parts.append(f"<strong>Summary:</strong><br>")
-            parts.append(f"{ai_response['summary']}<br><br>")
-        
-        if 'critical_risks' in ai_response and ai_response['critical_risks']:
-            parts.append(f"<strong>Critical Risks:</strong><br>")
-            for risk in ai_response['critical_risks']:
-                parts.append(f"• {risk}<br>")
-            parts.append("<br>")
-        
-        if 'risk_indicators' in ai_response and ai_response['risk_indicators']:
-            parts.append(f"<strong>Risk Indicators:</strong><br>")
-            for indicator in ai_response['risk_indicators']:
-                parts.append(f"• {indicator}<br>")
-            parts.append("<br>")
-        
-        if 'risk_categories' in ai_response and ai_response['risk_categories']:
-            categories = ai_response['risk_categories']
-            
-            if 'high_risk' in categories and categories['high_risk']:
-                parts.append(f"<strong>High Risk Projects:</strong><br>")
-                for item in categories['high_risk']:
-                    parts.append(f"<strong>{item.get('project', 'Unknown')}</strong><br>")
-                    if 'risks' in item:
-                        for risk in item['risks']:
-                            parts.append(f"&nbsp;&nbsp;&nbsp;• {risk}<br>")
-                parts.append("<br>")
-            
-            if 'medium_risk' in categories and categories['medium_risk']:
-                parts.append(f"<strong>Medium Risk Projects:</strong><br>")
-                for item in categories['medium_risk']:
-                    parts.append(f"<strong>{item.get('project', 'Unknown')}</strong><br>")
-                    if 'risks' in item:
-                        for risk in item['risks']:
-                            parts.append(f"&nbsp;&nbsp;&nbsp;• {risk}<br>")
-                parts.append("<br>")
-        
-        if 'immediate_actions' in ai_response and ai_response['immediate_actions']:
-            parts.append(f"<strong>Immediate Actions Required:</strong><br>")
-            for i, action in enumerate(ai_response['immediate_actions'], 1):
-                parts.append(f"{i}. {action}<br>")
-            parts.append("<br>")
-        
-        if 'monitoring_focus' in ai_response and ai_response['monitoring_focus']:
-            parts.append(f"<strong>Monitoring Focus:</strong><br>")
-            for focus in ai_response['monitoring_focus']:
-                parts.append(f"• {focus}<br>")
-            parts.append("<br>")
-        
-        # Handle risk_assessment structure
-        if 'risk_assessment' in ai_response:
-            risk = ai_response['risk_assessment']
-            
-            if 'portfolio_risk_level' in risk:
-                parts.append(f"<strong>Portfolio Risk Level: {risk['portfolio_risk_level']}</strong><br><br>")
-            
-            if 'critical_findings' in risk and risk['critical_findings']:
-                parts.append("<strong>Critical Findings:</strong><br>")
-                for finding in risk['critical_findings']:
-                    parts.append(f"• {finding}<br>")
-                parts.append("<br>")
-        
-        # Handle identified_risks
-        if 'identified_risks' in ai_response and ai_response['identified_risks']:
-            parts.append("<strong>Projects Requiring Immediate Attention:</strong><br><br>")
-            
-            for i, risk in enumerate(ai_response['identified_risks'], 1):
-                parts.append(f"<strong>{i}. {risk.get('project', 'Unknown Project')} - {risk.get('risk_level', 'Unknown')} Risk</strong><br>")
-                
-                if 'key_risks' in risk and risk['key_risks']:
-                    for key_risk in risk['key_risks']:
-                        parts.append(f"&nbsp;&nbsp;&nbsp;• {key_risk}<br>")
-                
-                if 'impact' in risk:
-                    parts.append(f"&nbsp;&nbsp;&nbsp;Impact: {risk['impact']}<br>")
-                
-                parts.append("<br>")
-        
-        # Handle portfolio_risk_indicators
-        if 'portfolio_risk_indicators' in ai_response and ai_response['portfolio_risk_indicators']:
-            parts.append("<strong>Portfolio Risk Indicators:</strong><br><br>")
-            
-            for indicator in ai_response['portfolio_risk_indicators']:
-                parts.append(f"• <strong>{indicator.get('indicator', 'Indicator')}:</strong> {indicator.get('status', 'Unknown')}<br>")
-                if 'details' in indicator:
-                    parts.append(f"&nbsp;&nbsp;{indicator['details']}<br>")
-            parts.append("<br>")
-        
-        # Handle recommended_risk_controls
-        if 'recommended_risk_controls' in ai_response and ai_response['recommended_risk_controls']:
-            parts.append("<strong>Recommended Risk Controls:</strong><br><br>")
-            for i, control in enumerate(ai_response['recommended_risk_controls'], 1):
-                parts.append(f"{i}. {control}<br>")
-            parts.append("<br>")
-        
-        # Handle health_summary (legacy format)
-        if 'health_summary' in ai_response and not parts:
-            summary = ai_response['health_summary']
-            if isinstance(summary, dict):
-                if 'status' in summary:
-                    parts.append(f"<strong>Status: {summary.get('status')}</strong><br>")
-                if 'overall_assessment' in summary:
-                    parts.append(f"{summary.get('overall_assessment')}<br><br>")
-        
-        # Handle insights (legacy format)
-        if 'insights' in ai_response and ai_response['insights'] and not any('Insights' in p for p in parts):
-            parts.append("<strong>Key Insights:</strong><br>")
-            for insight in ai_response['insights']:
-                parts.append(f"• {insight}<br>")
-            parts.append("<br>")
-        
-        # Handle recommendations (legacy format)
-        if 'recommendations' in ai_response and ai_response['recommendations'] and not any('Recommendations' in p for p in parts):
-            parts.append("<strong>Recommendations:</strong><br>")
-            for i, rec in enumerate(ai_response['recommendations'], 1):
-                parts.append(f"{i}. {rec}<br>")
-            parts.append("<br>")
-        
-        # Handle key_metrics
-        if 'key_metrics' in ai_response and ai_response['key_metrics']:
-            parts.append("<strong>Key Metrics:</strong><br>")
-            metrics = ai_response['key_metrics']
-            if isinstance(metrics, dict):
-                for key, value in metrics.items():
-                    parts.append(f"• {key}: {value}<br>")
-            parts.append("<br>")
-        
-        # If we have content, return it
-        if parts:
-            return "".join(parts)
-        
-        # Fallback: Format the text with line breaks
-        if isinstance(ai_response, str):
-            return ai_response.replace('\n', '<br>')
-        
-        # Last resort: Pretty print JSON
-        return "<pre>" + json.dumps(ai_response, indent=2) + "</pre>"
 
 
-class ProjectComparisonView(APIView):
+class ProjectComparisonView(AsyncAPIView):
     """
     Compare multiple projects using AI
     """
-    def post(self, request):
+    async def post(self, request):
         project_ids = request.data.get('project_ids', [])
         
         if not project_ids:
@@ -451,32 +305,20 @@ class ProjectComparisonView(APIView):
             )
         
         # Get projects
-        projects = Project.objects.filter(id__in=project_ids)
+        projects = Project.objects.filter(id__in=project_ids).with_health().with_risk_counts()
         
-        if not projects.exists():
+        if not await projects.aexists():
             return Response(
                 {'error': 'No projects found'},
                 status=status.HTTP_404_NOT_FOUND
             )
         
         # Prepare project data
-        projects_data = []
-        for project in projects:
-            projects_data.append({
-                'name': project.name,
-                'code': project.code,
-                'status': project.status,
-                'completion_percentage': project.completion_percentage,
-                'spi': float(project.spi),
-                'cpi': float(project.cpi),
-                'health_score': project.health_score,
-                'total_risks': project.risks.count(),
-                'high_risks': project.risks.filter(severity__in=['high', 'critical']).count(),
-            })
+        projects_data = [comparison_project_data(project) async for project in projects]
         
         # Generate comparison
         try:
-            ai_engine = PMOAIEngine()
+            ai_engine = PMOAIEngine(user=request.user)
             
             if ai_engine.demo_mode:
                 return Response({
@@ -484,7 +326,10 @@ class ProjectComparisonView(APIView):
                     'message': 'AI features are currently unavailable. Please configure the API key.'
                 }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             
-            comparison = ai_engine.compare_projects(projects_data)
+            if wants_stream(request):
+                return sse_response(await ai_engine.acompare_projects(projects_data, stream=True))
+            
+            comparison = await ai_engine.acompare_projects(projects_data)
             
             if comparison.get('error', False):
                 logger.error(f"AI error in project comparison: {comparison.get('error_message')}")
@@ -503,43 +348,239 @@ class ProjectComparisonView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
-class ExecutiveReportView(APIView):
+def project_summary_data(project):
+    """Project figures sent to the project summary prompt (project from with_health().with_risk_counts())"""
+    return {
+        'name': project.name,
+        'code': project.code,
+        'status': project.status,
+        'completion_percentage': project.completion_percentage,
+        'spi': float(project.spi),
+        'cpi': float(project.cpi),
+        'total_risks': project.total_risks,
+        'high_risks': project.high_risks,
+        'budget': float(project.budget),
+        'spent': float(project.spent),
+        'days_remaining': project.days_remaining,
+        'health_score': project.health_score,
+    }
+
+
+def risk_analysis_data(risk):
+    """Risk details sent to the risk analysis prompt"""
+    return {
+        'title': risk.title,
+        'category': risk.category,
+        'severity': risk.severity,
+        'probability': risk.probability,
+        'impact': risk.impact,
+        'description': risk.description,
+        'mitigation_plan': risk.mitigation_plan,
+        'project_name': risk.project.name,
+        'risk_score': risk.risk_score,
+    }
+
+
+def comparison_project_data(project):
+    """One project's row in the project comparison prompt"""
+    return {
+        'name': project.name,
+        'code': project.code,
+        'status': project.status,
+        'completion_percentage': project.completion_percentage,
+        'spi': float(project.spi),
+        'cpi': float(project.cpi),
+        'health_score': project.health_score,
+        'total_risks': project.total_risks,
+        'high_risks': project.high_risks,
+    }
+
+
+def question_record_rows(hits):
+    """{table: [row]} for retrieval hits [(kind, pk, score)], keeping their order"""
+    pks = {}
+    for kind, pk, _ in hits:
+        pks.setdefault(kind, []).append(pk)
+    
+    querysets = {
+        'project': Project.objects.with_health(),
+        'risk': Risk.objects.select_related('project'),
+        'task': Task.objects.select_related('project'),
+        'issue': Issue.objects.select_related('project'),
+    }
+    records = {kind: querysets[kind].in_bulk(kind_pks) for kind, kind_pks in pks.items()}
+    
+    rows = []
+    for kind, pk, _ in hits:
+        record = records[kind].get(pk)
+        if record is None:
+            continue
+        if kind == 'project':
+            rows.append(('relevant_projects', {
+                'name': record.name,
+                'code': record.code,
+                'status': record.status,
+                'spi': float(record.spi),
+                'cpi': float(record.cpi),
+                'completion_percentage': record.completion_percentage,
+                'health_score': record.health_score,
+                'description': record.description,
+            }))
+        elif kind == 'risk':
+            rows.append(('relevant_risks', {
+                'project': record.project.code,
+                'title': record.title,
+                'severity': record.severity,
+                'status': record.status,
+                'risk_score': record.risk_score,
+                'owner': record.owner,
+                'description': record.description,
+                'mitigation_plan': record.mitigation_plan,
+            }))
+        elif kind == 'task':
+            rows.append(('relevant_tasks', {
+                'project': record.project.code,
+                'name': record.name,
+                'status': record.status,
+                'assigned_to': record.assigned_to,
+                'due_date': record.due_date,
+                'completion_percentage': record.completion_percentage,
+                'is_overdue': record.is_overdue,
+                'description': record.description,
+            }))
+        else:
+            rows.append(('relevant_issues', {
+                'project': record.project.code,
+                'title': record.title,
+                'severity': record.severity,
+                'status': record.status,
+                'assigned_to': record.assigned_to,
+                'description': record.description,
+            }))
+    return rows
+
+
+def question_records(question, base, budget):
     """
-    Generate comprehensive executive report
+    Add to the `base` context the records that best match the question, best
+    first, as many of the top AI_RETRIEVAL_TOP_K as fit in `budget` tokens
     """
-    def get(self, request):
-        # Get portfolio data
-        portfolio_data = {
-            'total_projects': Project.objects.count(),
-            'on_track': Project.objects.filter(status='on_track').count(),
-            'at_risk': Project.objects.filter(status='at_risk').count(),
-            'delayed': Project.objects.filter(status='delayed').count(),
-            'avg_completion': round(Project.objects.aggregate(
-                avg=Avg('completion_percentage')
-            )['avg'] or 0, 2),
-            'projects_behind_schedule': Project.objects.filter(spi__lt=0.9).count(),
-            'total_risks': Risk.objects.count(),
-            'high_risks': Risk.objects.filter(severity__in=['high', 'critical']).count(),
-        }
-        
-        # Get top critical projects
-        critical_projects = Project.objects.filter(
-            status__in=['at_risk', 'delayed']
-        )[:10]
+    hits = retrieval_search(question, getattr(settings, 'AI_RETRIEVAL_TOP_K', 20))
+    context = dict(base)
+    for table, row in question_record_rows(hits):
+        candidate = {**context, table: context.get(table, []) + [row]}
+        # The best match is always sent; build_context shortens it if needed
+        if len(context) > len(base) and estimate_tokens(encode_compact(candidate)) > budget:
+            break
+        context = candidate
+    return context
+
+
+async def pmo_question_context(question):
+    """Portfolio counts and the records most relevant to a PMO question"""
+    context = {
+        'portfolio': {
+            'total_projects': await Project.objects.acount(),
+            'on_track': await Project.objects.filter(status='on_track').acount(),
+            'at_risk': await Project.objects.filter(status='at_risk').acount(),
+            'delayed': await Project.objects.filter(status='delayed').acount(),
+        },
+    }
+    context = await sync_to_async(question_records)(question, context, context_budget('pmo_question'))
+    if len(context) > 1:
+        return context
+    
+    # Nothing matches the question: fall back to the newest projects
+    recent_projects = []
+    async for p in Project.objects.with_health()[:5]:
+        recent_projects.append({
+            'name': p.name,
+            'code': p.code,
+            'status': p.status,
+            'spi': float(p.spi),
+            'cpi': float(p.cpi),
+            'completion_percentage': p.completion_percentage,
+            'health_score': p.health_score,
+        })
+    context['recent_projects'] = recent_projects
+    return context
+
+
+def portfolio_summary_data():
+    """Portfolio figures sent to the portfolio summary prompt"""
+    portfolio = PortfolioStats()
+    projects = portfolio.projects
+    risks = portfolio.risks
+    
+    return {
+        'total_projects': projects['total'],
+        'on_track': projects['by_status']['on_track'],
+        'at_risk': projects['by_status']['at_risk'],
+        'delayed': projects['by_status']['delayed'],
+        'completed': projects['by_status']['completed'],
+        'projects_behind_schedule': projects['by_spi']['behind'],
+        'avg_completion': round(projects['avg_completion'], 2),
+        'avg_spi': round(projects['avg_spi'], 2),
+        'total_risks': risks['total'],
+        'high_risks': risks['high'],
+    }
+
+
+def executive_report_data():
+    """Portfolio figures and the top critical projects sent to the executive report prompt"""
+    portfolio = PortfolioStats()
+    projects = portfolio.projects
+    risks = portfolio.risks
+    
+    portfolio_data = {
+        'total_projects': projects['total'],
+        'on_track': projects['by_status']['on_track'],
+        'at_risk': projects['by_status']['at_risk'],
+        'delayed': projects['by_status']['delayed'],
+        'avg_completion': round(projects['avg_completion'], 2),
+        'projects_behind_schedule': projects['by_spi']['behind'],
+        'total_risks': risks['total'],
+        'high_risks': risks['high'],
+    }
+    
+    # Get top critical projects
+    critical_projects = Project.objects.filter(
+        status__in=['at_risk', 'delayed']
+    ).with_health()[:10]
+    
+    projects_data = []
+    for project in critical_projects:
+        projects_data.append({
+            'name': project.name,
+            'status': project.status,
+            'spi': float(project.spi),
+            'completion_percentage': project.completion_percentage,
+            'health_score': project.health_score,
+        })
+    
+    return portfolio_data, projects_data
+
+
+class ExecutiveReportView(AsyncAPIView):
+    """
+    Generate comprehensive executive report.
+    With ?async=1 the report is built by a background job instead (see /api/jobs/).
+    With ?stream=1 it is streamed as Server-Sent Events.
+    """
+    async def get(self, request):
+        if request.query_params.get('async') in ('1', 'true'):
+            if not request.user.is_authenticated:
+                return Response({'error': 'Authentication required'}, status=status.HTTP_401_UNAUTHORIZED)
+            job = await sync_to_async(enqueue_job)(
+                'executive_report', params={'refresh': wants_refresh(request)}, user=request.user
+            )
+            return Response(JobSerializer(job, context={'request': request}).data, status=status.HTTP_202_ACCEPTED)
         
-        projects_data = []
-        for project in critical_projects:
-            projects_data.append({
-                'name': project.name,
-                'status': project.status,
-                'spi': float(project.spi),
-                'completion_percentage': project.completion_percentage,
-                'health_score': project.health_score,
-            })
+        portfolio_data, projects_data = await sync_to_async(executive_report_data)()
         
         # Generate executive report
         try:
-            ai_engine = PMOAIEngine()
+            ai_engine = PMOAIEngine(user=request.user)
             
             if ai_engine.demo_mode:
                 return Response({
@@ -547,7 +588,12 @@ class ExecutiveReportView(APIView):
                     'message': 'AI features are currently unavailable. Please configure the API key.'
                 }, status=status.HTTP_503_SERVICE_UNAVAILABLE)
             
-            report = ai_engine.generate_executive_report(portfolio_data, projects_data)
+            if wants_stream(request):
+                return sse_response(await ai_engine.agenerate_executive_report(
+                    portfolio_data, projects_data, refresh=wants_refresh(request), stream=True
+                ))
+            
+            report = await ai_engine.agenerate_executive_report(portfolio_data, projects_data, refresh=wants_refresh(request))
             
             if report.get('error', False):
                 logger.error(f"AI error in executive report: {report.get('error_message')}")
@@ -566,6 +612,37 @@ class ExecutiveReportView(APIView):
             }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
 
+class AICacheStatsView(APIView):
+    """Hit/miss counters of the AI response cache and prompt cache token usage (admin only)"""
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        return Response({**get_response_cache_stats(), 'prompt_cache': get_prompt_cache_stats()})
+
+
+class AIMetricsView(APIView):
+    """
+    Latency percentiles, tokens and cost of AI calls per method and per user (admin only).
+    Covers this worker process since it started; ?source=log summarizes the saved
+    AICallLog rows (AI_CALL_LOG) of the last ?hours=24 instead.
+    """
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        if request.query_params.get('source') == 'log':
+            try:
+                hours = int(request.query_params.get('hours', 24))
+            except ValueError:
+                return Response({'error': 'hours must be an integer'}, status=status.HTTP_400_BAD_REQUEST)
+            since = timezone.now() - timedelta(hours=hours)
+            metrics = summarize_logs(AICallLog.objects.filter(created_at__gte=since))
+            metrics['since'] = since
+        else:
+            metrics = get_metrics()
+        metrics['governor'] = get_governor().stats()
+        return Response(metrics)
+
+
 # DIAGNOSTIC ENDPOINT - Keep this for testing
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
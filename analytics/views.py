@@ -4,6 +4,8 @@ from django.db.models import Count, Avg, Sum, Q
 from django.utils import timezone
 from datetime import timedelta
 from projects.models import Project, Task, Risk, Resource, Milestone
+from projects.cache import cached
+from projects.services import PortfolioStats
 from accounts.models import ActivityLog
 
 
@@ -11,61 +13,58 @@ from accounts.models import ActivityLog
 def analytics_dashboard(request):
     """Main analytics dashboard with portfolio overview"""
     
+    portfolio = PortfolioStats()
+    projects = portfolio.projects
+    risks = portfolio.risks
+    tasks = portfolio.tasks
+    
     # Portfolio Summary
-    total_projects = Project.objects.count()
-    active_projects = Project.objects.exclude(status='completed').count()
+    total_projects = projects['total']
+    active_projects = projects['active']
     
     status_breakdown = {
-        'on_track': Project.objects.filter(status='on_track').count(),
-        'at_risk': Project.objects.filter(status='at_risk').count(),
-        'delayed': Project.objects.filter(status='delayed').count(),
-        'completed': Project.objects.filter(status='completed').count(),
+        'on_track': projects['by_status']['on_track'],
+        'at_risk': projects['by_status']['at_risk'],
+        'delayed': projects['by_status']['delayed'],
+        'completed': projects['by_status']['completed'],
     }
     
     # Performance Metrics
-    avg_completion = Project.objects.aggregate(avg=Avg('completion_percentage'))['avg'] or 0
-    avg_spi = Project.objects.aggregate(avg=Avg('spi'))['avg'] or 0
-    avg_cpi = Project.objects.aggregate(avg=Avg('cpi'))['avg'] or 0
+    avg_completion = projects['avg_completion']
+    avg_spi = projects['avg_spi']
+    avg_cpi = projects['avg_cpi']
     
     # Budget Analysis
-    total_budget = Project.objects.aggregate(total=Sum('budget'))['total'] or 0
-    total_spent = Project.objects.aggregate(total=Sum('spent'))['total'] or 0
+    total_budget = projects['total_budget']
+    total_spent = projects['total_spent']
     budget_variance = float(total_budget) - float(total_spent)
     budget_utilization = (float(total_spent) / float(total_budget) * 100) if total_budget > 0 else 0
     
     # Risk Analysis
-    total_risks = Risk.objects.count()
+    total_risks = risks['total']
     risk_by_severity = {
-        'critical': Risk.objects.filter(severity='critical').count(),
-        'high': Risk.objects.filter(severity='high').count(),
-        'medium': Risk.objects.filter(severity='medium').count(),
-        'low': Risk.objects.filter(severity='low').count(),
+        'critical': risks['by_severity']['critical'],
+        'high': risks['by_severity']['high'],
+        'medium': risks['by_severity']['medium'],
+        'low': risks['by_severity']['low'],
     }
     
     # Task Analysis
-    total_tasks = Task.objects.count()
-    completed_tasks = Task.objects.filter(status='completed').count()
-    overdue_tasks = Task.objects.filter(
-        status__in=['not_started', 'in_progress'],
-        due_date__lt=timezone.now().date()
-    ).count()
-    
-    # Top Projects (calculate health scores in Python since it's a property)
-    all_active_projects = Project.objects.exclude(status='completed')
-    projects_with_scores = []
-    
-    for project in all_active_projects:
-        projects_with_scores.append({
-            'project': project,
-            'health_score': project.health_score
-        })
-    
-    # Sort by health score
-    projects_with_scores.sort(key=lambda x: x['health_score'], reverse=True)
-    
-    # Get top 5 and bottom 5
-    top_projects = [item['project'] for item in projects_with_scores[:5]]
-    bottom_projects = [item['project'] for item in projects_with_scores[-5:]]
+    total_tasks = tasks['total']
+    completed_tasks = tasks['by_status']['completed']
+    overdue_tasks = tasks['overdue']
+    
+    # Top Projects (health score is annotated and sorted in the database)
+    def rank_projects():
+        all_active_projects = Project.objects.exclude(status='completed').with_health()
+        
+        # Get top 5 and bottom 5
+        return (
+            list(all_active_projects.order_by('-health', '-created_at')[:5]),
+            list(all_active_projects.order_by('health', 'created_at')[:5])[::-1],
+        )
+    
+    top_projects, bottom_projects = cached('analytics-ranked-projects', rank_projects)
     
     context = {
         'total_projects': total_projects,
@@ -97,11 +96,7 @@ def project_analytics(request):
     projects = Project.objects.all()
     
     # Performance Distribution
-    projects_by_spi = {
-        'ahead': projects.filter(spi__gte=1.1).count(),
-        'on_track': projects.filter(spi__gte=0.9, spi__lt=1.1).count(),
-        'behind': projects.filter(spi__lt=0.9).count(),
-    }
+    projects_by_spi = PortfolioStats().projects['by_spi']
     
     # Budget projects
     budget_projects = []
@@ -0,0 +1,12 @@
+from django.contrib import admin
+from .models import Job
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ['id', 'kind', 'status', 'progress', 'created_by', 'created_at', 'finished_at']
+    list_filter = ['kind', 'status', 'created_at']
+    readonly_fields = [
+        'id', 'kind', 'status', 'params', 'progress', 'message', 'source', 'artifact',
+        'result', 'error', 'created_by', 'created_at', 'started_at', 'finished_at',
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.0 on 2026-10-15 04:03
+
+import django.db.models.deletion
+import uuid
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.UUIDField(default=uuid.uuid4, editable=False, primary_key=True, serialize=False)),
+                ('kind', models.CharField(choices=[('export_all', 'Data export (ZIP)'), ('import_csv', 'CSV import'), ('portfolio_report', 'Portfolio report (PowerPoint)'), ('executive_report', 'AI executive report')], max_length=30)),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('succeeded', 'Succeeded'), ('failed', 'Failed')], default='queued', max_length=20)),
+                ('params', models.JSONField(blank=True, default=dict)),
+                ('progress', models.IntegerField(default=0, help_text='Percent complete (0-100)')),
+                ('message', models.CharField(blank=True, max_length=255)),
+                ('source', models.FileField(blank=True, upload_to='jobs/sources/%Y/%m/')),
+                ('artifact', models.FileField(blank=True, upload_to='jobs/artifacts/%Y/%m/')),
+                ('result', models.JSONField(blank=True, null=True)),
+                ('error', models.TextField(blank=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True)),
+                ('finished_at', models.DateTimeField(blank=True, null=True)),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='jobs', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['created_by', '-created_at'], name='jobs_job_created_d1be9f_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.0 on 2026-10-15 04:06
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('jobs', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='job',
+            name='kind',
+            field=models.CharField(choices=[('export_all', 'Data export (ZIP)'), ('export_columnar', 'Columnar export (Parquet/Feather)'), ('import_csv', 'CSV import'), ('portfolio_report', 'Portfolio report (PowerPoint)'), ('executive_report', 'AI executive report')], max_length=30),
+        ),
+    ]
@@ -0,0 +1,73 @@
+import uuid
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+
+
+class Job(models.Model):
+    """A long-running operation executed by a Celery worker, with progress and an optional artifact"""
+    
+    KIND_CHOICES = [
+        ('export_all', 'Data export (ZIP)'),
+        ('export_columnar', 'Columnar export (Parquet/Feather)'),
+        ('import_csv', 'CSV import'),
+        ('portfolio_report', 'Portfolio report (PowerPoint)'),
+        ('executive_report', 'AI executive report'),
+        ('analyze_risks', 'AI risk analysis batch'),
+    ]
+    
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('succeeded', 'Succeeded'),
+        ('failed', 'Failed'),
+    ]
+    
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    kind = models.CharField(max_length=30, choices=KIND_CHOICES)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued')
+    
+    params = models.JSONField(default=dict, blank=True)
+    progress = models.IntegerField(default=0, help_text="Percent complete (0-100)")
+    message = models.CharField(max_length=255, blank=True)
+    
+    # Uploaded input (CSV imports) and produced file (exports, reports)
+    source = models.FileField(upload_to='jobs/sources/%Y/%m/', blank=True)
+    artifact = models.FileField(upload_to='jobs/artifacts/%Y/%m/', blank=True)
+    result = models.JSONField(null=True, blank=True)
+    error = models.TextField(blank=True)
+    
+    created_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, on_delete=models.SET_NULL, null=True, blank=True, related_name='jobs'
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_by', '-created_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.get_kind_display()} ({self.get_status_display()})"
+    
+    def set_progress(self, progress, message=''):
+        """Record progress from the worker without touching other fields"""
+        self.progress = max(0, min(100, int(progress)))
+        self.message = message[:255]
+        Job.objects.filter(pk=self.pk).update(progress=self.progress, message=self.message)
+    
+    def mark_succeeded(self, result=None):
+        self.status = 'succeeded'
+        self.progress = 100
+        self.result = result
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'progress', 'result', 'finished_at', 'artifact'])
+    
+    def mark_failed(self, error):
+        self.status = 'failed'
+        self.error = error
+        self.finished_at = timezone.now()
+        self.save(update_fields=['status', 'error', 'finished_at'])
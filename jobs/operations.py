@@ -0,0 +1,125 @@
+"""
+Background operations: data export, CSV import, PowerPoint and AI reports, batch risk analysis.
+"""
+import os
+import tempfile
+from datetime import datetime
+from django.core.files import File
+from projects.columnar import archive_stream, write_tables
+from projects.exports import EXPORTS, export_members, zip_stream
+from projects.imports import IMPORTS, import_csv
+from .runner import operation
+
+
+def _save_artifact(job, filename, fileobj):
+    fileobj.seek(0)
+    job.artifact.save(filename, File(fileobj), save=False)
+
+
+@operation('export_all')
+def export_all(job):
+    """All export tables as a ZIP, written to a temporary file chunk by chunk"""
+    file_format = job.params.get('format', 'csv')
+
+    def members():
+        for index, (filename, chunks) in enumerate(export_members(file_format)):
+            job.set_progress(index * 100 / len(EXPORTS), f'Exporting {filename}')
+            yield filename, chunks
+
+    with tempfile.TemporaryFile() as archive:
+        for chunk in zip_stream(members()):
+            archive.write(chunk)
+        _save_artifact(job, 'pmo_data_export.zip', archive)
+
+    return {'format': file_format}
+
+
+@operation('export_columnar')
+def export_columnar(job):
+    """Parquet/Feather files for every table, zipped into the artifact"""
+    output_dir = tempfile.mkdtemp(prefix='pmo-columnar-')
+    job.set_progress(5, 'Writing tables')
+    files = write_tables(
+        output_dir,
+        tables=job.params.get('tables'),
+        file_format=job.params.get('format', 'parquet'),
+        partition=job.params.get('partition'),
+    )
+
+    job.set_progress(80, 'Packaging files')
+    with tempfile.TemporaryFile() as archive:
+        # archive_stream removes output_dir once the ZIP is complete
+        for chunk in archive_stream(output_dir, files):
+            archive.write(chunk)
+        _save_artifact(job, f'pmo_data_{job.params.get("format", "parquet")}.zip', archive)
+
+    return {table: len(paths) for table, paths in files.items()}
+
+
+@operation('import_csv')
+def import_table(job):
+    """Import the uploaded CSV; progress follows the bytes read from the upload"""
+    importer = IMPORTS[job.params['table']]
+    size = job.source.size or 1
+
+    with job.source.open('rb') as source:
+        def progress(result):
+            processed = result.created + result.updated + result.unchanged + result.error_count
+            job.set_progress(source.tell() * 100 / size, f'{processed} rows processed')
+
+        result = import_csv(importer, source, progress=progress)
+
+    return result.as_dict()
+
+
+@operation('portfolio_report')
+def portfolio_report(job):
+    from projects.reporting.ppt_generator import generate_portfolio_report
+
+    filename = f'PMO_Report_{datetime.now().strftime("%Y%m%d")}.pptx'
+    with tempfile.TemporaryDirectory() as directory:
+        path = generate_portfolio_report(os.path.join(directory, filename))
+        with open(path, 'rb') as report:
+            _save_artifact(job, filename, report)
+
+    return {'filename': filename}
+
+
+@operation('executive_report')
+def executive_report(job):
+    from ai_engine.service import PMOAIEngine
+    from ai_engine.views import executive_report_data
+
+    job.set_progress(10, 'Collecting portfolio data')
+    portfolio_data, projects_data = executive_report_data()
+
+    ai_engine = PMOAIEngine(user=job.created_by)
+    if ai_engine.demo_mode:
+        raise RuntimeError('AI features are currently unavailable. Please configure the API key.')
+
+    job.set_progress(30, 'Generating report')
+    report = ai_engine.generate_executive_report(
+        portfolio_data, projects_data, refresh=job.params.get('refresh', False)
+    )
+    if report.get('error', False):
+        raise RuntimeError(report.get('response', 'AI service temporarily unavailable'))
+
+    return report
+
+
+@operation('analyze_risks')
+def analyze_risks(job):
+    """Analyze the selected risks and store the results (see ai_engine.batch)"""
+    from ai_engine.batch import DEFAULT_SEVERITIES, analyze_risks as run_batch, select_risks
+
+    severities = job.params.get('severity')
+    risks = select_risks(
+        severities=severities.split(',') if severities else DEFAULT_SEVERITIES,
+        project=job.params.get('project'),
+    )
+
+    def progress(done, total, risk):
+        job.set_progress(done * 100 / total, f'{done}/{total} risks analyzed')
+
+    job.set_progress(0, 'Selecting risks')
+    return run_batch(risks, force=job.params.get('force', False), user=job.created_by, progress=progress)
@@ -0,0 +1,56 @@
+"""
+Job registry, enqueueing and execution.
+
+Operations are plain functions registered with @operation(kind). They receive
+the Job, report progress with job.set_progress(), may save job.artifact, and
+return a JSON-serialisable result. Raising marks the job as failed.
+"""
+import logging
+from django.db import transaction
+from django.utils import timezone
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+OPERATIONS = {}
+
+
+def operation(kind):
+    def register(func):
+        OPERATIONS[kind] = func
+        return func
+    return register
+
+
+def enqueue_job(kind, params=None, user=None, source=None):
+    """Create a queued job and hand it to Celery once the current transaction commits"""
+    from .tasks import run_job
+
+    job = Job(kind=kind, params=params or {})
+    if user is not None and user.is_authenticated:
+        job.created_by = user
+    if source is not None:
+        job.source.save(source.name, source, save=False)
+    job.save()
+
+    transaction.on_commit(lambda: run_job.delay(str(job.pk)))
+    return job
+
+
+def execute_job(job_id):
+    """Run a queued job in the current process"""
+    # Claim the job atomically so a redelivered message cannot run it twice
+    claimed = Job.objects.filter(pk=job_id, status='queued').update(status='running', started_at=timezone.now())
+    if not claimed:
+        logger.warning(f"Job {job_id} is not queued, skipping")
+        return None
+
+    job = Job.objects.get(pk=job_id)
+    try:
+        result = OPERATIONS[job.kind](job)
+    except Exception as e:
+        logger.exception(f"Job {job_id} ({job.kind}) failed")
+        job.mark_failed(str(e) or e.__class__.__name__)
+    else:
+        job.mark_succeeded(result)
+    return job
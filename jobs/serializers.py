@@ -0,0 +1,64 @@
+from rest_framework import serializers
+from rest_framework.reverse import reverse
+from projects.columnar import COLUMNAR_FORMATS, PARTITIONS, parse_columnar_params
+from projects.exports import EXPORT_FORMATS
+from projects.imports import IMPORTS
+from projects.models import Risk
+from .models import Job
+
+
+class JobSerializer(serializers.ModelSerializer):
+    download_url = serializers.SerializerMethodField()
+    
+    class Meta:
+        model = Job
+        fields = (
+            'id', 'kind', 'status', 'progress', 'message', 'params', 'result', 'error',
+            'download_url', 'created_at', 'started_at', 'finished_at',
+        )
+        read_only_fields = fields
+    
+    def get_download_url(self, obj):
+        if obj.status != 'succeeded' or not obj.artifact:
+            return None
+        return reverse('job-download', args=[obj.pk], request=self.context.get('request'))
+
+
+class JobCreateSerializer(serializers.Serializer):
+    """Input for POST /api/jobs/: the job kind, its parameters and, for imports, the CSV file"""
+    kind = serializers.ChoiceField(choices=Job.KIND_CHOICES)
+    format = serializers.ChoiceField(choices=[*EXPORT_FORMATS, *COLUMNAR_FORMATS], required=False)
+    partition = serializers.ChoiceField(choices=PARTITIONS, required=False)
+    tables = serializers.CharField(required=False, help_text="Comma-separated tables for columnar exports")
+    table = serializers.ChoiceField(choices=list(IMPORTS), required=False)
+    file = serializers.FileField(required=False)
+    severity = serializers.CharField(required=False, help_text="Comma-separated risk severities for risk analysis batches")
+    project = serializers.CharField(required=False, help_text="Project code or id for risk analysis batches")
+    force = serializers.BooleanField(required=False, help_text="Re-analyze risks whose stored analysis is current")
+    
+    def validate(self, data):
+        if data['kind'] == 'export_all' and data.get('format', 'csv') not in EXPORT_FORMATS:
+            raise serializers.ValidationError({'format': 'Use csv or ndjson for data exports'})
+        if data['kind'] == 'export_columnar':
+            try:
+                data.update(parse_columnar_params(data))
+            except ValueError as e:
+                raise serializers.ValidationError(str(e))
+            data['format'] = data.pop('file_format')
+        if data['kind'] == 'analyze_risks' and data.get('severity'):
+            valid = [value for value, _ in Risk.SEVERITY_CHOICES]
+            if any(value not in valid for value in data['severity'].split(',')):
+                raise serializers.ValidationError({'severity': f'Use severities from {", ".join(valid)}'})
+        if data['kind'] == 'import_csv':
+            if 'table' not in data or 'file' not in data:
+                raise serializers.ValidationError('CSV imports need a table and a file')
+            if not data['file'].name.endswith('.csv'):
+                raise serializers.ValidationError({'file': 'File must be CSV format'})
+        return data
+    
+    def get_params(self):
+        return {
+            name: self.validated_data[name]
+            for name in ('format', 'partition', 'tables', 'table', 'severity', 'project', 'force')
+            if self.validated_data.get(name) not in (None, False)
+        }
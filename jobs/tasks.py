@@ -0,0 +1,8 @@
+from celery import shared_task
+from .runner import execute_job
+
+
+@shared_task(ignore_result=True)
+def run_job(job_id):
+    """Celery entry point for every job kind; the work itself lives in jobs.operations"""
+    execute_job(job_id)
@@ -0,0 +1,105 @@
+import shutil
+import tempfile
+import zipfile
+from io import BytesIO
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import TestCase, override_settings
+from projects.models import Project
+from projects.tests import make_project, make_risk
+from ai_engine.client import FakeTransport
+from ai_engine.models import RiskAnalysis
+from .models import Job
+from .runner import OPERATIONS, execute_job, operation
+
+
+class JobTests(TestCase):
+
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+        self.user = User.objects.create_user('runner', password='secret')
+        self.client.force_login(self.user)
+        self.project = make_project(1)
+
+    def start(self, data, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/jobs/', data, **kwargs)
+        self.assertEqual(response.status_code, 202)
+        return self.client.get(f"/api/jobs/{response.json()['id']}/").json()
+
+    def test_export_job_produces_downloadable_zip(self):
+        job = self.start({'kind': 'export_all', 'format': 'ndjson'})
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['progress'], 100)
+
+        response = self.client.get(job['download_url'])
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertIn('projects.ndjson', archive.namelist())
+
+    def test_import_job_reports_rows(self):
+        content = (
+            'project_id,project_name,start_date,end_date,budget,status\n'
+            f'{self.project.pk},Renamed,2024-01-15,2025-06-30,750000,Delayed\n'
+            'abc,Broken,2024-01-15,2025-06-30,750000,Delayed\n'
+        )
+        upload = SimpleUploadedFile('projects.csv', content.encode(), content_type='text/csv')
+        job = self.start({'kind': 'import_csv', 'table': 'projects', 'file': upload})
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['result']['updated'], 1)
+        self.assertEqual(job['result']['error_count'], 1)
+        self.assertIsNone(job['download_url'])
+        self.assertEqual(Project.objects.get().name, 'Renamed')
+
+    def test_failed_job_and_visibility(self):
+        @operation('test_failure')
+        def fail(job):
+            raise RuntimeError('Something broke')
+        self.addCleanup(OPERATIONS.pop, 'test_failure')
+
+        job = Job.objects.create(kind='test_failure', created_by=self.user)
+        with self.assertLogs('jobs.runner', 'ERROR'):
+            execute_job(job.pk)
+        with self.assertLogs('jobs.runner', 'WARNING'):
+            self.assertIsNone(execute_job(job.pk))
+        data = self.client.get(f'/api/jobs/{job.pk}/').json()
+        self.assertEqual((data['status'], data['error']), ('failed', 'Something broke'))
+
+        other = User.objects.create_user('other', password='secret')
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(f'/api/jobs/{job.pk}/').status_code, 404)
+
+    def test_import_requires_file(self):
+        response = self.client.post('/api/jobs/', {'kind': 'import_csv', 'table': 'tasks'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_columnar_export_job(self):
+        job = self.start({'kind': 'export_columnar', 'format': 'feather', 'tables': 'projects'})
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['result'], {'projects': 1})
+        self.assertEqual(job['params'], {'format': 'feather', 'tables': ['projects']})
+
+        response = self.client.get(job['download_url'])
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(archive.namelist(), ['projects/projects-0-0.feather'])
+        self.assertEqual(
+            self.client.post('/api/jobs/', {'kind': 'export_all', 'format': 'parquet'}).status_code, 400
+        )
+
+    def test_analyze_risks_job(self):
+        make_risk(self.project, severity='critical')
+        make_risk(self.project, severity='low')
+        self.assertEqual(
+            self.client.post('/api/jobs/', {'kind': 'analyze_risks', 'severity': 'urgent'}).status_code, 400
+        )
+
+        with override_settings(ANTHROPIC_API_KEY='sk-ant-test', AI_HTTP_TRANSPORT=FakeTransport(), AI_CACHE_TTL=0):
+            job = self.start({'kind': 'analyze_risks', 'severity': 'high,critical', 'project': self.project.code})
+        self.assertEqual(job['status'], 'succeeded')
+        self.assertEqual(job['params'], {'severity': 'high,critical', 'project': self.project.code})
+        self.assertEqual((job['result']['selected'], job['result']['analyzed']), (1, 1))
+        self.assertEqual(RiskAnalysis.objects.count(), 1)
@@ -0,0 +1,44 @@
+import os
+from django.http import FileResponse
+from rest_framework import mixins, status, viewsets
+from rest_framework.decorators import action
+from rest_framework.permissions import IsAuthenticated
+from rest_framework.response import Response
+from .models import Job
+from .runner import enqueue_job
+from .serializers import JobCreateSerializer, JobSerializer
+
+
+class JobViewSet(mixins.ListModelMixin, mixins.RetrieveModelMixin, viewsets.GenericViewSet):
+    """
+    Background jobs: POST to start one, poll GET /api/jobs/{id}/ for progress,
+    then fetch the artifact from /api/jobs/{id}/download/
+    """
+    serializer_class = JobSerializer
+    permission_classes = [IsAuthenticated]
+    filterset_fields = ['kind', 'status']
+    
+    def get_queryset(self):
+        queryset = Job.objects.all()
+        if not self.request.user.is_staff:
+            queryset = queryset.filter(created_by=self.request.user)
+        return queryset
+    
+    def create(self, request):
+        serializer = JobCreateSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        job = enqueue_job(
+            serializer.validated_data['kind'],
+            params=serializer.get_params(),
+            user=request.user,
+            source=serializer.validated_data.get('file'),
+        )
+        return Response(JobSerializer(job, context={'request': request}).data, status=status.HTTP_202_ACCEPTED)
+    
+    @action(detail=True, methods=['get'])
+    def download(self, request, pk=None):
+        """Download the file produced by a finished job"""
+        job = self.get_object()
+        if job.status != 'succeeded' or not job.artifact:
+            return Response({'error': 'No artifact available for this job'}, status=status.HTTP_404_NOT_FOUND)
+        return FileResponse(job.artifact.open('rb'), as_attachment=True, filename=os.path.basename(job.artifact.name))
@@ -0,0 +1,14 @@
+"""
+Celery application for background jobs (see the jobs app).
+
+Settings prefixed with CELERY_ in pmo_core/settings.py configure it. Without a
+broker, tasks run eagerly in the calling process (DEBUG and tests only).
+"""
+import os
+from celery import Celery
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'pmo_core.settings')
+
+app = Celery('pmo_core')
+app.config_from_object('django.conf:settings', namespace='CELERY')
+app.autodiscover_tasks()
@@ -4,13 +4,17 @@ Django settings for PMO AI Assistant project.
 
 from pathlib import Path
 import os
+import sys
+from urllib.parse import unquote, urlparse
+from django.core.exceptions import ImproperlyConfigured
 from dotenv import load_dotenv
 load_dotenv()
 
 BASE_DIR = Path(__file__).resolve().parent.parent
 
 SECRET_KEY = os.getenv('SECRET_KEY', 'django-insecure-default-key-change-in-production')
-DEBUG = True
+DEBUG = os.getenv('DEBUG', 'True') == 'True'
+TESTING = sys.argv[1:2] == ['test']
 
 ALLOWED_HOSTS =['*']
 
@@ -35,6 +39,7 @@ INSTALLED_APPS = [
     'projects',
     'analytics',
     'ai_engine',
+    'jobs',
 ]
 
 MIDDLEWARE = [
@@ -69,12 +74,28 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'pmo_core.wsgi.application'
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+# PostgreSQL when DATABASE_URL is set (shared by the web, worker and cron
+# services on Render), otherwise the local SQLite file
+DATABASE_URL = os.getenv('DATABASE_URL')
+if DATABASE_URL:
+    database_url = urlparse(DATABASE_URL)
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': database_url.path.lstrip('/'),
+            'USER': unquote(database_url.username or ''),
+            'PASSWORD': unquote(database_url.password or ''),
+            'HOST': database_url.hostname or '',
+            'PORT': str(database_url.port or ''),
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
     }
-}
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -107,6 +128,54 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Cache: Redis when REDIS_URL is set (shared by all gunicorn workers),
+# a file-based cache when CACHE_DIR is set, otherwise in-process memory
+REDIS_URL = os.getenv('REDIS_URL')
+CACHE_DIR = os.getenv('CACHE_DIR')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+elif CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_DIR,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'pmo-cache',
+        }
+    }
+
+# Seconds a version-stamped portfolio statistics entry may live (see projects/cache.py)
+PORTFOLIO_CACHE_TIMEOUT = int(os.getenv('PORTFOLIO_CACHE_TIMEOUT', 300))
+
+# Celery: background jobs go through CELERY_BROKER_URL (the Redis service on
+# Render) to a worker running `celery -A pmo_core worker`. Without a broker
+# they run eagerly in-process, which is only allowed with DEBUG, in tests or
+# when CELERY_TASK_ALWAYS_EAGER=True is set explicitly. Web and worker must
+# share the database and MEDIA_ROOT so job artifacts can be downloaded.
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'memory://')
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND') or None
+CELERY_TASK_ALWAYS_EAGER = os.getenv(
+    'CELERY_TASK_ALWAYS_EAGER', str(CELERY_BROKER_URL == 'memory://' and (DEBUG or TESTING))
+) == 'True'
+if CELERY_BROKER_URL == 'memory://' and not CELERY_TASK_ALWAYS_EAGER:
+    raise ImproperlyConfigured(
+        'CELERY_BROKER_URL is not set: configure a broker, or set CELERY_TASK_ALWAYS_EAGER=True '
+        'to run background jobs inside web requests'
+    )
+CELERY_TASK_IGNORE_RESULT = True
+CELERY_TASK_ACKS_LATE = True
+CELERY_WORKER_PREFETCH_MULTIPLIER = 1
+
 # REST Framework
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
@@ -153,6 +222,49 @@ SPECTACULAR_SETTINGS = {
 ANTHROPIC_API_KEY = os.getenv('ANTHROPIC_API_KEY', 'demo-mode')
 AI_MODEL = 'claude-sonnet-4-20250514'
 AI_MAX_TOKENS = 4096
+# Mark the system prompt and endpoint instructions as cacheable prefixes (Anthropic prompt caching)
+AI_PROMPT_CACHE = os.getenv('AI_PROMPT_CACHE', 'True') == 'True'
+# Seconds a successful AI response is reused for identical input (0 disables the response cache)
+AI_CACHE_TTL = int(os.getenv('AI_CACHE_TTL', 3600))
+# HTTP client shared by all AI requests of a worker (see ai_engine.client). The read timeout
+# stays below gunicorn's 120s so a stalled call fails before the worker is killed.
+AI_HTTP_TIMEOUT = float(os.getenv('AI_HTTP_TIMEOUT', 90))
+AI_CONNECT_TIMEOUT = float(os.getenv('AI_CONNECT_TIMEOUT', 5))
+AI_MAX_RETRIES = int(os.getenv('AI_MAX_RETRIES', 2))
+AI_MAX_CONNECTIONS = 20
+AI_MAX_KEEPALIVE_CONNECTIONS = 10
+AI_KEEPALIVE_EXPIRY = 60
+# Dotted path to an httpx transport class, e.g. 'ai_engine.client.FakeTransport' to work offline
+AI_HTTP_TRANSPORT = os.getenv('AI_HTTP_TRANSPORT') or None
+# Outbound AI call governor (see ai_engine.governor), per worker process: concurrent calls in
+# total and per user, and rate limits (estimated input tokens) that keep bursts under the API's
+# limits. Split the account's limits across the worker processes.
+AI_MAX_CONCURRENT_REQUESTS = int(os.getenv('AI_MAX_CONCURRENT_REQUESTS', 8))
+AI_MAX_CONCURRENT_PER_USER = int(os.getenv('AI_MAX_CONCURRENT_PER_USER', 2))
+AI_REQUESTS_PER_MINUTE = int(os.getenv('AI_REQUESTS_PER_MINUTE', 25))
+AI_TOKENS_PER_MINUTE = int(os.getenv('AI_TOKENS_PER_MINUTE', 20000))
+# Seconds a call may wait for the governor before failing with "AI service is busy"
+AI_GOVERNOR_MAX_WAIT = float(os.getenv('AI_GOVERNOR_MAX_WAIT', 30))
+# Slots held by background batches such as analyze_risks (queued as one governor user)
+AI_BATCH_MAX_CONCURRENT = int(os.getenv('AI_BATCH_MAX_CONCURRENT', 4))
+# Save every AI call's latency, tokens and cost as an AICallLog row (see ai_engine.metrics)
+AI_CALL_LOG = os.getenv('AI_CALL_LOG', 'False') == 'True'
+# Token budgets for the data embedded in AI prompts, per endpoint, e.g. {'compare_projects': 6000}
+# (unset endpoints use ai_engine.context.DEFAULT_CONTEXT_BUDGETS)
+AI_CONTEXT_BUDGETS = {}
+# Local search index that picks the records sent with a PMO question (see ai_engine.retrieval),
+# saved to disk by manage.py retrieval_index so new workers do not re-read every record;
+# empty keeps it in memory only
+AI_RETRIEVAL_INDEX_PATH = os.getenv('AI_RETRIEVAL_INDEX_PATH', str(BASE_DIR / 'ai_retrieval_index.npz'))
+# Seconds between checks of the retrieval index for records deleted by other processes
+AI_RETRIEVAL_SWEEP_INTERVAL = int(os.getenv('AI_RETRIEVAL_SWEEP_INTERVAL', 600))
+# Best-matching records considered for a PMO question, before the token budget is applied
+AI_RETRIEVAL_TOP_K = int(os.getenv('AI_RETRIEVAL_TOP_K', 20))
+# Stored project/portfolio summaries (see ai_engine.insights): versions kept per subject, days
+# older versions are kept for audit, and seconds before a stuck background refresh may be retried
+AI_INSIGHT_KEEP_VERSIONS = int(os.getenv('AI_INSIGHT_KEEP_VERSIONS', 10))
+AI_INSIGHT_RETENTION_DAYS = int(os.getenv('AI_INSIGHT_RETENTION_DAYS', 90))
+AI_INSIGHT_REGENERATION_TIMEOUT = 300
 
 # DRF Spectacular (API Schema) Settings
 SPECTACULAR_SETTINGS = {
@@ -10,7 +10,7 @@ from accounts.views import (
 )
 from projects.csv_views import (
     export_projects_csv, export_tasks_csv, export_risks_csv, export_resources_csv,
-    export_all_csv, import_csv_page, import_projects_csv, data_export_page
+    export_all_csv, export_columnar, import_csv_page, import_projects_csv, import_table_csv, data_export_page
 )
 
 urlpatterns = [
@@ -40,8 +40,10 @@ urlpatterns = [
     path('export/risks/', export_risks_csv, name='export_risks_csv'),
     path('export/resources/', export_resources_csv, name='export_resources_csv'),
     path('export/all/', export_all_csv, name='export_all_csv'),
+    path('export/columnar/', export_columnar, name='export_columnar'),
     path('import/', import_csv_page, name='import_csv_page'),
     path('import/projects/', import_projects_csv, name='import_projects_csv'),
+    path('import/<str:table>/', import_table_csv, name='import_table_csv'),
     
     # Analytics
     path('analytics/', include('analytics.urls')),
@@ -56,6 +58,7 @@ urlpatterns = [
     # API Endpoints
     path('api/', include('projects.urls')),
     path('api/ai/', include('ai_engine.urls')),
+    path('api/', include('jobs.urls')),
 ]
 
 if settings.DEBUG:
@@ -38,6 +38,9 @@ class ProjectAdmin(admin.ModelAdmin):
         })
     )
     
+    def get_queryset(self, request):
+        return super().get_queryset(request).with_health()
+    
     def status_badge(self, obj):
         colors = {
             'on_track': '#10b981',
@@ -79,6 +82,7 @@ class ProjectAdmin(admin.ModelAdmin):
             color, score
         )
     health_score_badge.short_description = 'Health'
+    health_score_badge.admin_order_field = 'health'
     
     def budget_display(self, obj):
         if obj.budget:
@@ -0,0 +1,109 @@
+"""
+Version-stamped cache for portfolio statistics.
+
+Entries are keyed by a global data-version stamp stored in the shared cache.
+Writes to projects and their related records bump the stamp (see
+projects.signals), so every worker switches to fresh keys at once and old
+entries simply expire. Keys also include today's date because overdue counts
+and health scores change at midnight without any write.
+
+With Redis (REDIS_URL) the stamp and entries are shared by all gunicorn
+workers; with locmem each process keeps its own copy.
+"""
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+
+KEY_PREFIX = 'pmo'
+DATA_VERSION_KEY = f'{KEY_PREFIX}:data-version'
+
+# Every name passed to cached(); get_cache_stats() reports all of them, so the
+# stats do not depend on which caches the serving worker has used
+CACHE_NAMES = (
+    'portfolio-projects',
+    'portfolio-risks',
+    'portfolio-tasks',
+    'analytics-ranked-projects',
+)
+
+_missing = object()
+_pending = threading.local()
+
+
+def incr_counter(key, delta=1):
+    """Increment a counter in the shared cache, creating it when missing"""
+    try:
+        return cache.incr(key, delta)
+    except ValueError:
+        # Key missing or evicted: create it, or increment if another worker just did
+        if cache.add(key, delta, timeout=None):
+            return delta
+        return cache.incr(key, delta)
+
+
+def get_data_version():
+    version = cache.get(DATA_VERSION_KEY)
+    if version is None:
+        cache.add(DATA_VERSION_KEY, 1, timeout=None)
+        version = cache.get(DATA_VERSION_KEY, 1)
+    return version
+
+
+def bump_data_version():
+    return incr_counter(DATA_VERSION_KEY)
+
+
+def schedule_version_bump():
+    """Bump the data version once the current transaction commits (once per transaction)"""
+    _pending.bump = True
+    transaction.on_commit(_flush_version_bump)
+
+
+def _flush_version_bump():
+    if getattr(_pending, 'bump', False):
+        _pending.bump = False
+        bump_data_version()
+
+
+def cached(name, compute, timeout=None):
+    """Return the cached value of `name` for the current data version, computing it on a miss"""
+    if name not in CACHE_NAMES:
+        raise ValueError(f'Unknown cache name {name!r}: add it to CACHE_NAMES')
+    key = f'{KEY_PREFIX}:{name}:v{get_data_version()}:{timezone.now().date().isoformat()}'
+
+    value = cache.get(key, _missing)
+    if value is not _missing:
+        incr_counter(f'{KEY_PREFIX}:stats:{name}:hits')
+        return value
+
+    incr_counter(f'{KEY_PREFIX}:stats:{name}:misses')
+    value = compute()
+    if timeout is None:
+        timeout = getattr(settings, 'PORTFOLIO_CACHE_TIMEOUT', 300)
+    cache.set(key, value, timeout)
+    return value
+
+
+def get_cache_stats():
+    """Hit/miss counters per cached name (shared across workers when the cache is)"""
+    names = sorted(CACHE_NAMES)
+    keys = [f'{KEY_PREFIX}:stats:{name}:{outcome}' for name in names for outcome in ('hits', 'misses')]
+    values = cache.get_many(keys)
+
+    entries = {}
+    for name in names:
+        hits = values.get(f'{KEY_PREFIX}:stats:{name}:hits', 0)
+        misses = values.get(f'{KEY_PREFIX}:stats:{name}:misses', 0)
+        total = hits + misses
+        entries[name] = {
+            'hits': hits,
+            'misses': misses,
+            'hit_rate': round(hits / total, 3) if total else None,
+        }
+
+    return {
+        'data_version': get_data_version(),
+        'entries': entries,
+    }
@@ -0,0 +1,193 @@
+"""
+Typed columnar exports (Parquet or Feather) for analytics consumers.
+
+Each table is read with values_list().iterator() in chunks; every chunk is
+loaded into a pandas DataFrame and converted to Arrow with a schema derived
+from the model fields, so dates stay dates, money stays decimal(15, 2) and
+nullable integers stay integers. Each chunk is written with pyarrow.dataset
+as <table>-<chunk>-<n> files, optionally partitioned by project or status
+(hive-style directories such as status=delayed/).
+
+pyarrow is an optional dependency; without it ColumnarExportUnavailable is
+raised.
+"""
+import os
+import shutil
+import zipfile
+from itertools import islice
+from django.db import models
+from .exports import file_chunks, zip_stream
+from .models import Project, Task, Risk, Resource, Milestone, Issue, ProjectSnapshot
+
+COLUMNAR_CHUNK_SIZE = 50000
+
+COLUMNAR_TABLES = {
+    'projects': Project,
+    'tasks': Task,
+    'risks': Risk,
+    'resources': Resource,
+    'milestones': Milestone,
+    'issues': Issue,
+    'snapshots': ProjectSnapshot,
+}
+
+# File extension and pyarrow.dataset format name per output format
+COLUMNAR_FORMATS = {
+    'parquet': ('parquet', 'parquet'),
+    'feather': ('feather', 'ipc'),
+}
+
+PARTITIONS = ('project', 'status')
+
+
+class ColumnarExportUnavailable(RuntimeError):
+    pass
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.dataset  # noqa: F401
+    except ImportError:
+        raise ColumnarExportUnavailable('Columnar exports need pyarrow. Run: pip install pyarrow')
+    return pyarrow
+
+
+def _arrow_type(pa, field):
+    if isinstance(field, models.ForeignKey):
+        return pa.int64()
+    if isinstance(field, models.DecimalField):
+        return pa.decimal128(field.max_digits, field.decimal_places)
+    if isinstance(field, models.DateTimeField):
+        return pa.timestamp('us', tz='UTC')
+    if isinstance(field, models.DateField):
+        return pa.date32()
+    if isinstance(field, models.BooleanField):
+        return pa.bool_()
+    if isinstance(field, (models.BigIntegerField, models.BigAutoField)):
+        return pa.int64()
+    if isinstance(field, (models.IntegerField, models.AutoField)):
+        return pa.int32()
+    if isinstance(field, models.FloatField):
+        return pa.float64()
+    return pa.string()
+
+
+def table_schema(model):
+    """(column names, Arrow schema) for the concrete fields of a model"""
+    pa = _pyarrow()
+    fields = [field for field in model._meta.concrete_fields]
+    columns = [field.attname for field in fields]
+    schema = pa.schema([
+        pa.field(field.attname, _arrow_type(pa, field), nullable=field.null)
+        for field in fields
+    ])
+    return columns, schema
+
+
+def partition_column(model, partition):
+    """Column used to partition a table, or None when the table has no such column"""
+    if partition == 'project':
+        return 'id' if model is Project else 'project_id'
+    if partition == 'status' and any(field.name == 'status' for field in model._meta.concrete_fields):
+        return 'status'
+    return None
+
+
+def iter_frames(model, chunk_size=COLUMNAR_CHUNK_SIZE):
+    """DataFrames of up to chunk_size rows with the model's concrete columns"""
+    import pandas as pd
+
+    columns, _ = table_schema(model)
+    rows = model.objects.order_by('pk').values_list(*columns).iterator(chunk_size=chunk_size)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield pd.DataFrame.from_records(chunk, columns=columns)
+
+
+def write_table(name, output_dir, file_format='parquet', partition=None, chunk_size=COLUMNAR_CHUNK_SIZE):
+    """
+    Write one table under output_dir/<name>/ and return the files written.
+    Tables without the partition column are written unpartitioned.
+    """
+    pa = _pyarrow()
+    model = COLUMNAR_TABLES[name]
+    extension, dataset_format = COLUMNAR_FORMATS[file_format]
+    _, schema = table_schema(model)
+
+    column = partition_column(model, partition) if partition else None
+    if dataset_format == 'ipc':
+        file_options = pa.dataset.IpcFileFormat().make_write_options(compression=pa.Codec('zstd'))
+    else:
+        file_options = pa.dataset.ParquetFileFormat().make_write_options(compression='zstd')
+
+    written = []
+    # Each chunk is converted and written here, on the calling thread: pyarrow would
+    # consume a Python iterator from its own threads, outside Django's connection
+    for index, frame in enumerate(iter_frames(model, chunk_size)):
+        pa.dataset.write_dataset(
+            pa.Table.from_pandas(frame, schema=schema, preserve_index=False),
+            os.path.join(output_dir, name),
+            format=dataset_format,
+            file_options=file_options,
+            partitioning=[column] if column else None,
+            partitioning_flavor='hive' if column else None,
+            basename_template=f'{name}-{index}-{{i}}.{extension}',
+            existing_data_behavior='overwrite_or_ignore',
+            file_visitor=lambda written_file: written.append(written_file.path),
+        )
+    if not written:
+        # Empty table: still give consumers a file carrying the schema
+        path = os.path.join(output_dir, name, f'{name}-0.{extension}')
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if dataset_format == 'ipc':
+            import pyarrow.feather
+            pyarrow.feather.write_feather(schema.empty_table(), path, compression='zstd')
+        else:
+            import pyarrow.parquet
+            pyarrow.parquet.write_table(schema.empty_table(), path, compression='zstd')
+        written.append(path)
+    return written
+
+
+def write_tables(output_dir, tables=None, file_format='parquet', partition=None, chunk_size=COLUMNAR_CHUNK_SIZE):
+    """Write several tables (all by default); returns {table: [files]}"""
+    return {
+        name: write_table(name, output_dir, file_format, partition, chunk_size)
+        for name in (tables or COLUMNAR_TABLES)
+    }
+
+
+def parse_columnar_params(params):
+    """Validated keyword arguments for write_tables from request/command options; raises ValueError"""
+    file_format = params.get('format') or 'parquet'
+    if file_format not in COLUMNAR_FORMATS:
+        raise ValueError(f'Unsupported format: {file_format}')
+
+    partition = params.get('partition') or None
+    if partition and partition not in PARTITIONS:
+        raise ValueError(f'Unsupported partition: {partition}')
+
+    tables = [name.strip() for name in (params.get('tables') or '').split(',') if name.strip()]
+    unknown = [name for name in tables if name not in COLUMNAR_TABLES]
+    if unknown:
+        raise ValueError(f'Unknown tables: {", ".join(unknown)}')
+
+    return {'file_format': file_format, 'partition': partition, 'tables': tables or None}
+
+
+def archive_stream(output_dir, files):
+    """
+    Stream the written files as a ZIP (stored, as Parquet and Feather are
+    already compressed) and remove output_dir afterwards
+    """
+    try:
+        members = (
+            (os.path.relpath(path, output_dir), file_chunks(path))
+            for paths in files.values() for path in paths
+        )
+        yield from zip_stream(members, compression=zipfile.ZIP_STORED)
+    finally:
+        shutil.rmtree(output_dir, ignore_errors=True)
@@ -0,0 +1,253 @@
+"""
+Table layouts and row generators for the CSV data exports.
+
+Rows are read with values_list().iterator(), so exports run in constant
+memory whatever the table size, and choice labels come from the model's
+choice maps instead of per-row get_*_display() calls.
+
+The same tables can be encoded as CSV or NDJSON byte chunks and written
+into a ZIP archive that is produced incrementally (see zip_stream).
+"""
+import csv
+import json
+import zipfile
+from itertools import chain
+from django.core.serializers.json import DjangoJSONEncoder
+from django.utils.dateparse import parse_date
+from django.utils.functional import cached_property
+from .models import Project, Task, Risk, Resource
+
+EXPORT_CHUNK_SIZE = 2000
+# Bytes collected before a chunk is handed to the compressor / response
+WRITE_BUFFER_SIZE = 64 * 1024
+
+
+class Echo:
+    """File-like object whose write() returns the value, for streaming csv.writer output"""
+
+    def write(self, value):
+        return value
+
+
+def _days_between(start, end):
+    return (end - start).days if start and end else 0
+
+
+class TableExport:
+    """
+    One exported table: column header, selected fields and row formatting.
+
+    `filters` maps the supported query parameters (status, project) to ORM
+    lookups; `date_field` is the field used by the date_from/date_to range.
+    """
+    name = None
+    model = None
+    header = []
+    fields = []
+    filters = {}
+    date_field = None
+
+    def base_queryset(self):
+        return self.model.objects.all()
+
+    @cached_property
+    def labels(self):
+        """{field: {value: display label}} for every choice field of the model"""
+        return {
+            field.name: dict(field.choices)
+            for field in self.model._meta.get_fields()
+            if getattr(field, 'choices', None)
+        }
+
+    def label(self, field, value):
+        return self.labels[field].get(value, value)
+
+    def format_row(self, values):
+        return list(values)
+
+    def queryset(self, params=None):
+        """Filtered queryset for the export; raises ValueError on an invalid parameter"""
+        queryset = self.base_queryset()
+        params = params or {}
+
+        for param, lookup in self.filters.items():
+            value = params.get(param)
+            if value:
+                queryset = queryset.filter(**{lookup: value})
+
+        if self.date_field:
+            for param, lookup in (('date_from', 'gte'), ('date_to', 'lte')):
+                value = params.get(param)
+                if not value:
+                    continue
+                parsed = parse_date(value)
+                if parsed is None:
+                    raise ValueError(f'Invalid {param}: {value}')
+                queryset = queryset.filter(**{f'{self.date_field}__{lookup}': parsed})
+
+        return queryset.order_by('pk')
+
+    def rows(self, params=None, chunk_size=EXPORT_CHUNK_SIZE):
+        """
+        Formatted data rows (without header), fetched from the database in chunks.
+        Parameters are validated before anything is streamed.
+        """
+        values = self.queryset(params).values_list(*self.fields).iterator(chunk_size=chunk_size)
+        return (self.format_row(row) for row in values)
+
+
+class ProjectExport(TableExport):
+    name = 'projects'
+    model = Project
+    header = ['project_id', 'project_name', 'start_date', 'end_date', 'budget', 'status']
+    fields = ['id', 'name', 'start_date', 'actual_end_date', 'planned_end_date', 'budget', 'status']
+    filters = {'status': 'status', 'project': 'pk'}
+    date_field = 'start_date'
+
+    def format_row(self, values):
+        pk, name, start_date, actual_end, planned_end, budget, status = values
+        return [pk, name, start_date, actual_end or planned_end, budget, self.label('status', status)]
+
+
+class TaskExport(TableExport):
+    name = 'tasks'
+    model = Task
+    header = ['task_id', 'project_id', 'task_name', 'planned_days', 'actual_days', 'progress_pct']
+    fields = ['id', 'project_id', 'name', 'start_date', 'due_date', 'completion_date', 'completion_percentage']
+    filters = {'status': 'status', 'project': 'project_id'}
+    date_field = 'due_date'
+
+    def format_row(self, values):
+        pk, project_id, name, start_date, due_date, completion_date, progress = values
+        return [
+            pk, project_id, name,
+            _days_between(start_date, due_date),
+            _days_between(start_date, completion_date),
+            progress,
+        ]
+
+
+class RiskExport(TableExport):
+    name = 'risks'
+    model = Risk
+    header = ['risk_id', 'project_id', 'risk_type', 'risk_level', 'description']
+    fields = ['id', 'project_id', 'category', 'severity', 'description']
+    filters = {'status': 'status', 'project': 'project_id'}
+    date_field = 'identified_date'
+
+    def format_row(self, values):
+        pk, project_id, category, severity, description = values
+        return [
+            pk, project_id,
+            self.label('category', category),
+            self.label('severity', severity),
+            description,
+        ]
+
+
+class ResourceExport(TableExport):
+    name = 'resources'
+    model = Resource
+    header = ['resource_id', 'name', 'role', 'utilization_pct']
+    fields = ['id', 'name', 'role', 'allocation_percentage']
+    filters = {'project': 'project_id'}
+    date_field = 'start_date'
+
+    def base_queryset(self):
+        return Resource.objects.filter(is_active=True)
+
+    def format_row(self, values):
+        pk, name, role, allocation = values
+        return [pk, name, self.label('role', role), allocation]
+
+
+EXPORTS = {export.name: export for export in (ProjectExport(), TaskExport(), RiskExport(), ResourceExport())}
+
+
+def _buffered(pieces, buffer_size=WRITE_BUFFER_SIZE):
+    """Join small str pieces into UTF-8 byte chunks of roughly buffer_size"""
+    buffer, size = [], 0
+    for piece in pieces:
+        buffer.append(piece)
+        size += len(piece)
+        if size >= buffer_size:
+            yield ''.join(buffer).encode('utf-8')
+            buffer, size = [], 0
+    if buffer:
+        yield ''.join(buffer).encode('utf-8')
+
+
+def csv_chunks(export, params=None):
+    """Header and rows of an export as CSV byte chunks, quoted by the csv module"""
+    writer = csv.writer(Echo())
+    rows = export.rows(params)
+    lines = (writer.writerow(row) for row in rows)
+    return _buffered(chain([writer.writerow(export.header)], lines))
+
+
+def ndjson_chunks(export, params=None):
+    """Rows of an export as newline-delimited JSON objects keyed by the CSV header"""
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    rows = export.rows(params)
+    return _buffered(encoder.encode(dict(zip(export.header, row))) + '\n' for row in rows)
+
+
+EXPORT_FORMATS = {
+    'csv': ('csv', csv_chunks),
+    'ndjson': ('ndjson', ndjson_chunks),
+}
+
+
+class _ZipSink:
+    """Write-only, non-seekable target for ZipFile that hands back what was written"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks, self.size = [], 0
+        return data
+
+
+def zip_stream(members, buffer_size=WRITE_BUFFER_SIZE, compression=zipfile.ZIP_DEFLATED):
+    """
+    Yield a deflated ZIP archive piece by piece.
+
+    `members` is an iterable of (filename, iterable of byte chunks). Because the
+    sink is not seekable, zipfile writes data descriptors after each member, so
+    at most about buffer_size of compressed output is held at a time.
+    """
+    sink = _ZipSink()
+    with zipfile.ZipFile(sink, 'w', compression) as archive:
+        for filename, chunks in members:
+            with archive.open(filename, 'w', force_zip64=True) as member:
+                for chunk in chunks:
+                    member.write(chunk)
+                    if sink.size >= buffer_size:
+                        yield sink.drain()
+            yield sink.drain()
+    yield sink.drain()
+
+
+def file_chunks(path, chunk_size=WRITE_BUFFER_SIZE):
+    """Byte chunks of a file on disk, for zip_stream members"""
+    with open(path, 'rb') as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+def export_members(file_format='csv', params=None):
+    """(filename, chunks) for every export table in the given format, for zip_stream"""
+    extension, encode = EXPORT_FORMATS[file_format]
+    for name, export in EXPORTS.items():
+        yield f'{name}.{extension}', encode(export, params)
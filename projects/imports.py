@@ -0,0 +1,393 @@
+"""
+Batched CSV import for the table layouts written by projects.exports.
+
+The upload is decoded incrementally and processed in batches. Each batch
+resolves its existing records with one in_bulk() query, checks referenced
+projects with one more, and is written inside its own transaction: new rows
+with bulk_create, changed rows as a bulk upsert on the primary key. Rows that
+fail validation are skipped and reported with their line number; the other
+rows of the batch are still applied.
+
+Rows with an id update that record; rows without one create a new record.
+Columns that are absent or empty leave the current value untouched, and rows
+whose values all match the database are counted as unchanged, not written.
+"""
+import csv
+import io
+import uuid
+from datetime import timedelta
+from django import forms
+from django.core.exceptions import ValidationError
+from django.db import transaction
+from django.utils import timezone
+from .cache import schedule_version_bump
+from .exports import EXPORTS
+from .metrics import refresh_project_metrics
+from .models import Project
+
+IMPORT_BATCH_SIZE = 1000
+MAX_REPORTED_ERRORS = 500
+
+
+class RowError(Exception):
+    """Validation errors for one row, as {column: message}"""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+class ImportResult:
+    """Counts and per-row errors of an import run"""
+
+    def __init__(self):
+        self.created = 0
+        self.updated = 0
+        self.unchanged = 0
+        self.error_count = 0
+        self.errors = []
+
+    def add_error(self, line, errors):
+        self.error_count += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'errors': errors})
+
+    def as_dict(self):
+        return {
+            'created': self.created,
+            'updated': self.updated,
+            'unchanged': self.unchanged,
+            'error_count': self.error_count,
+            'errors': self.errors,
+        }
+
+
+class TableImport:
+    """
+    Import for one export layout.
+
+    `columns` maps CSV columns to model fields, cleaned with the model field
+    (choice columns accept either the value or the exported label).
+    `extra_fields` are columns that do not map directly to a model field and
+    are cleaned with a form field before apply() uses them.
+    """
+    name = None
+    id_column = None
+    columns = {}
+    extra_fields = {}
+    derived_fields = []
+    required_for_create = []
+    refresh_metrics = True
+
+    @property
+    def export(self):
+        return EXPORTS[self.name]
+
+    @property
+    def model(self):
+        return self.export.model
+
+    @property
+    def update_fields(self):
+        return list(dict.fromkeys([*self.columns.values(), *self.derived_fields]))
+
+    def choice_value(self, field_name, raw):
+        for value, label in self.export.labels[field_name].items():
+            if raw == value or raw.lower() == label.lower():
+                return value
+        return raw
+
+    def convert(self, row):
+        """(pk, values) for a CSV row; raises RowError"""
+        errors, values = {}, {}
+
+        pk = None
+        raw_id = (row.get(self.id_column) or '').strip()
+        if raw_id:
+            try:
+                pk = int(raw_id)
+            except ValueError:
+                errors[self.id_column] = 'Enter a whole number.'
+
+        for column, field_name in self.columns.items():
+            raw = (row.get(column) or '').strip()
+            if not raw:
+                continue
+            try:
+                if field_name == 'project_id':
+                    values[field_name] = forms.IntegerField().clean(raw)
+                    continue
+                field = self.model._meta.get_field(field_name)
+                if field.choices:
+                    raw = self.choice_value(field_name, raw)
+                values[field_name] = field.clean(raw, None)
+            except ValidationError as e:
+                errors[column] = ' '.join(e.messages)
+
+        for column, form_field in self.extra_fields.items():
+            raw = (row.get(column) or '').strip()
+            if not raw:
+                continue
+            try:
+                values[column] = form_field.clean(raw)
+            except ValidationError as e:
+                errors[column] = ' '.join(e.messages)
+
+        if errors:
+            raise RowError(errors)
+        return pk, values
+
+    def new_instance(self):
+        return self.model()
+
+    def apply(self, instance, values):
+        for name, value in values.items():
+            setattr(instance, name, value)
+
+    def validate_batch(self, entries):
+        """Cross-row checks for [(line, instance, is_new)]; returns {line: errors}"""
+        return {}
+
+    def import_rows(self, rows, result):
+        """Validate and write one batch of (line, row) pairs"""
+        parsed = []
+        for line, row in rows:
+            try:
+                pk, values = self.convert(row)
+            except RowError as e:
+                result.add_error(line, e.errors)
+                continue
+            parsed.append((line, pk, values))
+
+        existing = self.model.objects.in_bulk([pk for _, pk, _ in parsed if pk is not None])
+        referenced = {values['project_id'] for _, _, values in parsed if 'project_id' in values}
+        projects = set(Project.objects.filter(pk__in=referenced).values_list('pk', flat=True))
+
+        entries = []
+        changed_fields = set()
+        # line -> project a changed row belonged to before this import
+        previous_projects = {}
+        for line, pk, values in parsed:
+            if pk is not None and pk not in existing:
+                result.add_error(line, {self.id_column: f'No {self.model._meta.verbose_name} with id {pk}.'})
+                continue
+            if 'project_id' in values and values['project_id'] not in projects:
+                result.add_error(line, {'project_id': f'No project with id {values["project_id"]}.'})
+                continue
+
+            is_new = pk is None
+            instance = self.new_instance() if is_new else existing[pk]
+            before = [getattr(instance, name) for name in self.update_fields]
+            previous_project = None if is_new else self.project_id(instance)
+            self.apply(instance, values)
+            changed = {
+                name for name, old in zip(self.update_fields, before) if getattr(instance, name) != old
+            }
+            if not is_new and not changed:
+                result.unchanged += 1
+                continue
+            if is_new:
+                missing = [name for name in self.required_for_create if getattr(instance, name) in (None, '')]
+                if missing:
+                    result.add_error(line, {name: 'This field is required for new rows.' for name in missing})
+                    continue
+            entries.append((line, instance, is_new))
+            changed_fields |= changed
+            if previous_project is not None:
+                previous_projects[line] = previous_project
+
+        conflicts = self.validate_batch(entries)
+        for line, errors in conflicts.items():
+            result.add_error(line, errors)
+
+        now = timezone.now()
+        created, updated = [], []
+        left_projects = set()
+        for line, instance, is_new in entries:
+            if line in conflicts:
+                continue
+            instance.updated_at = now
+            (created if is_new else updated).append(instance)
+            if line in previous_projects:
+                left_projects.add(previous_projects[line])
+
+        with transaction.atomic():
+            self.model.objects.bulk_create(created)
+            if updated:
+                # An upsert on the primary key is far cheaper to build than bulk_update's
+                # CASE expressions; only the columns that differ in the batch are written
+                fields = [name for name in self.update_fields if name in changed_fields]
+                self.model.objects.bulk_create(
+                    updated,
+                    update_conflicts=True,
+                    unique_fields=['id'],
+                    update_fields=fields + ['updated_at'],
+                )
+            self.after_save(created + updated, left_projects)
+
+        result.created += len(created)
+        result.updated += len(updated)
+
+    def after_save(self, instances, previous_projects=()):
+        """
+        bulk_* skip model signals, so refresh derived data for the batch here;
+        previous_projects are the projects updated rows belonged to before,
+        which lose their counts when a row moves to another project
+        """
+        if not instances:
+            return
+        if self.refresh_metrics:
+            refresh_project_metrics({self.project_id(instance) for instance in instances} | set(previous_projects))
+        schedule_version_bump()
+
+    def project_id(self, instance):
+        return instance.project_id
+
+
+class ProjectImport(TableImport):
+    name = 'projects'
+    id_column = 'project_id'
+    columns = {
+        'project_name': 'name',
+        'start_date': 'start_date',
+        'budget': 'budget',
+        'status': 'status',
+    }
+    extra_fields = {'end_date': forms.DateField()}
+    derived_fields = ['planned_end_date', 'actual_end_date']
+    required_for_create = ['name', 'start_date', 'planned_end_date']
+
+    def new_instance(self):
+        return Project(code=f'IMP-{uuid.uuid4().hex[:8].upper()}')
+
+    def apply(self, instance, values):
+        end_date = values.pop('end_date', None)
+        super().apply(instance, values)
+        # The export writes the actual end date for completed projects, the planned one otherwise
+        if end_date is not None:
+            if instance.status == 'completed':
+                instance.actual_end_date = end_date
+            else:
+                instance.planned_end_date = end_date
+
+    def validate_batch(self, entries):
+        conflicts = {}
+        lines_by_name = {}
+        for line, instance, _ in entries:
+            if instance.name in lines_by_name:
+                conflicts[line] = {'project_name': 'Duplicate project name in this file.'}
+            lines_by_name.setdefault(instance.name, []).append((line, instance.pk))
+
+        for name, pk in Project.objects.filter(name__in=lines_by_name).values_list('name', 'pk'):
+            for line, instance_pk in lines_by_name[name]:
+                if instance_pk != pk:
+                    conflicts.setdefault(line, {'project_name': 'A project with this name already exists.'})
+        return conflicts
+
+    def project_id(self, instance):
+        return instance.pk
+
+
+class TaskImport(TableImport):
+    name = 'tasks'
+    id_column = 'task_id'
+    columns = {
+        'project_id': 'project_id',
+        'task_name': 'name',
+        'progress_pct': 'completion_percentage',
+        'start_date': 'start_date',
+    }
+    extra_fields = {
+        'planned_days': forms.IntegerField(min_value=0),
+        'actual_days': forms.IntegerField(min_value=0),
+    }
+    derived_fields = ['due_date', 'completion_date']
+    required_for_create = ['project_id', 'name', 'due_date']
+
+    def new_instance(self):
+        return self.model(start_date=timezone.now().date())
+
+    def apply(self, instance, values):
+        planned_days = values.pop('planned_days', None)
+        actual_days = values.pop('actual_days', None)
+        super().apply(instance, values)
+        # Day counts are relative to the start date, as in the export; 0 actual days means not completed
+        if planned_days is not None:
+            instance.due_date = instance.start_date + timedelta(days=planned_days)
+        if actual_days:
+            instance.completion_date = instance.start_date + timedelta(days=actual_days)
+
+
+class RiskImport(TableImport):
+    name = 'risks'
+    id_column = 'risk_id'
+    columns = {
+        'project_id': 'project_id',
+        'risk_type': 'category',
+        'risk_level': 'severity',
+        'description': 'description',
+    }
+    required_for_create = ['project_id', 'category', 'severity', 'description']
+
+    def new_instance(self):
+        return self.model(probability=50, impact=5)
+
+    def apply(self, instance, values):
+        super().apply(instance, values)
+        if not instance.title:
+            instance.title = instance.description.splitlines()[0][:255] if instance.description else ''
+
+
+class ResourceImport(TableImport):
+    name = 'resources'
+    id_column = 'resource_id'
+    # The export layout has no project, email or start date; new resources need them as extra columns
+    columns = {
+        'name': 'name',
+        'role': 'role',
+        'utilization_pct': 'allocation_percentage',
+        'project_id': 'project_id',
+        'email': 'email',
+        'start_date': 'start_date',
+    }
+    required_for_create = ['project_id', 'name', 'role', 'email', 'allocation_percentage', 'start_date']
+    refresh_metrics = False
+
+
+IMPORTS = {importer.name: importer for importer in (ProjectImport(), TaskImport(), RiskImport(), ResourceImport())}
+
+
+def import_csv(importer, upload, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Import a binary CSV file object with the given TableImport.
+    `progress`, if given, is called with the running ImportResult after each batch.
+
+    Raises ValueError when the header does not match the layout or the file is
+    not UTF-8; batches written before a decoding error are kept.
+    """
+    result = ImportResult()
+    text = io.TextIOWrapper(upload, encoding='utf-8-sig', newline='')
+    try:
+        reader = csv.DictReader(text)
+        header = reader.fieldnames or []
+        missing = [column for column in importer.export.header if column not in header]
+        if missing:
+            raise ValueError(f'Missing columns: {", ".join(missing)}')
+
+        batch = []
+        for row in reader:
+            batch.append((reader.line_num, row))
+            if len(batch) >= batch_size:
+                importer.import_rows(batch, result)
+                batch = []
+                if progress:
+                    progress(result)
+        if batch:
+            importer.import_rows(batch, result)
+    except UnicodeDecodeError:
+        raise ValueError('File must be UTF-8 encoded')
+    finally:
+        # Leave the upload open for Django to clean up
+        text.detach()
+
+    return result
@@ -1,66 +1,72 @@
-from django.core.management.base import BaseCommand
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
 from django.utils import timezone
-from projects.models import Project, ProjectSnapshot
+from projects.models import Project
+from projects.snapshots import compute_snapshot_rows, save_snapshot_rows
+
+
+def _init_worker():
+    import django
+    django.setup()
+
+
+def _compute_chunk(args):
+    project_ids, snapshot_date = args
+    try:
+        return compute_snapshot_rows(project_ids, snapshot_date)
+    finally:
+        connections.close_all()
 
 
 class Command(BaseCommand):
-    help = 'Create daily snapshots of all projects for historical tracking'
+    help = (
+        'Create daily snapshots of all projects for historical tracking. '
+        'Use --date or --from/--to to backfill past dates.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', type=date.fromisoformat, help='Snapshot date (YYYY-MM-DD), defaults to today')
+        parser.add_argument('--from', dest='date_from', type=date.fromisoformat, help='First date of a backfill range')
+        parser.add_argument('--to', dest='date_to', type=date.fromisoformat, help='Last date of a backfill range')
+        parser.add_argument('--chunk-size', type=int, default=1000, help='Projects per query/write batch')
+        parser.add_argument('--workers', type=int, default=1, help='Processes computing chunks in parallel')
 
-    def handle(self, *args, **kwargs):
+    def get_dates(self, options):
         today = timezone.now().date()
-        projects = Project.objects.all()
+        if options['date'] and (options['date_from'] or options['date_to']):
+            raise CommandError('Use either --date or --from/--to, not both')
+        if options['date']:
+            return [options['date']]
+        if options['date_from'] or options['date_to']:
+            start = options['date_from'] or options['date_to']
+            end = options['date_to'] or today
+            if start > end:
+                raise CommandError('--from must not be after --to')
+            return [start + timedelta(days=offset) for offset in range((end - start).days + 1)]
+        return [today]
+
+    def handle(self, *args, **options):
+        dates = self.get_dates(options)
+        chunk_size = max(options['chunk_size'], 1)
         
-        created_count = 0
-        updated_count = 0
+        project_ids = list(Project.objects.order_by('pk').values_list('pk', flat=True))
+        chunks = [project_ids[i:i + chunk_size] for i in range(0, len(project_ids), chunk_size)]
+        work = [(chunk, snapshot_date) for snapshot_date in dates for chunk in chunks]
         
-        for project in projects:
-            # Check if snapshot already exists for today
-            snapshot, created = ProjectSnapshot.objects.get_or_create(
-                project=project,
-                snapshot_date=today,
-                defaults={
-                    'status': project.status,
-                    'completion_percentage': project.completion_percentage,
-                    'budget': project.budget,
-                    'spent': project.spent,
-                    'spi': project.spi,
-                    'cpi': project.cpi,
-                    'health_score': project.health_score,
-                    'total_tasks': project.tasks.count(),
-                    'completed_tasks': project.tasks.filter(status='completed').count(),
-                    'total_risks': project.risks.count(),
-                    'high_risks': project.risks.filter(severity__in=['high', 'critical']).count(),
-                    'total_issues': project.issues.count() if hasattr(project, 'issues') else 0,
-                    'open_issues': project.issues.filter(status='open').count() if hasattr(project, 'issues') else 0,
-                }
-            )
-            
-            if created:
-                created_count += 1
-                self.stdout.write(self.style.SUCCESS(
-                    f'Created snapshot for {project.code}'
-                ))
-            else:
-                # Update if already exists
-                snapshot.status = project.status
-                snapshot.completion_percentage = project.completion_percentage
-                snapshot.budget = project.budget
-                snapshot.spent = project.spent
-                snapshot.spi = project.spi
-                snapshot.cpi = project.cpi
-                snapshot.health_score = project.health_score
-                snapshot.total_tasks = project.tasks.count()
-                snapshot.completed_tasks = project.tasks.filter(status='completed').count()
-                snapshot.total_risks = project.risks.count()
-                snapshot.high_risks = project.risks.filter(severity__in=['high', 'critical']).count()
-                snapshot.total_issues = project.issues.count() if hasattr(project, 'issues') else 0
-                snapshot.open_issues = project.issues.filter(status='open').count() if hasattr(project, 'issues') else 0
-                snapshot.save()
-                updated_count += 1
-                self.stdout.write(self.style.WARNING(
-                    f'Updated snapshot for {project.code}'
-                ))
+        saved = 0
+        if options['workers'] > 1 and len(work) > 1:
+            # Workers only read; this process does every write so SQLite sees a single writer
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'], initializer=_init_worker) as pool:
+                for rows in pool.map(_compute_chunk, work):
+                    saved += save_snapshot_rows(rows)
+        else:
+            for chunk, snapshot_date in work:
+                saved += save_snapshot_rows(compute_snapshot_rows(chunk, snapshot_date))
         
         self.stdout.write(self.style.SUCCESS(
-            f'\nSnapshot complete: {created_count} created, {updated_count} updated'
-        ))
\ No newline at end of file
+            f'Snapshot complete: {saved} snapshots saved for {len(project_ids)} projects '
+            f'across {len(dates)} date(s)'
+        ))
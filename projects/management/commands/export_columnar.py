@@ -0,0 +1,37 @@
+import os
+from django.core.management.base import BaseCommand, CommandError
+from projects.columnar import (
+    COLUMNAR_CHUNK_SIZE, COLUMNAR_FORMATS, PARTITIONS, ColumnarExportUnavailable,
+    parse_columnar_params, write_tables,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        'Export tables as typed Parquet or Feather files, one directory per table, '
+        'optionally partitioned by project or status.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('output', help='Directory to write the files to')
+        parser.add_argument('--format', choices=list(COLUMNAR_FORMATS), default='parquet')
+        parser.add_argument('--partition', choices=PARTITIONS, help='Partition each table by this column')
+        parser.add_argument('--tables', help='Comma-separated tables to export (default: all)')
+        parser.add_argument('--chunk-size', type=int, default=COLUMNAR_CHUNK_SIZE, help='Rows per chunk')
+
+    def handle(self, *args, **options):
+        try:
+            params = parse_columnar_params(options)
+        except ValueError as e:
+            raise CommandError(str(e))
+
+        os.makedirs(options['output'], exist_ok=True)
+        try:
+            files = write_tables(options['output'], chunk_size=options['chunk_size'], **params)
+        except ColumnarExportUnavailable as e:
+            raise CommandError(str(e))
+
+        for table, paths in files.items():
+            size = sum(os.path.getsize(path) for path in paths)
+            self.stdout.write(f'{table}: {len(paths)} file(s), {size / 1024:.1f} KB')
+        self.stdout.write(self.style.SUCCESS(f'Columnar export written to {options["output"]}'))
@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Q
+from django.utils import timezone
+from projects.models import Project
+from projects.metrics import refresh_project_metrics, find_inconsistent_metrics
+
+
+class Command(BaseCommand):
+    help = (
+        'Maintain the denormalized ProjectMetrics table. By default refreshes rows '
+        'computed before today (run nightly for the date rollover); --rebuild '
+        'recomputes every project and --check reports rows that drifted.'
+    )
+
+    def add_arguments(self, parser):
+        mode = parser.add_mutually_exclusive_group()
+        mode.add_argument('--rebuild', action='store_true', help='Recompute metrics for every project')
+        mode.add_argument('--check', action='store_true', help='Report inconsistent rows without writing')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            mismatches = find_inconsistent_metrics()
+            for project_id, diff in mismatches:
+                if diff is None:
+                    self.stdout.write(self.style.WARNING(f'Project {project_id}: no metrics row'))
+                    continue
+                details = ', '.join(f'{field}: {stored} != {expected}' for field, (stored, expected) in diff.items())
+                self.stdout.write(self.style.WARNING(f'Project {project_id}: {details}'))
+            if mismatches:
+                raise CommandError(f'{len(mismatches)} project(s) have inconsistent metrics')
+            self.stdout.write(self.style.SUCCESS('All project metrics are consistent'))
+            return
+        
+        if options['rebuild']:
+            count = refresh_project_metrics()
+        else:
+            today = timezone.now().date()
+            stale = Project.objects.filter(
+                Q(metrics__isnull=True) | Q(metrics__computed_on__lt=today)
+            ).values_list('pk', flat=True)
+            count = refresh_project_metrics(list(stale))
+        
+        self.stdout.write(self.style.SUCCESS(f'Refreshed metrics for {count} project(s)'))
@@ -0,0 +1,116 @@
+"""
+Maintenance of the denormalized ProjectMetrics table.
+
+Writes to risks, tasks and issues schedule a refresh of their project's row;
+refreshes are deduplicated and run once the surrounding transaction commits,
+so a bulk edit of one project recomputes its metrics once.
+"""
+import threading
+from django.db import transaction
+from django.db.models import OuterRef
+from django.utils import timezone
+from .models import Project, ProjectMetrics, Risk, Task, Issue, related_count
+
+METRIC_FIELDS = [
+    'health_score', 'days_remaining',
+    'total_risks', 'high_risks', 'open_risks',
+    'total_tasks', 'open_tasks', 'completed_tasks', 'overdue_tasks',
+    'total_issues', 'open_issues',
+    'computed_on',
+]
+
+_pending = threading.local()
+
+
+def compute_metrics(projects):
+    """Build unsaved ProjectMetrics for a Project queryset, from the source tables"""
+    today = timezone.now().date()
+    risks = Risk.objects.filter(project=OuterRef('pk'))
+    tasks = Task.objects.filter(project=OuterRef('pk'))
+    issues = Issue.objects.filter(project=OuterRef('pk'))
+    
+    rows = projects.with_health(live=True).with_risk_counts(live=True).with_task_counts(live=True).annotate(
+        open_risks=related_count(risks.filter(status='open')),
+        total_tasks=related_count(tasks),
+        completed_tasks=related_count(tasks.filter(status='completed')),
+        total_issues=related_count(issues),
+        open_issues=related_count(issues.filter(status='open')),
+    ).order_by()
+    
+    return [
+        ProjectMetrics(
+            project_id=project.pk,
+            health_score=project.health,
+            days_remaining=project.days_remaining,
+            total_risks=project.total_risks,
+            high_risks=project.high_risks,
+            open_risks=project.open_risks,
+            total_tasks=project.total_tasks,
+            open_tasks=project.open_tasks,
+            completed_tasks=project.completed_tasks,
+            overdue_tasks=project.overdue_tasks,
+            total_issues=project.total_issues,
+            open_issues=project.open_issues,
+            computed_on=today,
+        )
+        for project in rows
+    ]
+
+
+def refresh_project_metrics(project_ids=None, batch_size=500):
+    """Recompute and upsert metrics for the given projects (all projects when None)"""
+    projects = Project.objects.all()
+    if project_ids is not None:
+        projects = projects.filter(pk__in=project_ids)
+    
+    metrics = compute_metrics(projects)
+    ProjectMetrics.objects.bulk_create(
+        metrics,
+        batch_size=batch_size,
+        update_conflicts=True,
+        unique_fields=['project'],
+        update_fields=METRIC_FIELDS,
+    )
+    return len(metrics)
+
+
+def schedule_metrics_refresh(project_id):
+    """Refresh a project's metrics after the current transaction commits"""
+    pending = getattr(_pending, 'project_ids', None)
+    if pending is None:
+        pending = _pending.project_ids = set()
+    pending.add(project_id)
+    transaction.on_commit(flush_metrics_refreshes)
+
+
+def flush_metrics_refreshes():
+    """Refresh every project scheduled since the last flush"""
+    project_ids = getattr(_pending, 'project_ids', None)
+    if not project_ids:
+        return
+    _pending.project_ids = set()
+    refresh_project_metrics(project_ids)
+
+
+def find_inconsistent_metrics():
+    """
+    Compare stored metrics with freshly computed values.
+    
+    Returns a list of (project_id, {field: (stored, expected)}) for rows that
+    differ; the diff is None for projects that have no metrics row at all.
+    """
+    stored = ProjectMetrics.objects.in_bulk()
+    mismatches = []
+    for expected in compute_metrics(Project.objects.all()):
+        current = stored.get(expected.project_id)
+        if current is None:
+            mismatches.append((expected.project_id, None))
+            continue
+        diff = {
+            field: (getattr(current, field), getattr(expected, field))
+            for field in METRIC_FIELDS
+            if getattr(current, field) != getattr(expected, field)
+        }
+        if diff:
+            mismatches.append((expected.project_id, diff))
+    return mismatches
@@ -0,0 +1,37 @@
+# Generated by Django 5.0 on 2026-10-15 03:52
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0003_issue_projectsnapshot'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProjectMetrics',
+            fields=[
+                ('project', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='metrics', serialize=False, to='projects.project')),
+                ('health_score', models.IntegerField(default=100)),
+                ('days_remaining', models.IntegerField(default=0)),
+                ('total_risks', models.IntegerField(default=0)),
+                ('high_risks', models.IntegerField(default=0, help_text='High or critical severity risks')),
+                ('open_risks', models.IntegerField(default=0)),
+                ('total_tasks', models.IntegerField(default=0)),
+                ('open_tasks', models.IntegerField(default=0)),
+                ('completed_tasks', models.IntegerField(default=0)),
+                ('overdue_tasks', models.IntegerField(default=0)),
+                ('total_issues', models.IntegerField(default=0)),
+                ('open_issues', models.IntegerField(default=0)),
+                ('computed_on', models.DateField(help_text='Date used for date-dependent metrics (overdue, days remaining)')),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'verbose_name_plural': 'project metrics',
+                'indexes': [models.Index(fields=['computed_on'], name='projects_pr_compute_5552b2_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,17 @@
+# Generated by Django 5.0 on 2026-10-15 03:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('projects', '0004_projectmetrics'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='projectsnapshot',
+            index=models.Index(fields=['snapshot_date'], name='projects_pr_snapsho_615cee_idx'),
+        ),
+    ]
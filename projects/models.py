@@ -1,8 +1,113 @@
 from django.db import models
+from django.db.models import Case, Count, F, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest, Least
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 
 
+def related_count(queryset):
+    """Correlated COUNT subquery over a queryset filtered on project=OuterRef('pk')"""
+    counts = queryset.order_by().values('project').annotate(count=Count('pk')).values('count')
+    return Coalesce(Subquery(counts[:1]), 0)
+
+
+def calculate_health_score(spi, cpi, high_risks, overdue_tasks):
+    """Health scoring rules (0-100); ProjectQuerySet.with_health mirrors them in SQL"""
+    score = 100
+    
+    if spi < 0.7:
+        score -= 30
+    elif spi < 0.9:
+        score -= 15
+    
+    if cpi < 0.7:
+        score -= 20
+    elif cpi < 0.9:
+        score -= 10
+    
+    score -= min(high_risks * 10, 30)
+    score -= min(overdue_tasks * 5, 20)
+    
+    return max(0, score)
+
+
+class ProjectQuerySet(models.QuerySet):
+    """
+    Database-side health score and counters.
+    
+    Annotations read the denormalized ProjectMetrics row when it was computed
+    today and only fall back to correlated subqueries otherwise; pass
+    live=True to always compute them from the source tables.
+    """
+    
+    def _annotate_metrics(self, annotations, live):
+        """`annotations` maps annotation name -> (ProjectMetrics column, live expression)"""
+        if live:
+            return self.annotate(**{name: expression for name, (_, expression) in annotations.items()})
+        
+        today = timezone.now().date()
+        return self.annotate(**{
+            name: Case(
+                When(metrics__computed_on=today, then=F(f'metrics__{column}')),
+                default=expression,
+                output_field=models.IntegerField(),
+            )
+            for name, (column, expression) in annotations.items()
+        })
+    
+    def with_health(self, live=False):
+        """
+        Annotate `health` with the same scoring rules as Project.health_score,
+        computed in the database so callers can sort, filter and aggregate on it.
+        """
+        today = timezone.now().date()
+        high_risks = related_count(Risk.objects.filter(project=OuterRef('pk'), severity='high'))
+        overdue_tasks = related_count(Task.objects.filter(
+            project=OuterRef('pk'),
+            status__in=['not_started', 'in_progress'],
+            due_date__lt=today
+        ))
+        
+        spi_penalty = Case(
+            When(spi__lt=0.7, then=Value(30)),
+            When(spi__lt=0.9, then=Value(15)),
+            default=Value(0),
+        )
+        cpi_penalty = Case(
+            When(cpi__lt=0.7, then=Value(20)),
+            When(cpi__lt=0.9, then=Value(10)),
+            default=Value(0),
+        )
+        
+        health = Greatest(
+            Value(100) - spi_penalty - cpi_penalty
+            - Least(high_risks * 10, Value(30))
+            - Least(overdue_tasks * 5, Value(20)),
+            Value(0),
+            output_field=models.IntegerField(),
+        )
+        return self._annotate_metrics({'health': ('health_score', health)}, live)
+    
+    def with_risk_counts(self, live=False):
+        """Annotate `total_risks` and `high_risks` (high or critical severity)"""
+        risks = Risk.objects.filter(project=OuterRef('pk'))
+        return self._annotate_metrics({
+            'total_risks': ('total_risks', related_count(risks)),
+            'high_risks': ('high_risks', related_count(risks.filter(severity__in=['high', 'critical']))),
+        }, live)
+    
+    def with_task_counts(self, live=False):
+        """Annotate `open_tasks` and `overdue_tasks`"""
+        tasks = Task.objects.filter(project=OuterRef('pk'))
+        return self._annotate_metrics({
+            'open_tasks': ('open_tasks', related_count(tasks.exclude(status__in=['completed', 'cancelled']))),
+            'overdue_tasks': ('overdue_tasks', related_count(tasks.filter(
+                status__in=['not_started', 'in_progress'],
+                due_date__lt=timezone.now().date()
+            ))),
+        }, live)
+
+
 class Project(models.Model):
     """Main Project model representing a single project in the portfolio"""
     
@@ -69,6 +174,8 @@ class Project(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
+    objects = ProjectQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-created_at']
         indexes = [
@@ -104,30 +211,35 @@ class Project(models.Model):
         delta = self.planned_end_date - timezone.now().date()
         return delta.days
     
+    @property
+    def current_metrics(self):
+        """The ProjectMetrics row if it was computed today, otherwise None"""
+        try:
+            metrics = self.metrics
+        except ProjectMetrics.DoesNotExist:
+            return None
+        if metrics.computed_on != timezone.now().date():
+            return None
+        return metrics
+    
     @property
     def health_score(self):
-        score = 100
+        # Use the value annotated by Project.objects.with_health() when present
+        annotated = getattr(self, 'health', None)
+        if annotated is not None:
+            return annotated
         
-        if self.spi < 0.7:
-            score -= 30
-        elif self.spi < 0.9:
-            score -= 15
-        
-        if self.cpi < 0.7:
-            score -= 20
-        elif self.cpi < 0.9:
-            score -= 10
+        metrics = self.current_metrics
+        if metrics is not None:
+            return metrics.health_score
         
         high_risks = self.risks.filter(severity='high').count()
-        score -= min(high_risks * 10, 30)
-        
         overdue_tasks = self.tasks.filter(
             status__in=['not_started', 'in_progress'],
             due_date__lt=timezone.now().date()
         ).count()
-        score -= min(overdue_tasks * 5, 20)
         
-        return max(0, score)
+        return calculate_health_score(self.spi, self.cpi, high_risks, overdue_tasks)
     
     @property
     def schedule_variance(self):
@@ -476,7 +588,45 @@ class ProjectSnapshot(models.Model):
         unique_together = ['project', 'snapshot_date']
         indexes = [
             models.Index(fields=['project', 'snapshot_date']),
+            models.Index(fields=['snapshot_date']),
+        ]
+    
+    def __str__(self):
+        return f"{self.project.code} - {self.snapshot_date}"
+
+
+class ProjectMetrics(models.Model):
+    """
+    Denormalized per-project counters, kept current by projects.signals and
+    rolled over nightly by the `project_metrics` management command.
+    """
+    
+    project = models.OneToOneField(
+        Project, on_delete=models.CASCADE, primary_key=True, related_name='metrics'
+    )
+    
+    health_score = models.IntegerField(default=100)
+    days_remaining = models.IntegerField(default=0)
+    
+    # Counts
+    total_risks = models.IntegerField(default=0)
+    high_risks = models.IntegerField(default=0, help_text="High or critical severity risks")
+    open_risks = models.IntegerField(default=0)
+    total_tasks = models.IntegerField(default=0)
+    open_tasks = models.IntegerField(default=0)
+    completed_tasks = models.IntegerField(default=0)
+    overdue_tasks = models.IntegerField(default=0)
+    total_issues = models.IntegerField(default=0)
+    open_issues = models.IntegerField(default=0)
+    
+    computed_on = models.DateField(help_text="Date used for date-dependent metrics (overdue, days remaining)")
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        verbose_name_plural = 'project metrics'
+        indexes = [
+            models.Index(fields=['computed_on']),
         ]
     
     def __str__(self):
-        return f"{self.project.code} - {self.snapshot_date}"
\ No newline at end of file
+        return f"{self.project.code} - {self.computed_on}"
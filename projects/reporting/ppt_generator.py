@@ -79,7 +79,7 @@ class PowerPointGenerator:
         total_budget = projects.aggregate(Sum('budget'))['budget__sum'] or 0
         total_spent = projects.aggregate(Sum('spent'))['spent__sum'] or 0
         
-        avg_health = sum([p.health_score for p in projects]) / total_projects if total_projects else 0
+        avg_health = projects.with_health().aggregate(avg=Avg('health'))['avg'] or 0
         
         # Add content
         left = Inches(1)
@@ -174,7 +174,7 @@ class PowerPointGenerator:
         title = slide.shapes.title
         title.text = "Project Status Detail"
         
-        projects = Project.objects.all()[:5]  # Top 5 projects
+        projects = Project.objects.with_health()[:5]  # Top 5 projects
         
         left = Inches(0.5)
         top = Inches(1.5)
@@ -2,6 +2,12 @@ from rest_framework import serializers
 from .models import Project, Risk, Task, Resource, Milestone
 
 
+def annotated_or(obj, name, compute):
+    """Return the queryset annotation `name` when present, otherwise compute() it"""
+    value = getattr(obj, name, None)
+    return value if value is not None else compute()
+
+
 class RiskSerializer(serializers.ModelSerializer):
     risk_score = serializers.ReadOnlyField()
     
@@ -56,47 +62,104 @@ class ProjectListSerializer(serializers.ModelSerializer):
         ]
     
     def get_total_risks(self, obj):
-        return obj.risks.count()
+        # Annotated by Project.objects.with_risk_counts() on list endpoints
+        return annotated_or(obj, 'total_risks', lambda: obj.risks.count())
     
     def get_high_risks(self, obj):
-        return obj.risks.filter(severity__in=['high', 'critical']).count()
+        return annotated_or(
+            obj, 'high_risks', lambda: obj.risks.filter(severity__in=['high', 'critical']).count()
+        )
 
 
 class ProjectDetailSerializer(serializers.ModelSerializer):
-    """Detailed serializer with all related data"""
+    """
+    Detailed serializer with counters and opt-in nested collections.
+    
+    Related collections are only included when named in the `expand` context
+    (see ProjectViewSet.get_expand) and are returned one capped page at a time.
+    """
     health_score = serializers.ReadOnlyField()
     is_overbudget = serializers.ReadOnlyField()
     is_behind_schedule = serializers.ReadOnlyField()
     budget_variance = serializers.ReadOnlyField()
     days_remaining = serializers.ReadOnlyField()
     
-    risks = RiskSerializer(many=True, read_only=True)
-    tasks = TaskSerializer(many=True, read_only=True)
-    resources = ResourceSerializer(many=True, read_only=True)
-    milestones = MilestoneSerializer(many=True, read_only=True)
+    risks = serializers.SerializerMethodField()
+    tasks = serializers.SerializerMethodField()
+    resources = serializers.SerializerMethodField()
+    milestones = serializers.SerializerMethodField()
     
     total_risks = serializers.SerializerMethodField()
     high_risks = serializers.SerializerMethodField()
     open_tasks = serializers.SerializerMethodField()
     overdue_tasks = serializers.SerializerMethodField()
     
+    NESTED_SERIALIZERS = {
+        'risks': RiskSerializer,
+        'tasks': TaskSerializer,
+        'resources': ResourceSerializer,
+        'milestones': MilestoneSerializer,
+    }
+    DEFAULT_NESTED_PAGE_SIZE = 50
+    
     class Meta:
         model = Project
         fields = '__all__'
         read_only_fields = ('created_at', 'updated_at')
     
+    def get_fields(self):
+        fields = super().get_fields()
+        expand = self.context.get('expand', [])
+        for name in self.NESTED_SERIALIZERS:
+            if name not in expand:
+                fields.pop(name)
+        return fields
+    
+    def _nested_page(self, obj, name):
+        page = self.context.get('nested_pages', {}).get(name, 1)
+        page_size = self.context.get('nested_page_size', self.DEFAULT_NESTED_PAGE_SIZE)
+        
+        # Prefetched by ProjectViewSet.get_detail_queryset
+        items = getattr(obj, f'expanded_{name}', None)
+        if items is None:
+            offset = (page - 1) * page_size
+            items = getattr(obj, name).all()[offset:offset + page_size]
+        
+        return {
+            'count': annotated_or(obj, f'{name}_count', lambda: getattr(obj, name).count()),
+            'page': page,
+            'page_size': page_size,
+            'results': self.NESTED_SERIALIZERS[name](items, many=True, context=self.context).data,
+        }
+    
+    def get_risks(self, obj):
+        return self._nested_page(obj, 'risks')
+    
+    def get_tasks(self, obj):
+        return self._nested_page(obj, 'tasks')
+    
+    def get_resources(self, obj):
+        return self._nested_page(obj, 'resources')
+    
+    def get_milestones(self, obj):
+        return self._nested_page(obj, 'milestones')
+    
     def get_total_risks(self, obj):
-        return obj.risks.count()
+        return annotated_or(obj, 'total_risks', lambda: obj.risks.count())
     
     def get_high_risks(self, obj):
-        return obj.risks.filter(severity__in=['high', 'critical']).count()
+        return annotated_or(
+            obj, 'high_risks', lambda: obj.risks.filter(severity__in=['high', 'critical']).count()
+        )
     
     def get_open_tasks(self, obj):
-        return obj.tasks.exclude(status__in=['completed', 'cancelled']).count()
+        return annotated_or(
+            obj, 'open_tasks', lambda: obj.tasks.exclude(status__in=['completed', 'cancelled']).count()
+        )
     
     def get_overdue_tasks(self, obj):
         from django.utils import timezone
-        return obj.tasks.filter(
+        return annotated_or(obj, 'overdue_tasks', lambda: obj.tasks.filter(
             status__in=['not_started', 'in_progress'],
             due_date__lt=timezone.now().date()
-        ).count()
+        ).count())
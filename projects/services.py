@@ -0,0 +1,116 @@
+from django.db.models import Avg, Count, F, Q, Sum
+from django.utils import timezone
+from django.utils.functional import cached_property
+from .cache import cached
+from .models import Project, Risk, Task
+
+
+def _count_where(**lookups):
+    """Conditional COUNT(*) used to fold several filters into one aggregate query"""
+    return Count('id', filter=Q(**lookups))
+
+
+class PortfolioStats:
+    """
+    Portfolio-wide statistics shared by dashboards, analytics and AI context.
+
+    Every breakdown for a table is computed in a single conditional-aggregation
+    query, and each table is only queried the first time it is accessed.
+    Results are shared through the version-stamped cache in projects.cache
+    unless use_cache is False.
+    """
+
+    def __init__(self, use_cache=True):
+        self.use_cache = use_cache
+
+    def _cached(self, name, compute):
+        if not self.use_cache:
+            return compute()
+        return cached(f'portfolio-{name}', compute)
+
+    @cached_property
+    def projects(self):
+        return self._cached('projects', self._project_stats)
+
+    @cached_property
+    def risks(self):
+        return self._cached('risks', self._risk_stats)
+
+    @cached_property
+    def tasks(self):
+        return self._cached('tasks', self._task_stats)
+
+    def _project_stats(self):
+        aggregates = {'total': Count('id')}
+        for value, _ in Project.STATUS_CHOICES:
+            aggregates[f'status_{value}'] = _count_where(status=value)
+        for value, _ in Project.PRIORITY_CHOICES:
+            aggregates[f'priority_{value}'] = _count_where(priority=value)
+
+        row = Project.objects.order_by().aggregate(
+            **aggregates,
+            spi_ahead=_count_where(spi__gte=1.1),
+            spi_on_track=_count_where(spi__gte=0.9, spi__lt=1.1),
+            spi_behind=_count_where(spi__lt=0.9),
+            overbudget=_count_where(spent__gt=F('budget')),
+            avg_completion=Avg('completion_percentage'),
+            avg_spi=Avg('spi'),
+            avg_cpi=Avg('cpi'),
+            total_budget=Sum('budget'),
+            total_spent=Sum('spent'),
+        )
+
+        return {
+            'total': row['total'],
+            'active': row['total'] - row['status_completed'],
+            'by_status': {value: row[f'status_{value}'] for value, _ in Project.STATUS_CHOICES},
+            'by_priority': {value: row[f'priority_{value}'] for value, _ in Project.PRIORITY_CHOICES},
+            'by_spi': {
+                'ahead': row['spi_ahead'],
+                'on_track': row['spi_on_track'],
+                'behind': row['spi_behind'],
+            },
+            'overbudget': row['overbudget'],
+            'avg_completion': row['avg_completion'] or 0,
+            'avg_spi': row['avg_spi'] or 0,
+            'avg_cpi': row['avg_cpi'] or 0,
+            'total_budget': row['total_budget'] or 0,
+            'total_spent': row['total_spent'] or 0,
+        }
+
+    def _risk_stats(self):
+        aggregates = {'total': Count('id')}
+        for value, _ in Risk.SEVERITY_CHOICES:
+            aggregates[f'severity_{value}'] = _count_where(severity=value)
+        for value, _ in Risk.STATUS_CHOICES:
+            aggregates[f'status_{value}'] = _count_where(status=value)
+
+        row = Risk.objects.order_by().aggregate(**aggregates)
+
+        return {
+            'total': row['total'],
+            'high': row['severity_high'] + row['severity_critical'],
+            'active': row['status_open'] + row['status_mitigating'],
+            'by_severity': {value: row[f'severity_{value}'] for value, _ in Risk.SEVERITY_CHOICES},
+            'by_status': {value: row[f'status_{value}'] for value, _ in Risk.STATUS_CHOICES},
+        }
+
+    def _task_stats(self):
+        aggregates = {'total': Count('id')}
+        for value, _ in Task.STATUS_CHOICES:
+            aggregates[f'status_{value}'] = _count_where(status=value)
+
+        row = Task.objects.order_by().aggregate(
+            **aggregates,
+            overdue=_count_where(
+                status__in=['not_started', 'in_progress'],
+                due_date__lt=timezone.now().date()
+            ),
+        )
+
+        return {
+            'total': row['total'],
+            'pending': row['status_not_started'] + row['status_in_progress'],
+            'overdue': row['overdue'],
+            'by_status': {value: row[f'status_{value}'] for value, _ in Task.STATUS_CHOICES},
+        }
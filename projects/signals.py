@@ -0,0 +1,37 @@
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from .models import Project, Risk, Task, Issue, Milestone
+from .cache import schedule_version_bump
+from .metrics import schedule_metrics_refresh
+
+
+@receiver(post_save, sender=Project)
+def refresh_metrics_on_project_save(sender, instance, raw=False, **kwargs):
+    """Health and days remaining depend on the project's own fields"""
+    if not raw:
+        schedule_metrics_refresh(instance.pk)
+
+
+@receiver(post_save, sender=Risk)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Issue)
+@receiver(post_delete, sender=Risk)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Issue)
+def refresh_metrics_on_related_change(sender, instance, raw=False, **kwargs):
+    if not raw:
+        schedule_metrics_refresh(instance.project_id)
+
+
+@receiver(post_save, sender=Project)
+@receiver(post_save, sender=Risk)
+@receiver(post_save, sender=Task)
+@receiver(post_save, sender=Issue)
+@receiver(post_save, sender=Milestone)
+@receiver(post_delete, sender=Project)
+@receiver(post_delete, sender=Risk)
+@receiver(post_delete, sender=Task)
+@receiver(post_delete, sender=Issue)
+@receiver(post_delete, sender=Milestone)
+def invalidate_portfolio_cache(sender, **kwargs):
+    schedule_version_bump()
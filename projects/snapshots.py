@@ -0,0 +1,111 @@
+"""
+Set-based computation of ProjectSnapshot rows.
+
+Counters for a chunk of projects come from one grouped query per related
+table. For past dates (backfills) the counters are reconstructed from the
+dated fields of risks, tasks and issues; project-level fields such as status,
+SPI, CPI and budget are not versioned, so their current values are used.
+"""
+from datetime import datetime, time, timedelta
+from django.db import transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+from .models import Project, ProjectSnapshot, Risk, Task, Issue, calculate_health_score
+
+SNAPSHOT_FIELDS = [
+    'status', 'completion_percentage', 'budget', 'spent', 'spi', 'cpi', 'health_score',
+    'total_tasks', 'completed_tasks', 'total_risks', 'high_risks', 'total_issues', 'open_issues',
+]
+
+PROJECT_FIELDS = ['id', 'status', 'completion_percentage', 'budget', 'spent', 'spi', 'cpi']
+
+
+def _grouped_counts(queryset, project_ids, **counters):
+    """{project_id: {counter: n}} from a single GROUP BY project query"""
+    rows = (
+        queryset.filter(project_id__in=project_ids)
+        .order_by()
+        .values('project_id')
+        .annotate(**{name: Count('id', filter=condition) for name, condition in counters.items()})
+    )
+    return {row.pop('project_id'): row for row in rows}
+
+
+def compute_snapshot_rows(project_ids, snapshot_date):
+    """Snapshot field values for the given projects as of `snapshot_date`, as plain dicts"""
+    today = timezone.now().date()
+    projects = Project.objects.filter(pk__in=project_ids)
+
+    if snapshot_date >= today:
+        # Live state: the same rules as Project.health_score and the detail counters
+        risks = Risk.objects.all()
+        tasks = Task.objects.all()
+        issues = Issue.objects.all()
+        completed = Q(status='completed')
+        overdue = Q(status__in=['not_started', 'in_progress'], due_date__lt=today)
+        open_issue = Q(status='open')
+    else:
+        end_of_day = timezone.make_aware(datetime.combine(snapshot_date + timedelta(days=1), time.min))
+        # Projects created later have no snapshot for the date
+        projects = projects.filter(created_at__lt=end_of_day)
+        risks = Risk.objects.filter(identified_date__lte=snapshot_date)
+        tasks = Task.objects.filter(created_at__lt=end_of_day)
+        issues = Issue.objects.filter(reported_date__lte=snapshot_date)
+        completed = Q(completion_date__lte=snapshot_date)
+        overdue = Q(due_date__lt=snapshot_date) & ~Q(status='cancelled') & (
+            Q(completion_date__isnull=True) | Q(completion_date__gt=snapshot_date)
+        )
+        open_issue = Q(resolved_date__isnull=True) | Q(resolved_date__gt=snapshot_date)
+
+    risk_counts = _grouped_counts(
+        risks, project_ids,
+        total_risks=Q(),
+        high_risks=Q(severity__in=['high', 'critical']),
+        health_high_risks=Q(severity='high'),
+    )
+    task_counts = _grouped_counts(
+        tasks, project_ids,
+        total_tasks=Q(),
+        completed_tasks=completed,
+        overdue_tasks=overdue,
+    )
+    issue_counts = _grouped_counts(
+        issues, project_ids,
+        total_issues=Q(),
+        open_issues=open_issue,
+    )
+
+    rows = []
+    for project in projects.order_by().values(*PROJECT_FIELDS):
+        project_id = project.pop('id')
+        risk = risk_counts.get(project_id, {})
+        task = task_counts.get(project_id, {})
+        issue = issue_counts.get(project_id, {})
+        rows.append({
+            'project_id': project_id,
+            'snapshot_date': snapshot_date,
+            **project,
+            'health_score': calculate_health_score(
+                project['spi'], project['cpi'],
+                risk.get('health_high_risks', 0), task.get('overdue_tasks', 0)
+            ),
+            'total_tasks': task.get('total_tasks', 0),
+            'completed_tasks': task.get('completed_tasks', 0),
+            'total_risks': risk.get('total_risks', 0),
+            'high_risks': risk.get('high_risks', 0),
+            'total_issues': issue.get('total_issues', 0),
+            'open_issues': issue.get('open_issues', 0),
+        })
+    return rows
+
+
+def save_snapshot_rows(rows):
+    """Upsert snapshot rows on (project, snapshot_date) in a single statement"""
+    with transaction.atomic():
+        ProjectSnapshot.objects.bulk_create(
+            [ProjectSnapshot(**row) for row in rows],
+            update_conflicts=True,
+            unique_fields=['project', 'snapshot_date'],
+            update_fields=SNAPSHOT_FIELDS,
+        )
+    return len(rows)
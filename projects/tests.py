@@ -1,3 +1,482 @@
+import csv
+import json
+import tempfile
+import zipfile
+from datetime import timedelta
+from decimal import Decimal
+from io import BytesIO, StringIO
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from .cache import CACHE_NAMES, get_cache_stats
+from .imports import IMPORTS, import_csv
+from .metrics import find_inconsistent_metrics, refresh_project_metrics
+from .models import Project, ProjectMetrics, ProjectSnapshot, Risk, Task
+from .services import PortfolioStats
 
-# Create your tests here.
+
+def make_project(index, **overrides):
+    today = timezone.now().date()
+    fields = {
+        'name': f'Project {index}',
+        'code': f'PRJ-{index:03d}',
+        'start_date': today - timedelta(days=30),
+        'planned_end_date': today + timedelta(days=60),
+        'budget': Decimal('1000.00'),
+        'spent': Decimal('500.00'),
+        'project_manager': 'Manager',
+    }
+    fields.update(overrides)
+    return Project.objects.create(**fields)
+
+
+def make_risk(project, **overrides):
+    fields = {
+        'title': 'Risk',
+        'description': 'Risk description',
+        'category': 'schedule',
+        'severity': 'medium',
+        'probability': 50,
+        'impact': 5,
+        'owner': 'Owner',
+    }
+    fields.update(overrides)
+    return Risk.objects.create(project=project, **fields)
+
+
+def make_task(project, **overrides):
+    today = timezone.now().date()
+    fields = {
+        'name': 'Task',
+        'assigned_to': 'Assignee',
+        'start_date': today - timedelta(days=10),
+        'due_date': today + timedelta(days=10),
+    }
+    fields.update(overrides)
+    return Task.objects.create(project=project, **fields)
+
+
+class PortfolioStatsTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        today = timezone.now().date()
+        self.healthy = make_project(1, spi=Decimal('1.20'), cpi=Decimal('1.00'), priority='high')
+        self.late = make_project(
+            2, status='delayed', spi=Decimal('0.80'), cpi=Decimal('0.80'), spent=Decimal('1500.00')
+        )
+        make_risk(self.late, severity='critical')
+        make_risk(self.late, severity='low', status='closed')
+        make_task(self.late, due_date=today - timedelta(days=1))
+        make_task(self.healthy, status='completed')
+
+    def test_one_query_per_table(self):
+        stats = PortfolioStats()
+        with self.assertNumQueries(3):
+            projects, risks, tasks = stats.projects, stats.risks, stats.tasks
+        with self.assertNumQueries(0):
+            stats.projects
+
+        self.assertEqual(projects['total'], 2)
+        self.assertEqual(projects['by_status']['delayed'], 1)
+        self.assertEqual(projects['by_priority']['high'], 1)
+        self.assertEqual(projects['by_spi'], {'ahead': 1, 'on_track': 0, 'behind': 1})
+        self.assertEqual(projects['overbudget'], 1)
+        self.assertEqual(projects['total_spent'], Decimal('2000.00'))
+        self.assertEqual(risks['high'], 1)
+        self.assertEqual(risks['active'], 1)
+        self.assertEqual(tasks['overdue'], 1)
+        self.assertEqual(tasks['by_status']['completed'], 1)
+
+    def test_empty_portfolio(self):
+        Project.objects.all().delete()
+        projects = PortfolioStats().projects
+        self.assertEqual(projects['total'], 0)
+        self.assertEqual(projects['avg_spi'], 0)
+        self.assertEqual(projects['total_budget'], 0)
+
+    def test_cache_invalidated_on_commit(self):
+        self.assertEqual(PortfolioStats().projects['total'], 2)
+        with self.assertNumQueries(0):
+            self.assertEqual(PortfolioStats().projects['total'], 2)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            make_project(3)
+        self.assertEqual(PortfolioStats().projects['total'], 3)
+        stats = self.client.get('/api/cache/stats/')
+        self.assertEqual(stats.status_code, 403)
+
+    def test_cache_stats_list_every_cache(self):
+        PortfolioStats().projects
+        entries = get_cache_stats()['entries']
+        self.assertEqual(set(entries), set(CACHE_NAMES))
+        self.assertEqual(entries['portfolio-projects']['misses'], 1)
+        self.assertEqual(entries['portfolio-risks'], {'hits': 0, 'misses': 0, 'hit_rate': None})
+
+
+class ProjectHealthAnnotationTests(TestCase):
+
+    def setUp(self):
+        today = timezone.now().date()
+        self.projects = [
+            make_project(1),
+            make_project(2, spi=Decimal('0.85'), cpi=Decimal('0.60')),
+            make_project(3, spi=Decimal('0.50'), cpi=Decimal('0.50')),
+        ]
+        for _ in range(4):
+            make_risk(self.projects[2], severity='high')
+            make_task(self.projects[2], due_date=today - timedelta(days=3))
+        make_risk(self.projects[1], severity='high')
+        make_risk(self.projects[1], severity='critical')
+        make_task(self.projects[1], due_date=today - timedelta(days=3), status='completed')
+
+    def test_annotation_matches_property(self):
+        annotated = {p.pk: p.health for p in Project.objects.with_health()}
+        for project in Project.objects.all():
+            self.assertEqual(annotated[project.pk], project.health_score)
+        self.assertEqual(sorted(annotated.values()), [0, 55, 100])
+
+    def test_property_uses_annotation(self):
+        projects = list(Project.objects.with_health().order_by('-health')[:2])
+        with self.assertNumQueries(0):
+            scores = [p.health_score for p in projects]
+        self.assertEqual(scores, [100, 55])
+
+
+class ProjectListQueryCountTests(TestCase):
+
+    def populate(self, count, **overrides):
+        for index in range(count):
+            project = make_project(len(self.created) + 1, **overrides)
+            make_risk(project, severity='high')
+            make_risk(project, severity='low')
+            make_task(project, due_date=timezone.now().date() - timedelta(days=1))
+            self.created.append(project)
+
+    def queries_for(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context), response.json()
+
+    def setUp(self):
+        self.created = []
+
+    def test_list_query_count_is_constant(self):
+        self.populate(2)
+        small_queries, small = self.queries_for('/api/projects/')
+        self.populate(15)
+        large_queries, large = self.queries_for('/api/projects/')
+
+        self.assertEqual(len(small['results']), 2)
+        self.assertEqual(len(large['results']), 17)
+        self.assertEqual(small_queries, large_queries)
+        self.assertEqual(large['results'][0]['total_risks'], 2)
+        self.assertEqual(large['results'][0]['high_risks'], 1)
+        self.assertEqual(large['results'][0]['health_score'], 85)
+
+    def test_at_risk_query_count_is_constant(self):
+        self.populate(2, status='at_risk')
+        small_queries, _ = self.queries_for('/api/projects/at_risk_projects/')
+        self.populate(10, spi=Decimal('0.80'))
+        large_queries, data = self.queries_for('/api/projects/at_risk_projects/')
+        self.assertEqual(len(data), 12)
+        self.assertEqual(small_queries, large_queries)
+
+
+class ProjectDetailExpandTests(TestCase):
+
+    def setUp(self):
+        self.project = make_project(1)
+        for index in range(60):
+            make_task(self.project, name=f'Task {index}', due_date=timezone.now().date() - timedelta(days=1))
+        make_risk(self.project, severity='critical')
+        self.url = f'/api/projects/{self.project.pk}/'
+
+    def test_collections_are_opt_in(self):
+        with self.assertNumQueries(1):
+            data = self.client.get(self.url).json()
+        for name in ('risks', 'tasks', 'resources', 'milestones'):
+            self.assertNotIn(name, data)
+        self.assertEqual(data['open_tasks'], 60)
+        self.assertEqual(data['overdue_tasks'], 60)
+        self.assertEqual(data['high_risks'], 1)
+
+    def test_expanded_collections_are_paginated(self):
+        with self.assertNumQueries(3):
+            data = self.client.get(self.url, {'expand': 'tasks,risks', 'tasks_page': 2}).json()
+        self.assertNotIn('milestones', data)
+        self.assertEqual(data['tasks']['count'], 60)
+        self.assertEqual(data['tasks']['page'], 2)
+        self.assertEqual(len(data['tasks']['results']), 10)
+        self.assertEqual(len(data['risks']['results']), 1)
+
+
+class ProjectMetricsTests(TestCase):
+
+    def test_metrics_follow_writes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            project = make_project(1, cpi=Decimal('0.80'))
+            make_risk(project, severity='high')
+            task = make_task(project, due_date=timezone.now().date() - timedelta(days=2))
+        metrics = ProjectMetrics.objects.get(project=project)
+        self.assertEqual(metrics.high_risks, 1)
+        self.assertEqual(metrics.overdue_tasks, 1)
+        self.assertEqual(metrics.health_score, 75)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            task.delete()
+        metrics.refresh_from_db()
+        self.assertEqual(metrics.overdue_tasks, 0)
+        self.assertEqual(metrics.health_score, 80)
+        self.assertEqual(find_inconsistent_metrics(), [])
+
+    def test_annotations_read_current_metrics_only(self):
+        project = make_project(1)
+        refresh_project_metrics()
+        ProjectMetrics.objects.filter(project=project).update(health_score=42)
+        self.assertEqual(Project.objects.with_health().get().health, 42)
+        self.assertEqual(Project.objects.with_health(live=True).get().health, 100)
+
+        yesterday = timezone.now().date() - timedelta(days=1)
+        ProjectMetrics.objects.filter(project=project).update(computed_on=yesterday)
+        self.assertEqual(Project.objects.with_health().get().health, 100)
+        self.assertEqual(Project.objects.get().health_score, 100)
+
+
+class CreateSnapshotsCommandTests(TestCase):
+
+    def test_snapshots_are_upserted_in_bulk(self):
+        for index in range(1, 6):
+            project = make_project(index, spi=Decimal('0.80'))
+            make_risk(project, severity='high')
+            make_task(project, due_date=timezone.now().date() - timedelta(days=1))
+
+        # project ids, then per chunk: 3 grouped counts + projects + upsert (inside a savepoint)
+        with self.assertNumQueries(8):
+            call_command('create_snapshots', stdout=StringIO())
+        call_command('create_snapshots', stdout=StringIO())
+
+        snapshots = ProjectSnapshot.objects.all()
+        self.assertEqual(snapshots.count(), 5)
+        for snapshot in snapshots:
+            self.assertEqual(snapshot.health_score, snapshot.project.health_score)
+            self.assertEqual(snapshot.high_risks, 1)
+
+    def test_backfill_range(self):
+        older = make_project(1)
+        newer = make_project(2)
+        Project.objects.filter(pk=older.pk).update(created_at=timezone.now() - timedelta(days=10))
+        Project.objects.filter(pk=newer.pk).update(created_at=timezone.now() - timedelta(days=2))
+        today = timezone.now().date()
+        call_command(
+            'create_snapshots', '--from', str(today - timedelta(days=6)), '--to', str(today),
+            stdout=StringIO()
+        )
+        self.assertEqual(ProjectSnapshot.objects.filter(project=older).count(), 7)
+        # No snapshots before the project existed
+        self.assertEqual(ProjectSnapshot.objects.filter(project=newer).count(), 3)
+
+
+class TrendEndpointTests(TestCase):
+
+    def setUp(self):
+        self.project = make_project(1)
+        other = make_project(2, spi=Decimal('0.60'))
+        Project.objects.update(created_at=timezone.now() - timedelta(days=30))
+        today = timezone.now().date()
+        call_command(
+            'create_snapshots', '--from', str(today - timedelta(days=13)), '--to', str(today),
+            stdout=StringIO()
+        )
+        self.other = other
+
+    def test_portfolio_trend_is_columnar(self):
+        with self.assertNumQueries(1):
+            data = self.client.get('/api/portfolio/trend/', {'bucket': 'day'}).json()
+        self.assertEqual(len(data['dates']), 14)
+        self.assertEqual(set(data['projects']), {2})
+        self.assertEqual(data['spi'][0], 0.8)
+        for metric in ('cpi', 'health_score', 'completion_percentage'):
+            self.assertEqual(len(data[metric]), 14)
+
+    def test_project_trend_buckets(self):
+        data = self.client.get(f'/api/projects/{self.other.pk}/trend/', {'bucket': 'month'}).json()
+        self.assertEqual(data['project_id'], self.other.pk)
+        self.assertLessEqual(len(data['dates']), 2)
+        self.assertEqual(set(data['spi']), {0.6})
+
+    def test_invalid_bucket(self):
+        response = self.client.get('/api/portfolio/trend/', {'bucket': 'year'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CsvExportTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('exporter', password='secret')
+        self.client.force_login(user)
+        today = timezone.now().date()
+        self.project = make_project(1, name='Alpha, Beta', status='at_risk')
+        other = make_project(2)
+        make_risk(self.project, severity='critical', category='technical', description='Line one\nline "two"')
+        make_task(self.project, status='completed')
+        make_task(other, due_date=today - timedelta(days=40))
+
+    def read_csv(self, url, params=None):
+        response = self.client.get(url, params or {})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode()
+        return list(csv.reader(StringIO(content)))
+
+    def test_projects_export_quotes_and_labels(self):
+        rows = self.read_csv('/export/projects/', {'status': 'at_risk'})
+        self.assertEqual(rows[0][1], 'project_name')
+        self.assertEqual(len(rows), 2)
+        self.assertEqual(rows[1][1], 'Alpha, Beta')
+        self.assertEqual(rows[1][5], 'At Risk')
+
+    def test_filters_are_applied(self):
+        today = timezone.now().date()
+        rows = self.read_csv('/export/tasks/', {'date_from': str(today - timedelta(days=7))})
+        self.assertEqual([row[1] for row in rows[1:]], [str(self.project.pk)])
+        rows = self.read_csv('/export/risks/', {'project': self.project.pk})
+        self.assertEqual(rows[1][2:], ['Technical', 'Critical', 'Line one\nline "two"'])
+
+    def test_invalid_filter(self):
+        response = self.client.get('/export/tasks/', {'date_to': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_zip_export_streams_all_tables(self):
+        response = self.client.get('/export/all/')
+        self.assertTrue(response.streaming)
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        self.assertEqual(
+            archive.namelist(), ['projects.csv', 'tasks.csv', 'risks.csv', 'resources.csv']
+        )
+        projects = list(csv.reader(StringIO(archive.read('projects.csv').decode())))
+        self.assertEqual(projects[1][1], 'Alpha, Beta')
+        self.assertEqual(len(list(csv.reader(StringIO(archive.read('tasks.csv').decode())))), 3)
+
+    def test_zip_export_ndjson(self):
+        response = self.client.get('/export/all/', {'format': 'ndjson'})
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        risks = [json.loads(line) for line in archive.read('risks.ndjson').decode().splitlines()]
+        self.assertEqual(risks[0]['risk_level'], 'Critical')
+        self.assertEqual(risks[0]['description'], 'Line one\nline "two"')
+        self.assertEqual(self.client.get('/export/all/', {'format': 'xml'}).status_code, 400)
+
+
+class CsvImportTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('importer', password='secret')
+        self.client.force_login(user)
+        self.project = make_project(1)
+
+    def upload(self, table, content):
+        upload = SimpleUploadedFile(f'{table}.csv', content.encode(), content_type='text/csv')
+        return self.client.post(f'/import/{table}/', {'file': upload})
+
+    def test_projects_are_upserted_in_bulk(self):
+        content = (
+            'project_id,project_name,start_date,end_date,budget,status\n'
+            f'{self.project.pk},"Alpha, renamed",2024-01-15,2025-06-30,750000,At Risk\n'
+            ',New project,2024-03-01,2025-08-15,1200000,on_track\n'
+            ',Project 1 copy,2024-03-01,,100,Unknown\n'
+            '999,Ghost,2024-03-01,2025-08-15,100,Delayed\n'
+        )
+        result = import_csv(IMPORTS['projects'], BytesIO(content.encode()))
+        self.assertEqual((result.created, result.updated), (1, 1))
+        self.assertEqual([error['line'] for error in result.errors], [4, 5])
+        self.assertIn('status', result.errors[0]['errors'])
+
+        self.project.refresh_from_db()
+        self.assertEqual(self.project.name, 'Alpha, renamed')
+        self.assertEqual(self.project.status, 'at_risk')
+        self.assertEqual(str(self.project.planned_end_date), '2025-06-30')
+        self.assertTrue(ProjectMetrics.objects.filter(project__name='New project').exists())
+
+    def test_export_round_trip_for_tasks_and_risks(self):
+        task = make_task(self.project, name='Build')
+        make_risk(self.project, description='Vendor, late')
+        tasks = b''.join(self.client.get('/export/tasks/').streaming_content).decode()
+        risks = b''.join(self.client.get('/export/risks/').streaming_content).decode()
+        tasks += f',{self.project.pk},New task,5,0,10\n'
+
+        self.assertEqual(self.upload('tasks', tasks).status_code, 302)
+        self.upload('risks', risks)
+        self.assertEqual(Task.objects.count(), 2)
+        self.assertEqual(Risk.objects.get().description, 'Vendor, late')
+        task.refresh_from_db()
+        self.assertEqual(task.name, 'Build')
+        new_task = Task.objects.get(name='New task')
+        self.assertEqual((new_task.due_date - new_task.start_date).days, 5)
+
+    def test_moved_rows_refresh_both_projects(self):
+        task = make_task(self.project)
+        other = make_project(2)
+        refresh_project_metrics()
+        content = f'task_id,project_id,task_name,planned_days,actual_days,progress_pct\n{task.pk},{other.pk},Moved,,,\n'
+        result = import_csv(IMPORTS['tasks'], BytesIO(content.encode()))
+        self.assertEqual(result.updated, 1)
+        self.assertEqual(ProjectMetrics.objects.get(project=self.project).total_tasks, 0)
+        self.assertEqual(ProjectMetrics.objects.get(project=other).total_tasks, 1)
+
+    def test_missing_columns(self):
+        response = self.upload('resources', 'resource_id,name\n1,Someone\n')
+        messages = [str(message) for message in response.wsgi_request._messages]
+        self.assertIn('Missing columns: role, utilization_pct', messages[0])
+
+    def test_malformed_csv_is_reported(self):
+        # A field over csv.field_size_limit() makes the reader raise csv.Error
+        response = self.upload('resources', 'resource_id,name,role,utilization_pct\n1,' + 'x' * 200000 + ',Dev,50\n')
+        self.assertEqual(response.status_code, 302)
+        messages = [str(message) for message in response.wsgi_request._messages]
+        self.assertIn('Error importing CSV: field larger than field limit', messages[0])
+
+
+class ColumnarExportTests(TestCase):
+
+    def setUp(self):
+        user = User.objects.create_user('analyst', password='secret')
+        self.client.force_login(user)
+        self.project = make_project(1, status='delayed', budget=Decimal('1234.56'))
+        make_task(self.project, completion_date=timezone.now().date())
+        make_task(make_project(2), status='completed')
+
+    def test_parquet_archive_is_typed_and_partitioned(self):
+        import pyarrow.parquet as pq
+
+        response = self.client.get('/export/columnar/', {'partition': 'status', 'tables': 'projects,tasks,issues'})
+        self.assertEqual(response.status_code, 200)
+        archive = zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+        names = archive.namelist()
+        self.assertIn('projects/status=delayed/projects-0-0.parquet', names)
+        self.assertIn('tasks/status=completed/tasks-0-0.parquet', names)
+        self.assertIn('issues/issues-0.parquet', names)
+
+        table = pq.read_table(BytesIO(archive.read('projects/status=delayed/projects-0-0.parquet')))
+        self.assertEqual(str(table.schema.field('budget').type), 'decimal128(15, 2)')
+        self.assertEqual(str(table.schema.field('start_date').type), 'date32[day]')
+        self.assertEqual(table.column('budget').to_pylist(), [Decimal('1234.56')])
+
+    def test_feather_command(self):
+        import pyarrow.feather as feather
+
+        with tempfile.TemporaryDirectory() as output:
+            call_command('export_columnar', output, '--format', 'feather', '--tables', 'tasks', stdout=StringIO())
+            frame = feather.read_table(f'{output}/tasks/tasks-0-0.feather').to_pandas()
+        self.assertEqual(len(frame), 2)
+        self.assertEqual(str(frame['created_at'].dtype), 'datetime64[us, UTC]')
+        self.assertEqual(frame['completion_date'].isna().tolist(), [False, True])
+
+    def test_invalid_options(self):
+        self.assertEqual(self.client.get('/export/columnar/', {'format': 'orc'}).status_code, 400)
+        self.assertEqual(self.client.get('/export/columnar/', {'tables': 'users'}).status_code, 400)
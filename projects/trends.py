@@ -0,0 +1,72 @@
+"""
+Time series over ProjectSnapshot, downsampled in SQL.
+
+Results are columnar: one array per metric aligned with a `dates` array,
+which keeps multi-year payloads small.
+"""
+from datetime import date, timedelta
+from django.db.models import Avg, Count, F
+from django.db.models.functions import TruncMonth, TruncWeek
+from django.utils import timezone
+
+TREND_METRICS = ['spi', 'cpi', 'health_score', 'completion_percentage']
+
+BUCKETS = {
+    'day': lambda: F('snapshot_date'),
+    'week': lambda: TruncWeek('snapshot_date'),
+    'month': lambda: TruncMonth('snapshot_date'),
+}
+
+DEFAULT_RANGE_DAYS = 90
+
+
+def parse_trend_params(params):
+    """
+    Read `from`, `to` and `bucket` query parameters.
+    
+    Raises ValueError with a user-facing message on invalid input.
+    """
+    bucket = params.get('bucket', 'day')
+    if bucket not in BUCKETS:
+        raise ValueError(f"bucket must be one of: {', '.join(BUCKETS)}")
+    
+    try:
+        date_to = date.fromisoformat(params['to']) if params.get('to') else timezone.now().date()
+        date_from = (
+            date.fromisoformat(params['from']) if params.get('from')
+            else date_to - timedelta(days=DEFAULT_RANGE_DAYS)
+        )
+    except ValueError:
+        raise ValueError('from/to must be dates in YYYY-MM-DD format')
+    
+    if date_from > date_to:
+        raise ValueError('from must not be after to')
+    
+    return date_from, date_to, bucket
+
+
+def snapshot_trend(snapshots, date_from, date_to, bucket):
+    """Average each metric per bucket over an indexed snapshot_date range scan"""
+    rows = (
+        snapshots.filter(snapshot_date__gte=date_from, snapshot_date__lte=date_to)
+        .order_by()
+        .annotate(period=BUCKETS[bucket]())
+        .values('period')
+        .annotate(projects=Count('project', distinct=True), **{metric: Avg(metric) for metric in TREND_METRICS})
+        .order_by('period')
+    )
+    
+    series = {
+        'bucket': bucket,
+        'from': date_from,
+        'to': date_to,
+        'dates': [],
+        'projects': [],
+        **{metric: [] for metric in TREND_METRICS},
+    }
+    for row in rows:
+        series['dates'].append(row['period'])
+        series['projects'].append(row['projects'])
+        for metric in TREND_METRICS:
+            series[metric].append(round(float(row[metric]), 2) if row[metric] is not None else None)
+    return series
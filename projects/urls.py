@@ -1,6 +1,9 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import ProjectViewSet, RiskViewSet, TaskViewSet, ResourceViewSet, MilestoneViewSet
+from .views import (
+    ProjectViewSet, RiskViewSet, TaskViewSet, ResourceViewSet, MilestoneViewSet,
+    PortfolioTrendView, CacheStatsView,
+)
 
 router = DefaultRouter()
 router.register(r'projects', ProjectViewSet, basename='project')
@@ -10,5 +13,7 @@ router.register(r'resources', ResourceViewSet, basename='resource')
 router.register(r'milestones', MilestoneViewSet, basename='milestone')
 
 urlpatterns = [
+    path('portfolio/trend/', PortfolioTrendView.as_view(), name='portfolio-trend'),
+    path('cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
     path('', include(router.urls)),
 ]
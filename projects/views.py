@@ -1,14 +1,19 @@
 from rest_framework import viewsets, filters, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from rest_framework.views import APIView
+from rest_framework.permissions import IsAdminUser
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Count, Q, Avg, F
+from django.db.models import Count, Q, Avg, F, OuterRef, Prefetch
 from django.utils import timezone
-from .models import Project, Risk, Task, Resource, Milestone
+from .models import Project, ProjectSnapshot, Risk, Task, Resource, Milestone, related_count
 from .serializers import (
     ProjectListSerializer, ProjectDetailSerializer,
     RiskSerializer, TaskSerializer, ResourceSerializer, MilestoneSerializer
 )
+from .cache import get_cache_stats
+from .services import PortfolioStats
+from .trends import parse_trend_params, snapshot_trend
 
 
 class ProjectViewSet(viewsets.ModelViewSet):
@@ -16,9 +21,61 @@ class ProjectViewSet(viewsets.ModelViewSet):
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['status', 'priority', 'project_manager']
     search_fields = ['name', 'code', 'description']
-    ordering_fields = ['name', 'status', 'completion_percentage', 'spi', 'start_date']
+    ordering_fields = ['name', 'status', 'completion_percentage', 'spi', 'start_date', 'health']
     ordering = ['-created_at']
     
+    # Nested collections available through ?expand=risks,tasks (or ?expand=all)
+    EXPANDABLE = ('risks', 'tasks', 'resources', 'milestones')
+    NESTED_PAGE_SIZE = 50
+    
+    def get_queryset(self):
+        # Writes use plain instances so annotations can't go stale in the response
+        if self.action in ('list', 'at_risk_projects'):
+            return Project.objects.with_health().with_risk_counts()
+        if self.action == 'retrieve':
+            return self.get_detail_queryset()
+        if self.action == 'health_report':
+            return Project.objects.with_health()
+        return Project.objects.all()
+    
+    def get_detail_queryset(self):
+        queryset = Project.objects.with_health().with_risk_counts().with_task_counts()
+        
+        for name in self.get_expand():
+            model = Project._meta.get_field(name).related_model
+            page = self.get_nested_page(name)
+            offset = (page - 1) * self.NESTED_PAGE_SIZE
+            queryset = queryset.annotate(**{
+                f'{name}_count': related_count(model.objects.filter(project=OuterRef('pk')))
+            }).prefetch_related(Prefetch(
+                name,
+                queryset=model.objects.all()[offset:offset + self.NESTED_PAGE_SIZE],
+                to_attr=f'expanded_{name}',
+            ))
+        
+        return queryset
+    
+    def get_expand(self):
+        requested = self.request.query_params.get('expand', '')
+        names = {name.strip() for name in requested.split(',') if name.strip()}
+        if 'all' in names:
+            return list(self.EXPANDABLE)
+        return [name for name in self.EXPANDABLE if name in names]
+    
+    def get_nested_page(self, name):
+        try:
+            return max(int(self.request.query_params.get(f'{name}_page', 1)), 1)
+        except ValueError:
+            return 1
+    
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action == 'retrieve':
+            context['expand'] = self.get_expand()
+            context['nested_pages'] = {name: self.get_nested_page(name) for name in context['expand']}
+            context['nested_page_size'] = self.NESTED_PAGE_SIZE
+        return context
+    
     def get_serializer_class(self):
         if self.action == 'list':
             return ProjectListSerializer
@@ -26,36 +83,25 @@ class ProjectViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def dashboard_stats(self, request):
-        total_projects = Project.objects.count()
+        portfolio = PortfolioStats()
+        projects = portfolio.projects
+        risks = portfolio.risks
         
         stats = {
-            'total_projects': total_projects,
-            'by_status': {
-                'on_track': Project.objects.filter(status='on_track').count(),
-                'at_risk': Project.objects.filter(status='at_risk').count(),
-                'delayed': Project.objects.filter(status='delayed').count(),
-                'completed': Project.objects.filter(status='completed').count(),
-                'cancelled': Project.objects.filter(status='cancelled').count(),
-            },
-            'by_priority': {
-                'low': Project.objects.filter(priority='low').count(),
-                'medium': Project.objects.filter(priority='medium').count(),
-                'high': Project.objects.filter(priority='high').count(),
-                'critical': Project.objects.filter(priority='critical').count(),
-            },
+            'total_projects': projects['total'],
+            'by_status': projects['by_status'],
+            'by_priority': projects['by_priority'],
             'performance': {
-                'projects_behind_schedule': Project.objects.filter(spi__lt=0.9).count(),
-                'projects_overbudget': Project.objects.filter(spent__gt=F('budget')).count(),
-                'avg_completion': round(Project.objects.aggregate(
-                    avg=Avg('completion_percentage')
-                )['avg'] or 0, 2),
-                'avg_spi': round(Project.objects.aggregate(avg=Avg('spi'))['avg'] or 0, 2),
-                'avg_cpi': round(Project.objects.aggregate(avg=Avg('cpi'))['avg'] or 0, 2),
+                'projects_behind_schedule': projects['by_spi']['behind'],
+                'projects_overbudget': projects['overbudget'],
+                'avg_completion': round(projects['avg_completion'], 2),
+                'avg_spi': round(projects['avg_spi'], 2),
+                'avg_cpi': round(projects['avg_cpi'], 2),
             },
             'risks': {
-                'total_risks': Risk.objects.count(),
-                'high_risks': Risk.objects.filter(severity__in=['high', 'critical']).count(),
-                'open_risks': Risk.objects.filter(status='open').count(),
+                'total_risks': risks['total'],
+                'high_risks': risks['high'],
+                'open_risks': risks['by_status']['open'],
             }
         }
         
@@ -63,15 +109,26 @@ class ProjectViewSet(viewsets.ModelViewSet):
     
     @action(detail=False, methods=['get'])
     def at_risk_projects(self, request):
-        projects = Project.objects.filter(
+        projects = self.get_queryset().filter(
             Q(status__in=['at_risk', 'delayed']) |
             Q(spi__lt=0.9) |
             Q(cpi__lt=0.9)
-        ).distinct()
+        )
         
         serializer = ProjectListSerializer(projects, many=True)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'])
+    def trend(self, request, pk=None):
+        project = self.get_object()
+        try:
+            date_from, date_to, bucket = parse_trend_params(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        series = snapshot_trend(project.snapshots.all(), date_from, date_to, bucket)
+        return Response({'project_id': project.id, **series})
+    
     @action(detail=True, methods=['get'])
     def health_report(self, request, pk=None):
         project = self.get_object()
@@ -126,6 +183,30 @@ class ProjectViewSet(viewsets.ModelViewSet):
         return Response(report)
 
 
+class PortfolioTrendView(APIView):
+    """
+    Portfolio-wide SPI, CPI, health and completion trend
+    averaged over all projects per day, week or month
+    """
+    def get(self, request):
+        try:
+            date_from, date_to, bucket = parse_trend_params(request.query_params)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        
+        return Response(snapshot_trend(ProjectSnapshot.objects.all(), date_from, date_to, bucket))
+
+
+class CacheStatsView(APIView):
+    """
+    Hit/miss counters and current data version of the portfolio statistics cache
+    """
+    permission_classes = [IsAdminUser]
+    
+    def get(self, request):
+        return Response(get_cache_stats())
+
+
 class RiskViewSet(viewsets.ModelViewSet):
     queryset = Risk.objects.all()
     serializer_class = RiskSerializer
@@ -16,4 +16,6 @@ echo "=========================================="
 echo ""
 
 cd /home/claude/pmo-ai-assistant
-python manage.py runserver 0.0.0.0:8000
+# ASGI server: the AI views stream from async generators, which runserver (WSGI)
+# buffers whole before sending, so ?stream=1 answers would not stream there
+uvicorn pmo_core.asgi:application --reload --host 0.0.0.0 --port 8000
@@ -363,12 +363,54 @@ function resetFilters() {
 }
 
 // AI Functions
+// Parse a text/event-stream response body, calling onEvent(event, data) for each event
+async function readEventStream(response, onEvent) {
+    const reader = response.body.getReader();
+    const decoder = new TextDecoder();
+    let buffer = '';
+    while (true) {
+        const { done, value } = await reader.read();
+        if (done) break;
+        buffer += decoder.decode(value, { stream: true });
+        let boundary;
+        while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+            const block = buffer.slice(0, boundary);
+            buffer = buffer.slice(boundary + 2);
+            let event = 'message';
+            let data = '';
+            for (const line of block.split('\n')) {
+                if (line.startsWith('event: ')) event = line.slice(7);
+                else if (line.startsWith('data: ')) data += line.slice(6);
+            }
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
+// Request an AI endpoint with ?stream=1, calling onText with the text received so far
+async function streamAI(url, onText, options = {}) {
+    const separator = url.includes('?') ? '&' : '?';
+    const response = await fetch(`${url}${separator}stream=1`, options);
+    if (!response.ok) {
+        const data = await response.json().catch(() => ({}));
+        throw new Error(data.message || data.error || `HTTP ${response.status}`);
+    }
+    let text = '';
+    await readEventStream(response, (event, data) => {
+        if (event === 'delta') {
+            text += data.text;
+            onText(text);
+        } else if (event === 'error') {
+            throw new Error(data.message);
+        }
+    });
+    return text;
+}
+
 async function getPortfolioSummary() {
     showAILoading();
     try {
-        const response = await fetch(`${AI_BASE}/portfolio-summary/`);
-        const data = await response.json();
-        renderAIResponse(data);
+        await streamAI(`${AI_BASE}/portfolio-summary/`, renderAIText);
     } catch (error) {
         showAIError('Error getting portfolio summary');
     }
@@ -377,9 +419,7 @@ async function getPortfolioSummary() {
 async function getExecutiveReport() {
     showAILoading();
     try {
-        const response = await fetch(`${AI_BASE}/executive-report/`);
-        const data = await response.json();
-        renderAIResponse(data);
+        await streamAI(`${AI_BASE}/executive-report/`, renderAIText);
     } catch (error) {
         showAIError('Error getting executive report');
     }
@@ -394,15 +434,13 @@ async function askAI() {
     
     showAILoading();
     try {
-        const response = await fetch(`${AI_BASE}/ask/`, {
+        await streamAI(`${AI_BASE}/ask/`, renderAIText, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json',
             },
             body: JSON.stringify({ question })
         });
-        const data = await response.json();
-        renderAIResponse(data);
     } catch (error) {
         showAIError('Error getting AI response');
     }
@@ -413,14 +451,19 @@ async function getProjectAISummary(projectId) {
     container.innerHTML = '<div class="loading mx-auto"></div>';
     
     try {
-        const response = await fetch(`${AI_BASE}/project-summary/${projectId}/`);
-        const data = await response.json();
-        container.innerHTML = `
-            <div class="bg-purple-50 rounded-lg p-4">
-                <h4 class="font-semibold mb-2">AI Analysis</h4>
-                <pre class="text-sm whitespace-pre-wrap">${JSON.stringify(data, null, 2)}</pre>
-            </div>
-        `;
+        await streamAI(`${AI_BASE}/project-summary/${projectId}/`, (text) => {
+            let output = container.querySelector('pre');
+            if (!output) {
+                container.innerHTML = `
+                    <div class="bg-purple-50 rounded-lg p-4">
+                        <h4 class="font-semibold mb-2">AI Analysis</h4>
+                        <pre class="text-sm whitespace-pre-wrap"></pre>
+                    </div>
+                `;
+                output = container.querySelector('pre');
+            }
+            output.textContent = text;
+        });
     } catch (error) {
         container.innerHTML = '<p class="text-red-600">Error loading AI summary</p>';
     }
@@ -435,13 +478,18 @@ function showAIError(message) {
         `<div class="bg-red-50 border border-red-200 rounded-lg p-4 text-red-800">${message}</div>`;
 }
 
-function renderAIResponse(data) {
-    const html = `
-        <div class="bg-purple-50 rounded-lg p-6">
-            <pre class="whitespace-pre-wrap text-sm">${JSON.stringify(data, null, 2)}</pre>
-        </div>
-    `;
-    document.getElementById('ai-response').innerHTML = html;
+function renderAIText(text) {
+    const container = document.getElementById('ai-response');
+    let output = container.querySelector('pre');
+    if (!output) {
+        container.innerHTML = `
+            <div class="bg-purple-50 rounded-lg p-6">
+                <pre class="whitespace-pre-wrap text-sm"></pre>
+            </div>
+        `;
+        output = container.querySelector('pre');
+    }
+    output.textContent = text;
 }
 
 function showAddProject() {